@@ -0,0 +1,13 @@
+"""
+Benchmarks behind the numbers quoted in the commit messages.
+
+Each script builds a throwaway SQLite database (bench/settings.py; the
+file is $BENCH_DB, by default in the temp directory), seeds it and times
+the old code path against the current one. Run them from mysite/:
+
+    python -m bench.log_writes --events 5000
+
+Sizes default to something that finishes in a minute or two; the
+options of each script give the sizes used in the commit messages.
+Timings depend on the machine, compare the ratios.
+"""
@@ -0,0 +1,117 @@
+"""
+admin_reports: the queries of the old view (count() plus three filtered
+counts, status / hospital / daily GROUP BYs, all over the appointments)
+against the current view, which reads the daily rollup.
+
+    python -m bench.admin_reports --appointments 500000 --doctors 300
+
+The times are those of the queries on the appointment tables. The old
+queries run on the current schema, so they get the later indexes too.
+The totals of both versions are checked to be equal.
+"""
+import time
+
+from bench import common
+
+VERBOSE = False
+
+
+def old_report(filters: dict) -> int:
+    """The aggregate queries of admin_reports before the rollup; returns the total."""
+    from django.db.models import Count, Q
+
+    from booking.models import Appointment
+
+    qs = Appointment.objects.order_by()
+    if filters.get("doctor"):
+        qs = qs.filter(doctor_id=filters["doctor"])
+    if filters.get("hospital"):
+        qs = qs.filter(hospital_id=filters["hospital"])
+    if filters.get("status"):
+        qs = qs.filter(status=filters["status"])
+    if filters.get("start_date"):
+        qs = qs.filter(date__gte=filters["start_date"])
+    if filters.get("end_date"):
+        qs = qs.filter(date__lte=filters["end_date"])
+
+    total = qs.count()
+    for status in ("Pending", "Approved", "Cancelled"):
+        qs.filter(status=status).count()
+    list(qs.values("status").annotate(total=Count("id")))
+    list(qs.values("hospital_id").annotate(total=Count("id")).order_by("-total"))
+    list(
+        qs.filter(date__isnull=False)
+        .values("date")
+        .annotate(
+            total=Count("id"),
+            pending=Count("id", filter=Q(status="Pending")),
+            approved=Count("id", filter=Q(status="Approved")),
+            cancelled=Count("id", filter=Q(status="Cancelled")),
+        )
+        .order_by("-date")[:30]
+    )
+    return total
+
+
+def sql_work(fn):
+    """(queries on the appointment tables, their total ms, fn's result)."""
+    from django.db import connection
+
+    timings = []
+
+    def timer(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if '"booking_appointment' in sql:
+                timings.append((time.perf_counter() - start) * 1000)
+                if VERBOSE:
+                    print(f"    {timings[-1]:8.2f} ms  {sql[:140]}")
+
+    with connection.execute_wrapper(timer):
+        result = fn()
+    return len(timings), sum(timings), result
+
+
+def main():
+    parser = common.parser(__doc__)
+    parser.add_argument("--appointments", type=int, default=100000)
+    parser.add_argument("--doctors", type=int, default=300)
+    args = parser.parse_args()
+    common.setup(args)
+
+    from django.utils import timezone
+
+    from booking.models import DoctorProfile, Hospital
+
+    if not args.keep:
+        common.seed_appointments(args.appointments, common.seed_doctors(args.doctors))
+
+    client = common.staff_client()
+    year = str(timezone.localdate().year)
+    hospital = Hospital.objects.order_by("id").first()
+    doctor = DoctorProfile.objects.order_by("id").first()
+    cases = [
+        ("no filter", {}),
+        ("year range", {"start_date": f"{year}-01-01", "end_date": f"{year}-12-31"}),
+        ("status=Pending", {"status": "Pending"}),
+        ("status=Completed", {"status": "Completed"}),
+        ("hospital + year", {"hospital": hospital.id, "start_date": f"{year}-01-01"}),
+        ("one doctor", {"doctor": doctor.id}),
+    ]
+
+    print(f"{'':18} {'old':>20}    {'current':>20}")
+    for label, filters in cases:
+        def new_report():
+            return client.get("/dabs-admin/reports/", filters).context["total_appointments"]
+
+        old = min((sql_work(lambda: old_report(filters)) for _ in range(args.repeat)), key=lambda r: r[1])
+        new = min((sql_work(new_report) for _ in range(args.repeat)), key=lambda r: r[1])
+        if old[2] != new[2]:
+            raise SystemExit(f"{label}: totals differ, {old[2]} != {new[2]}")
+        print(f"{label:18} {old[0]} queries {old[1]:7.1f} ms -> {new[0]} queries {new[1]:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
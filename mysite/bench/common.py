@@ -0,0 +1,177 @@
+"""Shared setup and timing helpers of the benchmarks."""
+import argparse
+import os
+import resource
+import time
+from typing import Callable, Tuple
+
+import django
+
+
+def parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--db", help="SQLite file to use (default: $BENCH_DB or the temp directory).")
+    parser.add_argument("--keep", action="store_true", help="Reuse the database of an earlier run as it is.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best one counts.")
+    return parser
+
+
+def setup(args) -> None:
+    """Point Django at the benchmark database; start it empty unless --keep."""
+    if args.db:
+        os.environ["BENCH_DB"] = args.db
+    os.environ["DJANGO_SETTINGS_MODULE"] = "bench.settings"
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    path = settings.DATABASES["default"]["NAME"]
+    if not args.keep and os.path.exists(path):
+        os.remove(path)
+    call_command("migrate", verbosity=0)
+
+
+def timed(fn: Callable, repeat: int = 5) -> Tuple[float, object]:
+    """(best wall time of repeat calls in ms, result of the last call)."""
+    best = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+FIRST_NAMES = ["Priya", "Rahul", "Anita", "Vikram", "Sneha", "Arjun", "Kavya", "Rohan", "Meera", "Karan"]
+LAST_NAMES = ["Sharma", "Iyer", "Patel", "Reddy", "Nair", "Gupta", "Menon", "Rao", "Das", "Khan"]
+SPECIALIZATIONS = ["Cardiology", "Neurology", "Orthopedics", "Pediatrics", "Dermatology", "Oncology"]
+HOSPITALS = [("Apollo Hospital", "Chennai"), ("City Hospital", "Pune"), ("Fortis", "Mumbai"), ("AIIMS", "Delhi")]
+
+
+def seed_doctors(n: int, seed: int = 1, batch_size: int = 5000) -> list:
+    """n Active doctors (9:00-17:00, every day) spread over HOSPITALS; returns their ids."""
+    import random
+    from datetime import time as clock
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from booking.models import Department, DoctorProfile, Hospital
+
+    rng = random.Random(seed)
+    hospitals = [(Hospital.for_name(name), city) for name, city in HOSPITALS]
+    departments = {
+        (hospital.id, spec): Department.for_name(hospital, spec)
+        for hospital, _ in hospitals
+        for spec in SPECIALIZATIONS
+    }
+    start = User.objects.count()
+    ids = []
+    for first in range(0, n, batch_size):
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=f"doc{start + i}@bench.example",
+                    email=f"doc{start + i}@bench.example",
+                    password="!",
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                )
+                for i in range(first, min(first + batch_size, n))
+            ])
+            doctors = []
+            for user in users:
+                hospital, city = rng.choice(hospitals)
+                spec = rng.choice(SPECIALIZATIONS)
+                doctors.append(DoctorProfile(
+                    user=user,
+                    registration_no=f"R-{user.id}",
+                    specialization=spec,
+                    hospital=hospital,
+                    department=departments[(hospital.id, spec)],
+                    city=city,
+                    status="Active",
+                    working_days="Mon,Tue,Wed,Thu,Fri,Sat,Sun",
+                    clinic_start_time=clock(9, 0),
+                    clinic_end_time=clock(17, 0),
+                    slot_minutes=15,
+                ))
+            ids += [d.id for d in DoctorProfile.objects.bulk_create(doctors)]
+    return ids
+
+
+# weights of the seeded appointment statuses
+STATUS_WEIGHTS = {"Completed": 55, "Cancelled": 15, "Pending": 12, "Approved": 12, "Rescheduled": 3, "Rejected": 3}
+
+
+def seed_appointments(n: int, doctor_ids: list, per_day: int = 16, seed: int = 1,
+                      batch_size: int = 5000) -> None:
+    """
+    n appointments spread evenly over the doctors, per_day (at most 32) per
+    doctor and day, on the days up to today; one patient per 10
+    appointments. The daily counts are rebuilt afterwards. Slots never
+    repeat for a doctor, so uniq_active_doctor_slot holds. search_text is
+    left empty.
+    """
+    import random
+    from datetime import datetime, timedelta
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.utils import timezone
+
+    from booking import stats
+    from booking.models import Appointment, DoctorProfile
+
+    rng = random.Random(seed)
+    if not 1 <= per_day <= 32:
+        raise ValueError("per_day must be 1..32 (9:00-17:00 in 15 minute slots).")
+    places = dict(DoctorProfile.objects.filter(id__in=doctor_ids).values_list("id", "hospital_id"))
+    departments = dict(DoctorProfile.objects.filter(id__in=doctor_ids).values_list("id", "department_id"))
+
+    patients = User.objects.bulk_create(
+        [User(username=f"pat{i}@bench.example", email=f"pat{i}@bench.example", password="!")
+         for i in range(max(n // 10, 1))],
+        batch_size=batch_size,
+    )
+    patient_ids = [p.id for p in patients]
+    statuses, weights = zip(*STATUS_WEIGHTS.items())
+    today = timezone.localdate()
+    day_start = datetime(2000, 1, 1, 9, 0)
+
+    for first in range(0, n, batch_size):
+        rows = []
+        for i in range(first, min(first + batch_size, n)):
+            doctor_id = doctor_ids[i % len(doctor_ids)]
+            k = i // len(doctor_ids)
+            rows.append(Appointment(
+                patient_id=rng.choice(patient_ids),
+                doctor_id=doctor_id,
+                hospital_id=places[doctor_id],
+                department_id=departments[doctor_id],
+                date=today - timedelta(days=k // per_day),
+                time=(day_start + timedelta(minutes=15 * (k % per_day))).time(),
+                status=rng.choices(statuses, weights)[0],
+            ))
+        with transaction.atomic():
+            Appointment.objects.bulk_create(rows)
+    stats.rebuild()
+
+
+def staff_client():
+    """A test Client logged in as a staff user."""
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()  # lets the client's "testserver" host in
+    admin, _ = User.objects.get_or_create(username="bench-admin", defaults={"is_staff": True})
+    client = Client()
+    client.force_login(admin)
+    return client
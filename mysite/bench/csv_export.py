@@ -0,0 +1,112 @@
+"""
+admin_appointments_export: the old view (every Appointment loaded with its
+related objects, the whole CSV built in one HttpResponse) against the
+current streamed export. Each version runs in its own process so the peak
+RSS is its own.
+
+    python -m bench.csv_export --appointments 1000000
+
+The SHA-1 of both CSV outputs is printed; they should be the same.
+"""
+import hashlib
+import subprocess
+import sys
+import time
+
+from bench import common
+
+
+def old_export(request):
+    """The old admin_appointments_export, minus the staff check."""
+    import csv
+
+    from django.http import HttpResponse
+
+    from booking import exports
+
+    appts, _ = exports.filter_appointments(request.GET)
+    response = HttpResponse(content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="dabs_appointments.csv"'
+    writer = csv.writer(response)
+    writer.writerow(exports.APPOINTMENT_CSV_HEADER)
+    for a in appts:
+        patient_user = a.patient
+        if patient_user:
+            patient_name = patient_user.get_full_name() or patient_user.username
+            patient_email = patient_user.email
+        else:
+            patient_name = ""
+            patient_email = ""
+        doctor_user = a.doctor.user if a.doctor and a.doctor.user else None
+        doctor_name = f"Dr. {doctor_user.get_full_name() or doctor_user.username}" if doctor_user else ""
+        writer.writerow([
+            a.id,
+            f"A-10{a.id}",
+            patient_name,
+            patient_email,
+            doctor_name,
+            a.doctor.specialization if a.doctor else "",
+            a.hospital.name,
+            a.date.isoformat() if a.date else "",
+            a.time.strftime("%H:%M") if a.time else "",
+            a.status,
+        ])
+    return response
+
+
+def run(mode: str) -> None:
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+
+    from booking import views
+
+    request = RequestFactory().get("/dabs-admin/appointments/export/csv/")
+    request.user, _ = User.objects.get_or_create(username="bench-admin", defaults={"is_staff": True})
+
+    digest = hashlib.sha1()
+    size = lines = 0
+    start = time.perf_counter()
+    if mode == "old":
+        blocks = [old_export(request).content]
+    else:
+        blocks = views.admin_appointments_export(request).streaming_content
+    for block in blocks:
+        digest.update(block)
+        size += len(block)
+        lines += block.count(b"\n")
+    seconds = time.perf_counter() - start
+
+    rows = lines - 1  # header
+    print(
+        f"{mode:4} {rows} rows in {seconds:.1f} s: {rows / seconds:,.0f} rows/s, "
+        f"peak RSS {common.peak_rss_mib():.0f} MiB, {size / 2**20:.1f} MiB of CSV, "
+        f"sha1 {digest.hexdigest()[:12]}"
+    )
+
+
+def main():
+    parser = common.parser(__doc__)
+    parser.add_argument("--appointments", type=int, default=200000)
+    parser.add_argument("--doctors", type=int, default=300)
+    parser.add_argument("--mode", choices=("old", "new"), help="Run one version against a seeded database.")
+    args = parser.parse_args()
+
+    if args.mode:
+        args.keep = True
+        common.setup(args)
+        run(args.mode)
+        return
+
+    common.setup(args)
+    if not args.keep:
+        common.seed_appointments(args.appointments, common.seed_doctors(args.doctors))
+
+    from django.conf import settings
+
+    db = str(settings.DATABASES["default"]["NAME"])
+    for mode in ("old", "new"):
+        subprocess.run([sys.executable, "-m", "bench.csv_export", "--mode", mode, "--db", db], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+find_doctor's search: the old icontains filter (five columns ORed, every
+match loaded) against the full-text index of booking/search.py (best 200,
+and the 10 autocomplete suggestions).
+
+    python -m bench.doctor_search --doctors 100000
+"""
+from bench import common
+
+QUERIES = ["Sharma", "card", "priya cardio", "apollo chennai", "zzz"]
+
+
+def main():
+    parser = common.parser(__doc__)
+    parser.add_argument("--doctors", type=int, default=20000)
+    args = parser.parse_args()
+    common.setup(args)
+
+    from booking import search
+    from booking.models import DoctorProfile
+
+    if not args.keep:
+        common.seed_doctors(args.doctors)
+    ms, indexed = common.timed(search.rebuild, 1)
+    print(f"{indexed} doctors indexed in {ms / 1000:.1f} s")
+
+    def old(q):
+        doctors = DoctorProfile.objects.filter(status="Active").select_related("user", "hospital")
+        return list(doctors.filter(search.fallback_filter(q)))
+
+    print(f"{'query':16} {'old icontains (all rows)':>26} {'index (200)':>12} {'suggest (10)':>13}")
+    for q in QUERIES:
+        old_ms, rows = common.timed(lambda: old(q), args.repeat)
+        new_ms, _ = common.timed(lambda: search.search_doctors(q), args.repeat)
+        suggest_ms, _ = common.timed(lambda: search.search_doctors(q, limit=10), args.repeat)
+        print(f"{q!r:16} {old_ms:17.1f} ms ({len(rows):>5}) {new_ms:9.1f} ms {suggest_ms:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+log_event(): one INSERT per event (SYSTEM_LOG_BUFFERED = False, the old
+behaviour) against the buffered writer of booking/logsink.py.
+
+    python -m bench.log_writes --events 5000
+
+Times cover the events and the final flush, i.e. every row is written.
+On a file database the synchronous figure is mostly the commit of each
+INSERT, so it varies a lot with the disk.
+"""
+from bench import common
+
+
+def main():
+    parser = common.parser(__doc__)
+    parser.add_argument("--events", type=int, default=5000)
+    args = parser.parse_args()
+    common.setup(args)
+
+    from django.test import override_settings
+
+    from booking import logsink
+    from booking.models import SystemLog
+    from booking.utils import log_event
+
+    def log_many():
+        for n in range(args.events):
+            log_event("login", f"User logged in: bench{n}")
+        logsink.flush()
+
+    print(f"{args.events} log_event calls, best of {args.repeat}:")
+    for label, buffered in (("synchronous", False), ("buffered", True)):
+        before = logsink.stats()
+        with override_settings(SYSTEM_LOG_BUFFERED=buffered):
+            ms, _ = common.timed(log_many, args.repeat)
+        after = logsink.stats()
+        print(
+            f"  {label:12} {ms * 1000 / args.events:7.1f} us/event "
+            f"({after['written'] - before['written']} rows, {after['flushes'] - before['flushes']} flushes)"
+        )
+    print(f"{SystemLog.objects.count()} rows in the table")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Project settings on a throwaway SQLite file, for the benchmarks."""
+import os
+import tempfile
+
+from mysite.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("BENCH_DB") or os.path.join(tempfile.gettempdir(), "dabs_bench.sqlite3"),
+    }
+}
+
+# seeded users get no real password; keep any hashing cheap
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
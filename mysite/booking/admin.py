@@ -1,18 +1,32 @@
 from django.contrib import admin
-from .models import DoctorProfile, Appointment, Notification, SecurityLog
+from .models import AppointmentDailyStats, Department, DoctorProfile, Appointment, ExportJob, Hospital, Notification, OutboxEmail, SecurityLog, SystemLogRollup, Waitlist
 
 @admin.register(DoctorProfile)
 class DoctorProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "specialization", "hospital", "city", "status", "experience_years")
-    list_filter = ("status", "city", "specialization")
+    list_filter = ("status", "city", "hospital", "specialization")
+    list_select_related = ("user", "hospital")
     search_fields = ("user__first_name", "user__last_name", "registration_no",
-                     "specialization", "hospital", "city")
+                     "specialization", "hospital__name", "city")
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ("patient", "doctor", "department", "hospital", "date", "time", "status")
-    list_filter = ("status", "hospital", "department", "date")
-    search_fields = ("patient__username", "doctor__user__username", "department", "hospital")
+    list_filter = ("status", "hospital", "date")
+    list_select_related = ("patient", "doctor__user", "hospital", "department")
+    search_fields = ("patient__username", "doctor__user__username", "department__name", "hospital__name")
+
+@admin.register(Hospital)
+class HospitalAdmin(admin.ModelAdmin):
+    list_display = ("name", "slug")
+    search_fields = ("name", "slug")
+
+@admin.register(Department)
+class DepartmentAdmin(admin.ModelAdmin):
+    list_display = ("name", "hospital", "slug")
+    list_filter = ("hospital",)
+    list_select_related = ("hospital",)
+    search_fields = ("name", "hospital__name")
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
@@ -24,3 +38,33 @@ class NotificationAdmin(admin.ModelAdmin):
 class SecurityLogAdmin(admin.ModelAdmin):
     list_display = ("timestamp", "user", "action")
     search_fields = ("user", "action")
+
+@admin.register(Waitlist)
+class WaitlistAdmin(admin.ModelAdmin):
+    list_display = ("patient", "doctor", "date_from", "date_to", "status", "offer_expires_at", "created_at")
+    list_filter = ("status",)
+    search_fields = ("patient__username", "doctor__user__username")
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("to_email", "subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("to_email", "subject")
+
+@admin.register(SystemLogRollup)
+class SystemLogRollupAdmin(admin.ModelAdmin):
+    list_display = ("day", "event_type", "count")
+    list_filter = ("event_type",)
+    date_hierarchy = "day"
+
+@admin.register(AppointmentDailyStats)
+class AppointmentDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ("date", "doctor", "hospital", "status", "count")
+    list_filter = ("status", "hospital")
+    list_select_related = ("doctor__user", "hospital")
+    date_hierarchy = "date"
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "status", "requested_by", "rows_done", "rows_total", "file_size", "created_at", "finished_at")
+    list_filter = ("status",)
@@ -0,0 +1,202 @@
+"""
+Per-doctor, per-day availability cache.
+
+Stores the free-slot bitmaps computed by booking/slots.py so booking pages
+don't rebuild them on every view. Two layers:
+
+- a small in-process dict (very short TTL, saves the cache round trip)
+- Django's cache backend (shared between processes, see settings.CACHES)
+
+Writers always read and write the shared layer, so an update or
+invalidation made in any process (a booking, a schedule edit, import_csv)
+is seen by the other processes once their local copy runs out, i.e.
+after at most LOCAL_TTL seconds. Slots are still claimed against the
+database, so a stale free bit can only cause a "slot was just taken"
+message, never a double booking.
+
+One cache entry per doctor:
+    {"sig": <grid signature>, "days": {date_ordinal: bitmap}}
+
+The entry is updated in place by the appointment signals (a booking clears
+one bit, a cancellation sets it again) and dropped when the doctor's
+schedule changes. Days in the past are evicted whenever an entry is written.
+"""
+import time as _time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+# Seconds an entry lives in Django's cache / in the in-process layer
+CACHE_TTL = getattr(settings, "AVAILABILITY_CACHE_TTL", 60 * 60)
+LOCAL_TTL = getattr(settings, "AVAILABILITY_LOCAL_TTL", 5)
+
+_local: Dict[int, Tuple[float, dict]] = {}
+_stats = {"hits": 0, "misses": 0, "updates": 0, "invalidations": 0}
+
+
+def _key(doctor_id: int) -> str:
+    return f"booking:avail:{doctor_id}"
+
+
+def _load(doctor_id: int, shared: bool = False) -> Optional[dict]:
+    """
+    Read a doctor's entry. shared=True skips the in-process layer; writers
+    use it so they never build on a stale local copy.
+    """
+    return _load_many([doctor_id], shared).get(doctor_id)
+
+
+def _load_many(doctor_ids: Iterable[int], shared: bool = False) -> Dict[int, dict]:
+    """The entries of several doctors, with one cache round trip for all of them."""
+    now = _time.monotonic()
+    entries, wanted = {}, []
+    for doctor_id in doctor_ids:
+        local = _local.get(doctor_id)
+        if not shared and local and local[0] > now:
+            entries[doctor_id] = local[1]
+        else:
+            wanted.append(doctor_id)
+    if not wanted:
+        return entries
+
+    found = cache.get_many([_key(doctor_id) for doctor_id in wanted])
+    for doctor_id in wanted:
+        entry = found.get(_key(doctor_id))
+        if entry is not None:
+            entries[doctor_id] = entry
+            _local[doctor_id] = (now + LOCAL_TTL, entry)
+        else:
+            _local.pop(doctor_id, None)
+    return entries
+
+
+def _store(doctor_id: int, entry: dict) -> None:
+    _store_many({doctor_id: entry})
+
+
+def _store_many(entries: Dict[int, dict]) -> None:
+    # eviction by date: days before today are never asked for again
+    today = timezone.localdate().toordinal()
+    expires = _time.monotonic() + LOCAL_TTL
+    for entry in entries.values():
+        entry["days"] = {d: bits for d, bits in entry["days"].items() if d >= today}
+
+    cache.set_many({_key(doctor_id): entry for doctor_id, entry in entries.items()}, CACHE_TTL)
+    for doctor_id, entry in entries.items():
+        _local[doctor_id] = (expires, entry)
+
+
+def get_days(doctor_id: int, sig, days: Iterable) -> Tuple[Dict, List]:
+    """
+    Look up cached bitmaps for some days of one doctor.
+    Returns ({date: bitmap} for hits, [date, ...] for misses).
+    An entry built for a different grid signature counts as a miss.
+    """
+    return get_days_many({doctor_id: (sig, days)})[doctor_id]
+
+
+def get_days_many(wanted: Dict[int, Tuple]) -> Dict[int, Tuple[Dict, List]]:
+    """get_days for {doctor_id: (sig, days)}, reading all entries at once."""
+    entries = _load_many(wanted)
+    result = {}
+    for doctor_id, (sig, days) in wanted.items():
+        entry = entries.get(doctor_id)
+        if entry is not None and entry["sig"] != sig:
+            entry = None
+
+        found, missing = {}, []
+        for day in days:
+            bits = entry["days"].get(day.toordinal()) if entry else None
+            if bits is None:
+                missing.append(day)
+            else:
+                found[day] = bits
+
+        _stats["hits"] += len(found)
+        _stats["misses"] += len(missing)
+        result[doctor_id] = (found, missing)
+    return result
+
+
+def put_days(doctor_id: int, sig, bitmaps: Dict) -> None:
+    """Store freshly computed {date: bitmap} for one doctor."""
+    put_days_many({doctor_id: (sig, bitmaps)})
+
+
+def put_days_many(fresh: Dict[int, Tuple]) -> None:
+    """put_days for {doctor_id: (sig, bitmaps)}, reading and writing all entries at once."""
+    fresh = {doctor_id: item for doctor_id, item in fresh.items() if item[1]}
+    if not fresh:
+        return
+    stored = _load_many(fresh, shared=True)
+    entries = {}
+    for doctor_id, (sig, bitmaps) in fresh.items():
+        entry = stored.get(doctor_id)
+        if entry is None or entry["sig"] != sig:
+            entry = {"sig": sig, "days": {}}
+        else:
+            entry = {"sig": sig, "days": dict(entry["days"])}
+
+        for day, bits in bitmaps.items():
+            entry["days"][day.toordinal()] = bits
+        entries[doctor_id] = entry
+    _store_many(entries)
+
+
+def get_entry(doctor_id: int) -> Optional[dict]:
+    """Raw cache entry of a doctor (or None); used by the signal updates."""
+    return _load(doctor_id, shared=True)
+
+
+def set_bit(doctor_id: int, day, index: int, free: bool) -> None:
+    """
+    Mark one slot as free / taken, but only if that day is already cached.
+    Days that are not cached will be computed from the DB on next read.
+    """
+    entry = _load(doctor_id, shared=True)
+    if entry is None:
+        return
+    ordinal = day.toordinal()
+    bits = entry["days"].get(ordinal)
+    if bits is None:
+        return
+
+    bits = bits | (1 << index) if free else bits & ~(1 << index)
+    entry = {"sig": entry["sig"], "days": dict(entry["days"])}
+    entry["days"][ordinal] = bits
+    _store(doctor_id, entry)
+    _stats["updates"] += 1
+
+
+def drop_day(doctor_id: int, day) -> None:
+    """Forget one cached day (it will be recomputed on next read)."""
+    entry = _load(doctor_id, shared=True)
+    if entry is None or day.toordinal() not in entry["days"]:
+        return
+    entry = {"sig": entry["sig"], "days": dict(entry["days"])}
+    del entry["days"][day.toordinal()]
+    _store(doctor_id, entry)
+    _stats["invalidations"] += 1
+
+
+def invalidate_doctor(doctor_id: int) -> None:
+    """Forget everything cached for a doctor (e.g. schedule was edited)."""
+    cache.delete(_key(doctor_id))
+    _local.pop(doctor_id, None)
+    _stats["invalidations"] += 1
+
+
+def stats() -> dict:
+    """Hit / miss counters of this process (counted per doctor-day)."""
+    data = dict(_stats)
+    total = data["hits"] + data["misses"]
+    data["hit_rate"] = round(data["hits"] / total, 3) if total else 0.0
+    return data
+
+
+def reset_stats() -> None:
+    for k in _stats:
+        _stats[k] = 0
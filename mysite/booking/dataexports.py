@@ -0,0 +1,268 @@
+"""
+Incremental JSONL / Parquet exports of appointments and system logs.
+
+Nightly analytics pulls used to re-download and re-parse the whole CSV
+export. Here each dataset is exported as:
+
+- JSONL: one JSON object per line, streamed
+- Parquet: columnar, typed, one row group per chunk (needs pyarrow;
+  without it only JSONL is offered)
+
+Both read the table in keyset chunks of CHUNK_SIZE rows in watermark
+order (plain tuples, no model instances). Memory stays at one chunk, and no cursor stays
+open between chunks; see booking/exports.py.
+
+Watermarks: every export covers since < watermark <= until. "until" is
+fixed when the export starts and is handed back with it (the
+X-Export-Watermark header, or the --state-file of the export_data
+command). The next pull passes it as "since" and only gets what changed
+in between.
+
+"until" lies WATERMARK_LAG_SECONDS in the past. A write transaction that
+is still open when an export starts commits rows with an earlier
+updated_at (or a lower id) than rows already visible; with the lag they
+land before the next pull's "since" only if the transaction (or a log
+row's wait in the buffer) took longer than the lag.
+
+- appointments: updated_at. Creations and edits are included; deletes
+  and queryset.update() (which does not touch updated_at) are not.
+- systemlog: id. Log rows are buffered and written after the event
+  (booking/logsink.py), so created_at can be older than rows already
+  pulled; ids only grow.
+"""
+import io
+import json
+from datetime import timedelta
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .exports import EXPORT_BLOCK_SIZE
+from .models import Appointment, SystemLog
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: Parquet exports need pyarrow
+    pyarrow = None
+
+
+CHUNK_SIZE = 5000
+
+# longer than the longest write transaction (see the module docstring)
+WATERMARK_LAG_SECONDS = getattr(settings, "EXPORT_WATERMARK_LAG_SECONDS", 300)
+
+
+class Dataset(NamedTuple):
+    model: type
+    columns: Tuple[str, ...]  # attnames, in output order
+    watermark: str  # "updated_at"-like datetime field, or "id"
+
+
+DATASETS: Dict[str, Dataset] = {
+    "appointments": Dataset(
+        Appointment,
+        ("id", "date", "time", "status", "patient_id", "doctor_id", "hospital_id",
+         "department_id", "created_at", "updated_at"),
+        "updated_at",
+    ),
+    "systemlog": Dataset(
+        SystemLog,
+        ("id", "created_at", "event_type", "message", "user_id", "ip_address", "user_agent"),
+        "id",
+    ),
+}
+
+FORMATS = {
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def available_formats() -> List[str]:
+    return [name for name in FORMATS if name != "parquet" or pyarrow is not None]
+
+
+# ---------- WATERMARKS ----------
+
+
+def parse_watermark(dataset: Dataset, raw: str):
+    """
+    The since / until value from its text form (as returned by
+    format_watermark). Raises ValueError for a malformed value.
+    """
+    if dataset.watermark == "id":
+        return int(raw)
+    value = parse_datetime(raw)
+    if value is None:
+        raise ValueError(f"Invalid date/time: {raw}")
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def format_watermark(value) -> str:
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def current_watermark(dataset: Dataset, since=None):
+    """
+    Upper bound for an export starting now: WATERMARK_LAG_SECONDS ago, and
+    never below since (the watermark does not move back).
+    """
+    cutoff = timezone.now() - timedelta(seconds=WATERMARK_LAG_SECONDS)
+    if dataset.watermark == "id":
+        # ids are handed out in insert order: everything below the first
+        # row created after the cutoff (systemlog_created_idx range)
+        first_recent = dataset.model.objects.filter(created_at__gt=cutoff).aggregate(first=Min("id"))["first"]
+        if first_recent is not None:
+            until = first_recent - 1
+        else:
+            until = dataset.model.objects.aggregate(last=Max("id"))["last"] or 0
+    else:
+        until = cutoff
+    return until if since is None else max(until, since)
+
+
+# ---------- READING ----------
+
+
+def chunks(dataset: Dataset, since=None, until=None,
+           chunk_size: int = CHUNK_SIZE) -> Iterator[List[tuple]]:
+    """Rows (tuples of dataset.columns) with since < watermark <= until, chunk by chunk."""
+    ordering = (dataset.watermark, "id") if dataset.watermark != "id" else ("id",)
+    qs = dataset.model.objects.order_by(*ordering)
+    if since is not None:
+        qs = qs.filter(**{f"{dataset.watermark}__gt": since})
+    if until is not None:
+        qs = qs.filter(**{f"{dataset.watermark}__lte": until})
+    qs = qs.values_list(*dataset.columns)
+    mark_index = dataset.columns.index(dataset.watermark)
+    id_index = dataset.columns.index("id")
+
+    last = None
+    while True:
+        if last is None:
+            rows = list(qs[:chunk_size])
+        elif dataset.watermark == "id":
+            rows = list(qs.filter(id__gt=last[id_index])[:chunk_size])
+        else:
+            # the rest of the last watermark value, then the later values:
+            # two index seeks (one OR of both scans every row sharing the
+            # value, e.g. all rows of a bulk import)
+            mark = last[mark_index]
+            rows = list(qs.filter(**{dataset.watermark: mark}, id__gt=last[id_index])[:chunk_size])
+            if len(rows) < chunk_size:
+                rows += qs.filter(**{f"{dataset.watermark}__gt": mark})[:chunk_size - len(rows)]
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+
+# ---------- JSONL ----------
+
+
+def _json_default(value):
+    # dates / times / datetimes in full ISO 8601 (microseconds, offset)
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def jsonl_blocks(dataset: Dataset, row_chunks, block_size: int = EXPORT_BLOCK_SIZE) -> Iterator[bytes]:
+    """One JSON object per row and line, in blocks of about block_size bytes."""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_json_default)
+    names = dataset.columns
+    block = []
+    size = 0
+    for rows in row_chunks:
+        for row in rows:
+            line = encoder.encode(dict(zip(names, row))) + "\n"
+            block.append(line)
+            size += len(line)
+        if size >= block_size:
+            yield "".join(block).encode()
+            block = []
+            size = 0
+    if block:
+        yield "".join(block).encode()
+
+
+# ---------- PARQUET ----------
+
+
+def _arrow_type(field):
+    kind = field.get_internal_type()
+    if kind in ("AutoField", "BigAutoField", "ForeignKey", "IntegerField", "BigIntegerField",
+                "PositiveIntegerField", "PositiveSmallIntegerField", "SmallIntegerField"):
+        return pyarrow.int64()
+    if kind == "DateTimeField":
+        return pyarrow.timestamp("us", tz="UTC")
+    if kind == "DateField":
+        return pyarrow.date32()
+    if kind == "TimeField":
+        return pyarrow.time64("us")
+    return pyarrow.string()
+
+
+def arrow_schema(dataset: Dataset):
+    meta = dataset.model._meta
+    return pyarrow.schema([
+        pyarrow.field(name, _arrow_type(meta.get_field(name)), nullable=meta.get_field(name).null)
+        for name in dataset.columns
+    ])
+
+
+class _Spool(io.RawIOBase):
+    """Write-only file that hands over what was written so far (for streaming)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def parquet_blocks(dataset: Dataset, row_chunks) -> Iterator[bytes]:
+    """A Parquet file, one row group per chunk, yielded as each group is written."""
+    if pyarrow is None:
+        raise RuntimeError("Parquet exports need pyarrow (pip install pyarrow).")
+    schema = arrow_schema(dataset)
+    sink = _Spool()
+    with pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in row_chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            data = sink.take()
+            if data:
+                yield data
+    yield sink.take()
+
+
+def blocks(dataset: Dataset, fmt: str, since=None, until=None,
+           chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Encoded export of dataset in fmt ("jsonl" or "parquet")."""
+    row_chunks = chunks(dataset, since=since, until=until, chunk_size=chunk_size)
+    if fmt == "parquet":
+        return parquet_blocks(dataset, row_chunks)
+    return jsonl_blocks(dataset, row_chunks)
@@ -0,0 +1,155 @@
+"""
+Hospital -> department -> doctor directory.
+
+The booking form walks hospital -> department -> doctor through two small
+JSON endpoints. Instead of a DISTINCT / iexact query per request, the whole
+directory of Active doctors is built with ONE query and kept in memory,
+with the JSON bodies and their ETags precomputed.
+
+Any DoctorProfile, Hospital or Department change (and a doctor's rename)
+stores a new version token in Django's cache (shared by all processes,
+see settings.CACHES). A process checks that token at most every
+VERSION_CHECK_SECONDS and rebuilds its copy when it changed, so a change
+made anywhere (another worker, import_csv, the Django admin) is served
+everywhere within that delay. Repeat requests with a matching
+If-None-Match get a 304 without touching the database in between.
+
+Doctors are grouped by their hospital / department ids; the URLs use the
+Hospital and Department slugs, which map to those ids here
+(department_id() lets other views filter doctors on the integer key).
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DoctorProfile
+
+
+VERSION_KEY = "booking:directory:version"
+# how long a built copy is served before the shared version is read again
+VERSION_CHECK_SECONDS = getattr(settings, "DIRECTORY_VERSION_CHECK_SECONDS", 2)
+
+_lock = threading.Lock()
+_current = None
+_checked_until = 0.0  # time.monotonic() up to which _current is trusted
+
+
+class Directory:
+    """One built copy of the directory, with JSON bodies + ETags per key."""
+
+    def __init__(self, version, hospitals: List[Tuple[str, str]],
+                 departments: Dict[str, Tuple[bytes, str]],
+                 doctors: Dict[Tuple[str, str], Tuple[bytes, str]],
+                 department_ids: Dict[Tuple[str, str], int]):
+        self.version = version
+        self.hospitals = hospitals  # [(slug, name)]
+        self.departments = departments  # hospital slug -> (body, etag)
+        self.doctors = doctors  # (hospital slug, department slug) -> (body, etag)
+        self.department_ids = department_ids  # (hospital slug, department slug) -> Department.id
+
+
+def _entry(payload: dict) -> Tuple[bytes, str]:
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    return body, '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+
+
+_EMPTY_DEPARTMENTS = _entry({"departments": []})
+_EMPTY_DOCTORS = _entry({"doctors": []})
+
+
+def _new_version() -> str:
+    # a fresh token rather than a counter: two concurrent changes can't
+    # end up with the same version
+    return uuid.uuid4().hex
+
+
+def _version() -> str:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate() -> None:
+    """Doctors changed: this process rebuilds now, the others within VERSION_CHECK_SECONDS."""
+    cache.set(VERSION_KEY, _new_version(), None)
+    global _current
+    _current = None
+
+
+def _build(version) -> Directory:
+    rows = (
+        DoctorProfile.objects
+        .filter(status="Active")
+        .order_by("hospital__name", "hospital_id", "department__name", "department_id",
+                  "user__first_name", "user__last_name", "id")
+        .values_list(
+            "id", "hospital_id", "hospital__slug", "hospital__name",
+            "department_id", "department__slug", "department__name",
+            "user__first_name", "user__last_name", "user__username",
+        )
+    )
+
+    hospitals: Dict[int, Tuple[str, str]] = {}
+    tree: Dict[int, Dict[int, dict]] = {}
+    for doc_id, h_id, h_slug, h_name, d_id, d_slug, d_name, first, last, username in rows:
+        hospitals.setdefault(h_id, (h_slug, h_name))
+        dept = tree.setdefault(h_id, {}).setdefault(d_id, {"name": d_name, "slug": d_slug, "doctors": []})
+        name = f"{first} {last}".strip() or username
+        dept["doctors"].append({"id": doc_id, "name": name})
+
+    departments = {}
+    doctors = {}
+    department_ids = {}
+    for h_id, depts in tree.items():
+        h_slug = hospitals[h_id][0]
+        departments[h_slug] = _entry({
+            "departments": [{"name": d["name"], "slug": d["slug"]} for d in depts.values()],
+        })
+        for d_id, d in depts.items():
+            doctors[(h_slug, d["slug"])] = _entry({"doctors": d["doctors"]})
+            department_ids[(h_slug, d["slug"])] = d_id
+
+    return Directory(version, list(hospitals.values()), departments, doctors, department_ids)
+
+
+def get() -> Directory:
+    """The current directory (built on first use / after a change)."""
+    global _current, _checked_until
+    current = _current
+    now = time.monotonic()
+    if current is not None and now < _checked_until:
+        return current
+    version = _version()
+    with _lock:
+        if _current is None or _current.version != version:
+            _current = _build(version)
+        _checked_until = now + VERSION_CHECK_SECONDS
+        return _current
+
+
+def hospitals() -> List[Tuple[str, str]]:
+    """[(hospital slug, hospital name)] with at least one Active doctor."""
+    return get().hospitals
+
+
+def departments(hospital_slug: str) -> Tuple[bytes, str]:
+    """(JSON body, ETag) of a hospital's departments."""
+    return get().departments.get(hospital_slug, _EMPTY_DEPARTMENTS)
+
+
+def doctors(hospital_slug: str, department_slug: str) -> Tuple[bytes, str]:
+    """(JSON body, ETag) of the doctors of one department."""
+    return get().doctors.get((hospital_slug, department_slug), _EMPTY_DOCTORS)
+
+
+def department_id(hospital_slug: str, department_slug: str):
+    """Department.id behind the slugs (None if it has no Active doctor)."""
+    return get().department_ids.get((hospital_slug, department_slug))
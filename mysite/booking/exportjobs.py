@@ -0,0 +1,229 @@
+"""
+Background appointment exports (ExportJob).
+
+An export over years of appointments takes minutes. Instead of holding a
+web worker for that long, the admin page only calls request_export(),
+which inserts an ExportJob row. The run_export_jobs command (one or more
+worker processes) calls work(). That claims Pending jobs, runs the same
+filters and CSV rows as the streamed export (booking/exports.py) and
+writes the result to EXPORT_DIR/appointments-<id>.csv.gz.
+
+- Progress: rows_total is counted first, rows_done is written every
+  PROGRESS_EVERY rows, so the job page can show a percentage.
+- Dedupe: asking again for the same cleaned filters within
+  DEDUPE_SECONDS returns the existing job (unless it failed), so five
+  admins clicking "export" cause one scan.
+- Claiming is a compare-and-set UPDATE that also bumps attempts, so
+  several workers never run the same job and every claim has its own
+  attempt number. The worker renews its lease every LEASE_RENEW_SECONDS;
+  a Running job whose worker died is picked up again once its lease runs
+  out, and marked Failed once MAX_ATTEMPTS claims were used up.
+- A worker writes to a temp file of its own attempt and only updates the
+  job while that attempt still owns it; a worker that lost its lease
+  stops and leaves the job alone.
+- Files (and their jobs) older than KEEP_SECONDS are removed by the
+  worker.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import exports
+from .models import ExportJob
+
+
+EXPORT_DIR = Path(getattr(settings, "EXPORT_DIR", settings.BASE_DIR / "exports"))
+DEDUPE_SECONDS = getattr(settings, "EXPORT_DEDUPE_SECONDS", 600)
+KEEP_SECONDS = getattr(settings, "EXPORT_KEEP_SECONDS", 24 * 3600)
+# lease of a Running job, renewed by its worker well before it runs out
+LEASE_SECONDS = getattr(settings, "EXPORT_LEASE_SECONDS", 300)
+LEASE_RENEW_SECONDS = LEASE_SECONDS / 3
+MAX_ATTEMPTS = 3
+PROGRESS_EVERY = 20000
+
+
+def filters_key(filters: dict) -> str:
+    return hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+
+
+def file_path(job: ExportJob) -> Path:
+    return EXPORT_DIR / job.file_name
+
+
+def request_export(params, user=None) -> Tuple[ExportJob, bool]:
+    """
+    Job exporting the appointments matching the admin list filters in
+    params: a recent job with the same filters, or a new Pending one.
+    Returns (job, created).
+    """
+    _, filters = exports.filter_appointments(params)
+    key = filters_key(filters)
+    since = timezone.now() - timedelta(seconds=DEDUPE_SECONDS)
+    job = (
+        ExportJob.objects
+        .filter(filters_key=key, created_at__gte=since)
+        .exclude(status="Failed")
+        .order_by("-id")
+        .first()
+    )
+    if job is not None:
+        return job, False
+    job = ExportJob.objects.create(filters=filters, filters_key=key, requested_by=user)
+    return job, True
+
+
+# ---------- WORKER ----------
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over (this worker's lease ran out)."""
+
+
+def _expired(now) -> Q:
+    return Q(status="Running", lease_until__lte=now)
+
+
+def _due(now) -> Q:
+    return Q(status="Pending") | (_expired(now) & Q(attempts__lt=MAX_ATTEMPTS))
+
+
+def _owned(job: ExportJob):
+    """The job's row, as long as this claim (attempt) still holds it."""
+    return ExportJob.objects.filter(id=job.id, status="Running", attempts=job.attempts)
+
+
+def _fail_abandoned(now) -> int:
+    """Running jobs whose worker died on their last attempt -> Failed."""
+    return ExportJob.objects.filter(_expired(now), attempts__gte=MAX_ATTEMPTS).update(
+        status="Failed",
+        lease_until=None,
+        last_error="The export worker stopped; no attempts left.",
+        finished_at=now,
+    )
+
+
+def _claim() -> Optional[ExportJob]:
+    """Take the oldest due job for this worker (None if there is none)."""
+    now = timezone.now()
+    _fail_abandoned(now)
+    candidates = list(
+        ExportJob.objects.filter(_due(now)).order_by("id").values_list("id", "attempts")[:10]
+    )
+    for job_id, attempts in candidates:
+        # another worker may have taken it since: only one UPDATE matches
+        claimed = ExportJob.objects.filter(_due(now), id=job_id, attempts=attempts).update(
+            status="Running",
+            attempts=attempts + 1,
+            lease_until=now + timedelta(seconds=LEASE_SECONDS),
+            started_at=now,
+            rows_done=0,
+        )
+        if claimed:
+            return ExportJob.objects.get(id=job_id)
+    return None
+
+
+def _renew(job: ExportJob, **fields) -> None:
+    """Extend the lease (and save fields) or raise LeaseLost."""
+    if not _owned(job).update(lease_until=timezone.now() + timedelta(seconds=LEASE_SECONDS), **fields):
+        raise LeaseLost(f"Export job #{job.id} was taken over by another worker.")
+
+
+def _with_progress(job: ExportJob, rows: Iterable[List]) -> Iterator[List]:
+    """
+    Pass rows through, writing rows_done every PROGRESS_EVERY rows and
+    renewing the lease every LEASE_RENEW_SECONDS.
+    """
+    done = -1  # the header is not a row
+    renew_at = time.monotonic() + LEASE_RENEW_SECONDS
+    for row in rows:
+        yield row
+        done += 1
+        if (done and done % PROGRESS_EVERY == 0) or time.monotonic() >= renew_at:
+            _renew(job, rows_done=max(done, 0))
+            renew_at = time.monotonic() + LEASE_RENEW_SECONDS
+    job.rows_done = max(done, 0)
+
+
+def run_job(job: ExportJob) -> None:
+    """Write the job's CSV to EXPORT_DIR (gzip) and mark it Done or failed."""
+    qs, _ = exports.filter_appointments(job.filters)
+    job.rows_total = qs.count()
+
+    job.file_name = f"appointments-{job.id}.csv.gz"
+    path = file_path(job)
+    # one temp file per attempt: a worker that lost its lease can't
+    # write into the file of the one that took over
+    part = path.with_name(f"{path.name}.{job.attempts}.part")
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        _renew(job, rows_total=job.rows_total)
+        with gzip.open(part, "wt", encoding="utf-8", newline="") as fh:
+            for block in exports.csv_lines(_with_progress(job, exports.appointment_csv_rows(qs))):
+                fh.write(block)
+        _renew(job, rows_done=job.rows_done)
+        os.replace(part, path)
+    except LeaseLost:
+        part.unlink(missing_ok=True)
+        raise
+    except Exception as exc:
+        part.unlink(missing_ok=True)
+        failed = job.attempts >= MAX_ATTEMPTS
+        _owned(job).update(
+            status="Failed" if failed else "Pending",
+            lease_until=None,
+            last_error=str(exc)[:1000],
+            finished_at=timezone.now() if failed else None,
+        )
+        raise
+
+    _owned(job).update(
+        status="Done",
+        rows_done=job.rows_done,
+        file_name=job.file_name,
+        file_size=path.stat().st_size,
+        lease_until=None,
+        last_error="",
+        finished_at=timezone.now(),
+    )
+
+
+def purge_expired() -> int:
+    """Delete jobs (and their files) older than KEEP_SECONDS. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=KEEP_SECONDS)
+    old = ExportJob.objects.filter(created_at__lt=cutoff).exclude(status="Running")
+    removed = 0
+    for job in old.only("id", "file_name"):
+        if job.file_name:
+            file_path(job).unlink(missing_ok=True)
+        job.delete()
+        removed += 1
+    return removed
+
+
+def work(max_jobs: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Run due jobs one after another until none is left (or max_jobs ran).
+    Returns (done, failed) counts.
+    """
+    purge_expired()
+    done = failed = 0
+    while max_jobs is None or done + failed < max_jobs:
+        job = _claim()
+        if job is None:
+            break
+        try:
+            run_job(job)
+            done += 1
+        except Exception:
+            failed += 1
+    return done, failed
@@ -0,0 +1,171 @@
+"""
+Appointment CSV export (the admin appointment list filters + CSV rows).
+
+The export used to load every Appointment (with patient / doctor / user /
+hospital objects) and write the whole file into one HttpResponse, so an
+export over years of appointments held all of it in memory at once.
+
+Here the rows are read as plain tuples with values_list(), one keyset
+chunk of EXPORT_CHUNK_SIZE rows per query (see booking/paging.py), and the
+CSV goes out in blocks of about 64 KB as soon as they are written. Memory
+stays at one chunk of tuples, whatever the number of rows.
+
+Each chunk is a finished query, so no cursor stays open for the length
+of the export. On SQLite an open cursor keeps a read lock that stops
+every other connection from committing; the background export workers
+(booking/exportjobs.py) and the bookings made meanwhile would wait on
+it.
+"""
+import csv
+from typing import Iterable, Iterator, List
+
+from django.utils.dateparse import parse_date
+
+from . import paging, search
+from .models import Appointment
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BLOCK_SIZE = 64 * 1024
+# newest first, like the admin list; ends with id for keyset chunks
+EXPORT_ORDERING = ("-date", "-time", "-id")
+
+APPOINTMENT_CSV_HEADER = [
+    "ID",
+    "Appt Code",
+    "Patient",
+    "Patient Email",
+    "Doctor",
+    "Specialization",
+    "Hospital",
+    "Date",
+    "Time",
+    "Status",
+]
+
+_APPOINTMENT_COLUMNS = (
+    "id",
+    "patient__username", "patient__first_name", "patient__last_name", "patient__email",
+    "doctor__user__username", "doctor__user__first_name", "doctor__user__last_name",
+    "doctor__specialization",
+    "hospital__name",
+    "date", "time", "status",
+)
+
+
+def _parse_date(raw: str):
+    try:
+        return parse_date(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def filter_appointments(params):
+    """
+    Appointments matching the admin list filters (?q=&status=&start_date=&end_date=),
+    newest first. Shared by admin_appointments, its CSV export and the
+    background export jobs (which store the cleaned filter values).
+    Returns (queryset, cleaned filter values).
+    """
+    qs = (
+        Appointment.objects
+        .select_related("patient", "doctor", "doctor__user", "hospital")
+        .order_by("-date", "-time")
+    )
+
+    q = params.get("q", "").strip()
+    status = params.get("status", "").strip()
+    start_date_raw = params.get("start_date", "").strip()
+    end_date_raw = params.get("end_date", "").strip()
+
+    # Text search across patient / doctor / hospital / department,
+    # on the indexed search_text column (no joins)
+    if q:
+        qs = qs.filter(search.appointment_filter(q))
+
+    if status:
+        qs = qs.filter(status=status)
+
+    start_date = _parse_date(start_date_raw)
+    end_date = _parse_date(end_date_raw)
+    # an impossible date (2024-02-30) is dropped like a malformed one
+    start_date_raw = start_date_raw if start_date else ""
+    end_date_raw = end_date_raw if end_date else ""
+
+    if start_date:
+        qs = qs.filter(date__gte=start_date)
+    if end_date:
+        qs = qs.filter(date__lte=end_date)
+
+    filters = {
+        "q": q,
+        "status": status,
+        "start_date": start_date_raw,
+        "end_date": end_date_raw,
+    }
+    return qs, filters
+
+
+def _full_name(username, first, last) -> str:
+    # same as User.get_full_name() or username
+    return f"{first or ''} {last or ''}".strip() or (username or "")
+
+
+def _keyset_chunks(qs, chunk_size: int) -> Iterator[tuple]:
+    """values_list rows of qs in EXPORT_ORDERING, read chunk_size rows per query."""
+    qs = qs.order_by(*EXPORT_ORDERING).values_list(*_APPOINTMENT_COLUMNS)
+    after = None
+    while True:
+        chunk = qs if after is None else qs.filter(paging.after_filter(EXPORT_ORDERING, after))
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+        after = (last[-3], last[-2], last[0])  # date, time, id
+
+
+def appointment_csv_rows(qs, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List]:
+    """CSV rows (header first) of the appointments in qs, without building model instances."""
+    yield APPOINTMENT_CSV_HEADER
+    for (appt_id, p_username, p_first, p_last, p_email,
+         d_username, d_first, d_last, specialization,
+         hospital, day, t, status) in _keyset_chunks(qs, chunk_size):
+        yield [
+            appt_id,
+            f"A-10{appt_id}",  # Appointment code
+            _full_name(p_username, p_first, p_last),
+            p_email or "",
+            f"Dr. {_full_name(d_username, d_first, d_last)}" if d_username else "",
+            specialization or "",
+            hospital,
+            day.isoformat() if day else "",
+            t.strftime("%H:%M") if t else "",
+            status,
+        ]
+
+
+class _Echo:
+    """File-like object whose write() just returns the line csv.writer wrote."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows: Iterable[List], block_size: int = EXPORT_BLOCK_SIZE) -> Iterator[str]:
+    """
+    Encode rows as CSV for StreamingHttpResponse, in blocks of about
+    block_size characters (one write per line would be slow to send).
+    """
+    writer = csv.writer(_Echo())
+    block = []
+    size = 0
+    for row in rows:
+        line = writer.writerow(row)
+        block.append(line)
+        size += len(line)
+        if size >= block_size:
+            yield "".join(block)
+            block = []
+            size = 0
+    if block:
+        yield "".join(block)
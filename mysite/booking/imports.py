@@ -0,0 +1,564 @@
+"""
+Bulk CSV import of doctors and historical appointments.
+
+Onboarding a hospital used to mean one doctor_register form post per
+doctor and its appointment history typed in by hand. Here a CSV file
+(the import_csv command, or the upload on the admin Import page) is:
+
+- read row by row with the csv module (the file is never loaded whole)
+- validated CHUNK_SIZE rows at a time, with one query per chunk for what
+  already exists (accounts, doctors, booked slots)
+- written with bulk_create, one transaction per chunk
+
+Rows with errors are skipped and reported with their line number. Doctors
+whose account already exists are skipped too, so a doctors file can be
+imported again after fixing it. Appointments are not matched against the
+history already stored (only against booked slots): import a file once,
+check it first with a dry run.
+
+bulk_create sends no post_save signals, so nothing is logged per user,
+doctor or appointment, and the per-row signal work (search index, daily
+counts, cached availability) does not run either. The import does that
+work per chunk (search index) or once at the end (daily counts,
+directory, availability) and writes one "bulk_import" log entry. The
+directory version and the availability entries live in the shared cache
+(settings.CACHES), so the web workers pick the import up too; they are
+reset even when a later chunk fails, since earlier chunks are committed.
+
+Passwords: make_password() is slow on purpose (PBKDF2), so the doctors'
+passwords are hashed in a pool of worker processes. Doctors without a
+password in the file, and the patients an appointments file creates, get
+an unusable password (they use password reset).
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.text import slugify
+
+from . import availability, directory, logsink, search, stats
+from .models import Appointment, Department, DoctorProfile, Hospital, appointment_search_text
+from .utils import clean_slug, log_event
+
+
+CHUNK_SIZE = 5000
+# errors kept for the report (all of them are counted)
+MAX_ERRORS = 200
+
+DOCTOR_COLUMNS = ("email", "first_name", "last_name", "registration_no", "specialization", "hospital", "city")
+DOCTOR_OPTIONAL_COLUMNS = ("password", "experience", "slot_pref", "fee", "bio", "status")
+APPOINTMENT_COLUMNS = ("patient_email", "doctor_email", "date", "time")
+APPOINTMENT_OPTIONAL_COLUMNS = ("status", "symptoms", "patient_first_name", "patient_last_name")
+
+# imported history is usually finished
+DEFAULT_APPOINTMENT_STATUS = "Completed"
+
+_DOCTOR_STATUSES = {value.lower(): value for value, _ in DoctorProfile.STATUS_CHOICES}
+_APPOINTMENT_STATUSES = {value.lower(): value for value, _ in Appointment.STATUS_CHOICES}
+_USERNAME_MAX_LENGTH = User._meta.get_field("username").max_length
+_FEE_LIMIT = Decimal("1000000")  # fee is max_digits=8, decimal_places=2
+
+
+class ImportResult:
+    """Counts of one import, and its first MAX_ERRORS errors as (line, message)."""
+
+    def __init__(self, kind: str, dry_run: bool = False):
+        self.kind = kind
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def error(self, line: int, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def summary(self) -> str:
+        created = "to create" if self.dry_run else "created"
+        return (
+            f"{self.rows} {self.kind} rows: {self.created} {created}, "
+            f"{self.skipped} already there, {self.invalid} invalid"
+        )
+
+
+# ---------- READING ----------
+
+
+def _reader(fh, required: Iterable[str]) -> csv.DictReader:
+    """DictReader over fh with lower-cased column names; ValueError if a required one is missing."""
+    reader = csv.DictReader(fh)
+    names = [(name or "").strip().lower() for name in (reader.fieldnames or [])]
+    missing = [name for name in required if name not in names]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+    reader.fieldnames = names
+    return reader
+
+
+def _chunks(reader: csv.DictReader, chunk_size: int) -> Iterator[List[Tuple[int, dict]]]:
+    """(line number, row) pairs, chunk_size at a time."""
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _value(row: dict, name: str) -> str:
+    # short rows have None for the missing columns
+    return (row.get(name) or "").strip()
+
+
+# ---------- HOSPITALS / DEPARTMENTS ----------
+
+
+class _Places:
+    """
+    Hospital and Department rows by name, the same ones Hospital.for_name
+    and Department.for_name would pick, but looked up and created in bulk
+    (one query per chunk). Kept for the whole import.
+    """
+
+    def __init__(self):
+        self._hospitals: Dict[str, Hospital] = {}  # clean_slug(name) -> hospital
+        self._departments: Dict[Tuple[int, str], Department] = {}  # (hospital id, slugify(name))
+
+    def hospitals(self, names: Iterable[str]) -> Dict[str, Hospital]:
+        """name -> Hospital, created if missing."""
+        slugs = {name: clean_slug(name) for name in names}
+        new = {}
+        for name, slug in slugs.items():
+            if slug not in self._hospitals:
+                new.setdefault(slug, name)
+        if new:
+            self._load_hospitals(new)
+            missing = [Hospital(slug=slug, name=name) for slug, name in new.items() if slug not in self._hospitals]
+            if missing:
+                # ignore_conflicts: another import / registration may create it meanwhile
+                Hospital.objects.bulk_create(missing, ignore_conflicts=True)
+                self._load_hospitals(new)
+        return {name: self._hospitals[slug] for name, slug in slugs.items()}
+
+    def _load_hospitals(self, slugs: Iterable[str]) -> None:
+        for hospital in Hospital.objects.filter(slug__in=list(slugs)):
+            self._hospitals[hospital.slug] = hospital
+
+    def departments(self, pairs: Iterable[Tuple[Hospital, str]]) -> Dict[Tuple[int, str], Department]:
+        """(hospital id, name) -> Department, created if missing."""
+        keys = {(hospital.id, name): (hospital.id, slugify(name)) for hospital, name in pairs}
+        new = {}
+        for (hospital_id, name), key in keys.items():
+            if key not in self._departments:
+                new.setdefault(key, name)
+        if new:
+            self._load_departments(new)
+            missing = [
+                Department(hospital_id=hospital_id, slug=slug, name=name)
+                for (hospital_id, slug), name in new.items()
+                if (hospital_id, slug) not in self._departments
+            ]
+            if missing:
+                Department.objects.bulk_create(missing, ignore_conflicts=True)
+                self._load_departments(new)
+        return {pair: self._departments[key] for pair, key in keys.items()}
+
+    def _load_departments(self, keys: Iterable[Tuple[int, str]]) -> None:
+        keys = set(keys)
+        departments = Department.objects.filter(
+            hospital_id__in={hospital_id for hospital_id, _ in keys},
+            slug__in={slug for _, slug in keys},
+        )
+        for department in departments:
+            self._departments[(department.hospital_id, department.slug)] = department
+
+
+# ---------- PASSWORDS ----------
+
+
+class _Hasher:
+    """make_password() for many passwords at once, on a pool of worker processes."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def hash(self, passwords: List[str]) -> List[str]:
+        """Hashes in the order of passwords; blank ones get an unusable password."""
+        given = [password for password in passwords if password]
+        hashed = iter(self._map(given))
+        return [next(hashed) if password else make_password(None) for password in passwords]
+
+    def _map(self, passwords: List[str]) -> List[str]:
+        if self.workers < 2 or len(passwords) < 2:
+            return [make_password(password) for password in passwords]
+        if self._pool is None:
+            # the workers set Django up themselves (needed with the "spawn" start method)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup)
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._pool.map(make_password, passwords, chunksize=chunksize))
+
+
+# ---------- DOCTORS ----------
+
+
+def _clean_doctors(chunk, result: ImportResult, seen: Set[str]) -> List[dict]:
+    """The valid rows of chunk as field values; errors and skips are counted in result."""
+    emails = {_value(row, "email").lower() for _, row in chunk}
+    existing = set(User.objects.filter(username__in=emails).values_list("username", flat=True))
+
+    rows = []
+    for line, row in chunk:
+        email = _value(row, "email").lower()
+        if email in seen:
+            result.error(line, f"{email} appears more than once in the file.")
+            continue
+        if email in existing:
+            result.skipped += 1
+            continue
+        missing = [name for name in DOCTOR_COLUMNS if not _value(row, name)]
+        if missing:
+            result.error(line, f"Missing {', '.join(missing)}.")
+            continue
+        if len(email) > _USERNAME_MAX_LENGTH:
+            result.error(line, f"Email longer than {_USERNAME_MAX_LENGTH} characters.")
+            continue
+
+        experience = _value(row, "experience") or "0"
+        if not experience.isdigit():
+            result.error(line, f"Experience must be a whole number of years, not {experience!r}.")
+            continue
+
+        fee = None
+        fee_raw = _value(row, "fee")
+        if fee_raw:
+            try:
+                fee = Decimal(fee_raw).quantize(Decimal("0.01"))
+            except InvalidOperation:
+                fee = None
+            if fee is None or not 0 <= fee < _FEE_LIMIT:
+                result.error(line, f"Invalid fee {fee_raw!r}.")
+                continue
+
+        status_raw = _value(row, "status")
+        status = _DOCTOR_STATUSES.get(status_raw.lower()) if status_raw else "Pending"
+        if status is None:
+            result.error(line, f"Unknown doctor status {status_raw!r}.")
+            continue
+
+        seen.add(email)
+        rows.append({
+            "email": email,
+            "password": row.get("password") or "",
+            "first_name": _value(row, "first_name"),
+            "last_name": _value(row, "last_name"),
+            "registration_no": _value(row, "registration_no"),
+            "specialization": _value(row, "specialization"),
+            "experience_years": int(experience),
+            "hospital": _value(row, "hospital"),
+            "city": _value(row, "city"),
+            "slot_preference": _value(row, "slot_pref"),
+            "fee": fee,
+            "bio": _value(row, "bio"),
+            "status": status,
+        })
+    return rows
+
+
+def _create_doctors(rows: List[dict], places: _Places, hasher: _Hasher) -> None:
+    """Users + DoctorProfiles (and missing hospitals / departments) for the cleaned rows."""
+    passwords = hasher.hash([row["password"] for row in rows])
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username=row["email"],
+                email=row["email"],
+                password=password,
+                first_name=row["first_name"],
+                last_name=row["last_name"],
+            )
+            for row, password in zip(rows, passwords)
+        ])
+        # in file order: the first spelling of a new hospital / department names it
+        hospitals = places.hospitals([row["hospital"] for row in rows])
+        departments = places.departments(
+            [(hospitals[row["hospital"]], row["specialization"]) for row in rows]
+        )
+        doctors = []
+        for row, user in zip(rows, users):
+            hospital = hospitals[row["hospital"]]
+            doctors.append(DoctorProfile(
+                user=user,
+                registration_no=row["registration_no"],
+                specialization=row["specialization"],
+                experience_years=row["experience_years"],
+                hospital=hospital,
+                # what DoctorProfile.save() would look up (bulk_create skips save)
+                department=departments[(hospital.id, row["specialization"])],
+                city=row["city"],
+                slot_preference=row["slot_preference"],
+                fee=row["fee"],
+                bio=row["bio"],
+                status=row["status"],
+            ))
+        DoctorProfile.objects.bulk_create(doctors)
+        search.index_doctors(doctors)
+
+
+def import_doctors(fh, user: Optional[User] = None, dry_run: bool = False,
+                   chunk_size: int = CHUNK_SIZE, workers: Optional[int] = None) -> ImportResult:
+    """
+    Create doctor accounts from the CSV text stream fh (columns
+    DOCTOR_COLUMNS, optionally DOCTOR_OPTIONAL_COLUMNS; the fields of
+    doctor_register). Status defaults to Pending, as for a registration.
+    dry_run only validates. Raises ValueError for a missing column.
+    """
+    reader = _reader(fh, DOCTOR_COLUMNS)
+    result = ImportResult("doctors", dry_run)
+    places = _Places()
+    seen: Set[str] = set()
+    try:
+        with _Hasher(workers) as hasher:
+            for chunk in _chunks(reader, chunk_size):
+                result.rows += len(chunk)
+                rows = _clean_doctors(chunk, result, seen)
+                if rows and not dry_run:
+                    _create_doctors(rows, places, hasher)
+                result.created += len(rows)
+    finally:
+        if result.created and not dry_run:
+            directory.invalidate()
+    _finish(result, user)
+    return result
+
+
+# ---------- APPOINTMENTS ----------
+
+
+class _People:
+    """Patient users and doctor profiles by email, loaded per chunk and kept for the whole import."""
+
+    def __init__(self):
+        self.patients: Dict[str, User] = {}
+        self.doctors: Dict[str, DoctorProfile] = {}
+        self._missing_doctors: Set[str] = set()
+
+    def load(self, patient_emails: Set[str], doctor_emails: Set[str]) -> None:
+        wanted = patient_emails - self.patients.keys()
+        if wanted:
+            users = User.objects.filter(username__in=wanted).only(
+                "id", "username", "first_name", "last_name", "email"
+            )
+            for patient in users:
+                self.patients[patient.username] = patient
+
+        wanted = doctor_emails - self.doctors.keys() - self._missing_doctors
+        if wanted:
+            doctors = (
+                DoctorProfile.objects
+                .filter(user__username__in=wanted)
+                .select_related("user", "hospital", "department")
+                .order_by("-id")  # the first profile of a user wins
+            )
+            for doctor in doctors:
+                self.doctors[doctor.user.username] = doctor
+            self._missing_doctors |= wanted - self.doctors.keys()
+
+
+def _booked_slots(rows: List[dict]) -> Set[Tuple[int, object, object]]:
+    """(doctor id, date, time) of the active appointments stored for the doctors / days of rows."""
+    if not rows:
+        return set()
+    days = [row["date"] for row in rows]
+    return set(
+        Appointment.objects
+        .filter(
+            status__in=Appointment.ACTIVE_STATUSES,
+            doctor_id__in={row["doctor"].id for row in rows},
+            date__gte=min(days),
+            date__lte=max(days),
+        )
+        .values_list("doctor_id", "date", "time")
+    )
+
+
+def _clean_appointments(chunk, result: ImportResult, people: _People,
+                        booked: Set[Tuple[int, object, object]]) -> List[dict]:
+    """The valid rows of chunk as field values; errors are counted in result."""
+    people.load(
+        {_value(row, "patient_email").lower() for _, row in chunk},
+        {_value(row, "doctor_email").lower() for _, row in chunk},
+    )
+
+    rows = []
+    for line, row in chunk:
+        missing = [name for name in APPOINTMENT_COLUMNS if not _value(row, name)]
+        if missing:
+            result.error(line, f"Missing {', '.join(missing)}.")
+            continue
+
+        patient_email = _value(row, "patient_email").lower()
+        if len(patient_email) > _USERNAME_MAX_LENGTH:
+            result.error(line, f"Patient email longer than {_USERNAME_MAX_LENGTH} characters.")
+            continue
+        doctor_email = _value(row, "doctor_email").lower()
+        doctor = people.doctors.get(doctor_email)
+        if doctor is None:
+            result.error(line, f"No doctor with email {doctor_email}.")
+            continue
+
+        try:
+            day = parse_date(_value(row, "date"))
+            t = parse_time(_value(row, "time"))
+        except ValueError:
+            day = t = None
+        if day is None or t is None:
+            result.error(line, "Date must be YYYY-MM-DD and time HH:MM.")
+            continue
+
+        status_raw = _value(row, "status")
+        status = _APPOINTMENT_STATUSES.get(status_raw.lower()) if status_raw else DEFAULT_APPOINTMENT_STATUS
+        if status is None:
+            result.error(line, f"Unknown appointment status {status_raw!r}.")
+            continue
+
+        rows.append({
+            "line": line,
+            "patient_email": patient_email,
+            "patient_first_name": _value(row, "patient_first_name"),
+            "patient_last_name": _value(row, "patient_last_name"),
+            "doctor": doctor,
+            "date": day,
+            "time": t,
+            "status": status,
+            "symptoms": _value(row, "symptoms"),
+        })
+
+    # only one active appointment per doctor slot (uniq_active_doctor_slot)
+    booked |= _booked_slots([row for row in rows if row["status"] in Appointment.ACTIVE_STATUSES])
+    valid = []
+    for row in rows:
+        if row["status"] in Appointment.ACTIVE_STATUSES:
+            slot = (row["doctor"].id, row["date"], row["time"])
+            if slot in booked:
+                result.error(row["line"], f"{row['doctor']} already has an active appointment on "
+                                          f"{row['date']} at {row['time']:%H:%M}.")
+                continue
+            booked.add(slot)
+        valid.append(row)
+    return valid
+
+
+def _create_appointments(rows: List[dict], people: _People) -> None:
+    """Appointments (and the patients not known yet) for the cleaned rows."""
+    with transaction.atomic():
+        new_patients = {}
+        for row in rows:
+            email = row["patient_email"]
+            if email not in people.patients and email not in new_patients:
+                new_patients[email] = User(
+                    username=email,
+                    email=email,
+                    password=make_password(None),
+                    first_name=row["patient_first_name"],
+                    last_name=row["patient_last_name"],
+                )
+        for patient in User.objects.bulk_create(new_patients.values()):
+            people.patients[patient.username] = patient
+
+        appointments = []
+        for row in rows:
+            patient = people.patients[row["patient_email"]]
+            doctor = row["doctor"]
+            appointments.append(Appointment(
+                patient_id=patient.id,
+                doctor_id=doctor.id,
+                # what Appointment.save() would fill in (bulk_create skips save)
+                hospital_id=doctor.hospital_id,
+                department_id=doctor.department_id,
+                search_text=appointment_search_text(
+                    patient, doctor, doctor.hospital.name, doctor.department.name
+                ),
+                date=row["date"],
+                time=row["time"],
+                status=row["status"],
+                symptoms=row["symptoms"],
+            ))
+        Appointment.objects.bulk_create(appointments)
+        search.index_appointments([(a.id, a.search_text) for a in appointments], replace=False)
+
+
+def import_appointments(fh, user: Optional[User] = None, dry_run: bool = False,
+                        chunk_size: int = CHUNK_SIZE) -> ImportResult:
+    """
+    Create appointments from the CSV text stream fh (columns
+    APPOINTMENT_COLUMNS, optionally APPOINTMENT_OPTIONAL_COLUMNS). Doctors
+    must exist; patients are created (unusable password) when their email
+    has no account yet. Status defaults to DEFAULT_APPOINTMENT_STATUS.
+    dry_run only validates. Raises ValueError for a missing column.
+    """
+    reader = _reader(fh, APPOINTMENT_COLUMNS)
+    result = ImportResult("appointments", dry_run)
+    people = _People()
+    booked: Set[Tuple[int, object, object]] = set()
+    doctor_ids: Set[int] = set()
+    first_day = last_day = None
+    try:
+        for chunk in _chunks(reader, chunk_size):
+            result.rows += len(chunk)
+            rows = _clean_appointments(chunk, result, people, booked)
+            if rows and not dry_run:
+                _create_appointments(rows, people)
+                days = [row["date"] for row in rows]
+                first_day = min(days) if first_day is None else min(first_day, *days)
+                last_day = max(days) if last_day is None else max(last_day, *days)
+                doctor_ids.update(row["doctor"].id for row in rows)
+            result.created += len(rows)
+    finally:
+        if doctor_ids:
+            stats.rebuild(date_from=first_day, date_to=last_day)
+            for doctor_id in doctor_ids:
+                availability.invalidate_doctor(doctor_id)
+    result.errors.sort()  # slot clashes are found after the other checks of their chunk
+    _finish(result, user)
+    return result
+
+
+KINDS = ("doctors", "appointments")
+
+
+def run(kind: str, fh, user: Optional[User] = None, dry_run: bool = False,
+        chunk_size: int = CHUNK_SIZE, workers: Optional[int] = None) -> ImportResult:
+    """import_doctors / import_appointments by name (one of KINDS)."""
+    if kind == "doctors":
+        return import_doctors(fh, user=user, dry_run=dry_run, chunk_size=chunk_size, workers=workers)
+    if kind == "appointments":
+        return import_appointments(fh, user=user, dry_run=dry_run, chunk_size=chunk_size)
+    raise ValueError(f"Unknown import: {kind}")
+
+
+def _finish(result: ImportResult, user: Optional[User]) -> None:
+    """The one log entry of an import (none for a dry run)."""
+    if result.dry_run:
+        return
+    log_event(event_type="bulk_import", message=f"Bulk import of {result.summary()}.", user=user)
+    logsink.flush()
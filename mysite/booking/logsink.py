@@ -0,0 +1,175 @@
+"""
+Buffered writer for SystemLog rows.
+
+log_event() hands its rows to this sink instead of INSERTing them on the
+spot. Rows are collected in memory and written with one bulk_create when:
+
+- the buffer reaches FLUSH_SIZE rows (the background thread is woken up
+  to write them), or
+- the oldest buffered row is FLUSH_SECONDS old (checked at the end of each
+  request and by that thread), or
+- the process exits.
+
+A flush never runs inside the caller's transaction (it waits for the
+commit), so rows of other requests can't be rolled back with it. Rows
+pointing at a user who was deleted meanwhile get user=None, as
+on_delete=SET_NULL would have done; if the batch still fails, the rows
+are written one by one so one bad row doesn't cost the others.
+
+The buffer is bounded (MAX_BUFFER); when it is full new events are dropped
+and counted instead of blocking the request. Set SYSTEM_LOG_BUFFERED = False
+(e.g. in tests) to write every event immediately, like before.
+"""
+import atexit
+import threading
+import time
+from typing import List
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+
+from .models import SystemLog
+
+
+FLUSH_SIZE = getattr(settings, "SYSTEM_LOG_FLUSH_SIZE", 200)
+FLUSH_SECONDS = getattr(settings, "SYSTEM_LOG_FLUSH_SECONDS", 2.0)
+MAX_BUFFER = getattr(settings, "SYSTEM_LOG_MAX_BUFFER", 10000)
+
+_lock = threading.Lock()
+_buffer: List[SystemLog] = []
+_oldest = 0.0
+_flusher = None
+_wake = threading.Event()
+
+_stats = {"written": 0, "flushes": 0, "dropped": 0, "failed": 0}
+
+
+def is_buffered() -> bool:
+    return getattr(settings, "SYSTEM_LOG_BUFFERED", True)
+
+
+def write(entry: SystemLog) -> None:
+    """Store one (unsaved) SystemLog row, now or later depending on the mode."""
+    global _oldest
+
+    if not is_buffered():
+        entry.save()
+        _stats["written"] += 1
+        return
+
+    _start_flusher()
+    with _lock:
+        if len(_buffer) >= MAX_BUFFER:
+            _stats["dropped"] += 1
+            return
+        if not _buffer:
+            _oldest = time.monotonic()
+        _buffer.append(entry)
+        full = len(_buffer) >= FLUSH_SIZE
+
+    if full:
+        _wake.set()  # written by the flusher thread, not in the caller's transaction
+
+
+def _take() -> List[SystemLog]:
+    global _buffer
+    with _lock:
+        rows, _buffer = _buffer, []
+    return rows
+
+
+def forget_user(user_id: int) -> None:
+    """A user was deleted: buffered rows keep their message but lose the link."""
+    with _lock:
+        for entry in _buffer:
+            if entry.user_id == user_id:
+                entry.user_id = None
+
+
+def flush() -> int:
+    """Write everything buffered with one bulk_create. Returns rows written."""
+    if connection.in_atomic_block:
+        # wait for the caller's commit; after a rollback the rows stay
+        # buffered for the next flush
+        transaction.on_commit(flush)
+        return 0
+    rows = _take()
+    if not rows:
+        return 0
+    try:
+        with transaction.atomic():
+            SystemLog.objects.bulk_create(rows, batch_size=500)
+        written = len(rows)
+    except IntegrityError:
+        written = _write_one_by_one(rows)
+    except DatabaseError:
+        _stats["failed"] += len(rows)
+        return 0
+    _stats["written"] += written
+    _stats["flushes"] += 1
+    return written
+
+
+def _insert(entry: SystemLog) -> bool:
+    entry.pk = None  # may be set by a failed bulk_create
+    try:
+        with transaction.atomic():
+            entry.save(force_insert=True)
+    except DatabaseError:
+        return False
+    return True
+
+
+def _write_one_by_one(rows: List[SystemLog]) -> int:
+    written = 0
+    for entry in rows:
+        ok = _insert(entry)
+        if not ok and entry.user_id is not None:
+            # the user was deleted by another process meanwhile
+            entry.user_id = None
+            ok = _insert(entry)
+        if ok:
+            written += 1
+        else:
+            _stats["failed"] += 1
+    return written
+
+
+def flush_if_due() -> int:
+    """Flush if the oldest buffered row waited FLUSH_SECONDS or more."""
+    with _lock:
+        due = bool(_buffer) and time.monotonic() - _oldest >= FLUSH_SECONDS
+    return flush() if due else 0
+
+
+def _flusher_loop() -> None:
+    while True:
+        full = _wake.wait(FLUSH_SECONDS)
+        _wake.clear()
+        try:
+            if full:
+                flush()
+            else:
+                flush_if_due()
+        finally:
+            # this thread has its own DB connection; don't keep it open
+            connection.close()
+
+
+def _start_flusher() -> None:
+    global _flusher
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flusher_loop, name="systemlog-flusher", daemon=True)
+                _flusher.start()
+
+
+def stats() -> dict:
+    """Counters of this process, plus the current buffer size."""
+    data = dict(_stats)
+    data["buffered"] = len(_buffer)
+    return data
+
+
+atexit.register(flush)
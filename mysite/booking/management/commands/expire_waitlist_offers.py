@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from booking import waitlist
+from booking.notifications import notify_waitlist_offers
+
+
+class Command(BaseCommand):
+    help = "Release waitlist offers that were not accepted in time and offer the slots to the next patients."
+
+    def handle(self, *args, **options):
+        new_offers = waitlist.expire_offers()
+        notify_waitlist_offers(new_offers)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired offers processed; {len(new_offers)} slot(s) offered to the next patient."
+        ))
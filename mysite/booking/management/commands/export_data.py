@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import dataexports
+
+
+class Command(BaseCommand):
+    help = (
+        "Export appointments or system logs as JSONL or Parquet for analytics. "
+        "With --state-file, each run continues where the previous one stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(dataexports.DATASETS))
+        parser.add_argument("--format", dest="fmt", choices=sorted(dataexports.FORMATS), default="jsonl")
+        parser.add_argument("--output", required=True, help="File to write.")
+        parser.add_argument("--since", help="Only rows changed after this watermark.")
+        parser.add_argument(
+            "--state-file",
+            help="Read --since from this file and store the new watermark in it after a successful run.",
+        )
+
+    def handle(self, *args, **options):
+        spec = dataexports.DATASETS[options["dataset"]]
+        fmt = options["fmt"]
+        if fmt not in dataexports.available_formats():
+            raise CommandError(f"The {fmt} format needs pyarrow (pip install pyarrow).")
+
+        state_file = Path(options["state_file"]) if options["state_file"] else None
+        since_raw = options["since"]
+        if since_raw is None and state_file and state_file.exists():
+            since_raw = state_file.read_text().strip() or None
+        try:
+            since = dataexports.parse_watermark(spec, since_raw) if since_raw else None
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        until = dataexports.current_watermark(spec, since)
+        output = Path(options["output"])
+        part = output.with_name(output.name + ".part")
+        with open(part, "wb") as fh:
+            for block in dataexports.blocks(spec, fmt, since=since, until=until):
+                fh.write(block)
+        part.replace(output)
+
+        watermark = dataexports.format_watermark(until)
+        if state_file:
+            state_file.write_text(watermark + "\n")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output} (next --since {watermark})."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Import doctors or historical appointments from a CSV file "
+        "(validated and inserted in chunks; invalid rows are reported and skipped)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=imports.KINDS)
+        parser.add_argument("path", help="CSV file with a header row (UTF-8).")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the file.")
+        parser.add_argument("--chunk-size", type=int, default=imports.CHUNK_SIZE)
+        parser.add_argument(
+            "--workers", type=int,
+            help="Processes hashing the doctors' passwords (default: one per CPU).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], newline="", encoding="utf-8-sig") as fh:
+                result = imports.run(
+                    options["kind"], fh,
+                    dry_run=options["dry_run"],
+                    chunk_size=options["chunk_size"],
+                    workers=options["workers"],
+                )
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.invalid > len(result.errors):
+            self.stderr.write(f"... and {result.invalid - len(result.errors)} more invalid row(s).")
+
+        summary = result.summary() + "."
+        self.stdout.write(self.style.SUCCESS(summary) if not result.invalid else self.style.WARNING(summary))
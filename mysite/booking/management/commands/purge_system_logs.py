@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from booking import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive SystemLog rows older than the retention period (System Settings) "
+        "to compressed JSONL files, roll them up into daily counts and delete them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Override the retention period (days).")
+        parser.add_argument("--no-archive", action="store_true", help="Do not write archive files.")
+        parser.add_argument("--chunk-size", type=int, default=retention.CHUNK_SIZE)
+        parser.add_argument("--archive-dir", help="Write archives here instead of LOG_ARCHIVE_DIR.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be purged.")
+
+    def handle(self, *args, **options):
+        summary = retention.purge_old_logs(
+            retention_days=options["days"],
+            archive=False if options["no_archive"] else None,
+            chunk_size=options["chunk_size"],
+            archive_dir=options["archive_dir"],
+            dry_run=options["dry_run"],
+        )
+
+        if summary["cutoff"] is None:
+            self.stdout.write("Log retention is off (0 days); nothing purged.")
+        elif options["dry_run"]:
+            self.stdout.write(f"{summary['purged']} log row(s) older than {summary['cutoff']:%Y-%m-%d} would be purged.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Purged {summary['purged']} log row(s) older than {summary['cutoff']:%Y-%m-%d} "
+                f"in {summary['chunks']} chunk(s), covering {len(summary['days'])} day(s)."
+            ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from booking import stats
+
+
+class Command(BaseCommand):
+    help = "Recount the daily appointment statistics (AppointmentDailyStats) from Appointment."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First day to recount (YYYY-MM-DD).")
+        parser.add_argument("--to", dest="date_to", help="Last day to recount (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ("date_from", "date_to"):
+            raw = options[name]
+            if raw:
+                try:
+                    bounds[name] = parse_date(raw)
+                except ValueError:  # well formed but impossible, e.g. 2024-02-30
+                    bounds[name] = None
+                if bounds[name] is None:
+                    raise CommandError(f"Invalid date: {raw}")
+        written = stats.rebuild(**bounds)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily stats row(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from booking import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the doctor full-text search index from DoctorProfile."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write("No search index on this database; find_doctor uses plain filters.")
+            return
+        done = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {done} doctor(s)."))
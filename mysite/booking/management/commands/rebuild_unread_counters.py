@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from booking.notifications import rebuild_unread_counters
+
+
+class Command(BaseCommand):
+    help = "Recount the unread-notification counts kept per user from the Notification table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Only rebuild this user id (can be given several times).",
+        )
+
+    def handle(self, *args, **options):
+        done = rebuild_unread_counters(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt unread counters for {done} user(s)."))
@@ -0,0 +1,46 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from booking import exportjobs
+
+
+class Command(BaseCommand):
+    help = "Run queued appointment export jobs (ExportJob), optionally with several worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and poll for jobs every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        if workers == 1:
+            self._work(options)
+            return
+
+        # every process opens its own database connection
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=self._work, args=(options,))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    def _work(self, options):
+        while True:
+            done, failed = exportjobs.work()
+            if done or failed or not options["loop"]:
+                self.stdout.write(f"Exports: {done} done, {failed} failed.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from booking import outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued emails from the outbox (one SMTP connection per run, with retries and backoff)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and poll the outbox every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = outbox.drain(batch_size=options["batch_size"])
+            except Exception as exc:
+                if not options["loop"]:
+                    raise CommandError(f"Outbox: drain failed: {exc}") from exc
+                # e.g. the database went away: report it and poll again
+                self.stderr.write(f"Outbox: drain failed: {exc!r}")
+                close_old_connections()
+            else:
+                if sent or failed or not options["loop"]:
+                    self.stdout.write(f"Outbox: {sent} sent, {failed} failed.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2025-11-24 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0013_alter_notification_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='hospital_slug',
+            field=models.CharField(default='', max_length=120),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    """
+    Old data can have several active appointments in the same doctor slot.
+    Keep the first one (lowest id) and cancel the rest so the constraint can be added.
+    """
+    Appointment = apps.get_model('booking', 'Appointment')
+    seen = set()
+    duplicates = []
+    active = (
+        Appointment.objects
+        .filter(status__in=['Pending', 'Approved', 'Rescheduled'])
+        .order_by('id')
+        .values_list('id', 'doctor_id', 'date', 'time')
+    )
+    for appt_id, doctor_id, day, t in active:
+        key = (doctor_id, day, t)
+        if key in seen:
+            duplicates.append(appt_id)
+        else:
+            seen.add(key)
+    if duplicates:
+        Appointment.objects.filter(id__in=duplicates).update(status='Cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0014_doctorprofile_hospital_slug'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Pending', 'Approved', 'Rescheduled'])), fields=('doctor', 'date', 'time'), name='uniq_active_doctor_slot'),
+        ),
+    ]
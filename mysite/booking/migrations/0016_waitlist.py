@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_appointment_uniq_active_doctor_slot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Waitlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('status', models.CharField(choices=[('Waiting', 'Waiting'), ('Offered', 'Offered'), ('Booked', 'Booked'), ('Declined', 'Declined'), ('Expired', 'Expired'), ('Cancelled', 'Cancelled')], default='Waiting', max_length=10)),
+                ('offer_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='uniq_active_doctor_slot',
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rescheduled', 'Rescheduled'), ('Cancelled', 'Cancelled'), ('Completed', 'Completed'), ('Rejected', 'Rejected'), ('Offered', 'Offered')], default='Pending', max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Pending', 'Approved', 'Rescheduled', 'Offered'])), fields=('doctor', 'date', 'time'), name='uniq_active_doctor_slot'),
+        ),
+        migrations.AddField(
+            model_name='waitlist',
+            name='appointment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entries', to='booking.appointment'),
+        ),
+        migrations.AddField(
+            model_name='waitlist',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='booking.doctorprofile'),
+        ),
+        migrations.AddField(
+            model_name='waitlist',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='waitlist',
+            index=models.Index(fields=['doctor', 'status', 'created_at'], name='waitlist_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlist',
+            index=models.Index(fields=['status', 'offer_expires_at'], name='waitlist_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0019_systemlog_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event_type', models.CharField(choices=[('login', 'User login'), ('logout', 'User logout'), ('login_failed', 'User login failed'), ('user_created', 'User created'), ('appointment_created', 'Appointment created'), ('appointment_updated', 'Appointment updated'), ('appointment_deleted', 'Appointment deleted')], max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'event_type'],
+            },
+        ),
+        migrations.AddField(
+            model_name='systemsetting',
+            name='archive_old_logs',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='systemsetting',
+            name='log_retention_days',
+            field=models.PositiveIntegerField(default=90),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['created_at', 'id'], name='systemlog_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='systemlogrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'event_type'), name='uniq_systemlog_rollup'),
+        ),
+    ]
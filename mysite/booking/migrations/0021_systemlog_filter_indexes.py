@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0020_systemlog_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['event_type', 'created_at', 'id'], name='systemlog_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='systemlog_user_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from booking import search
+
+
+def create_and_fill(apps, schema_editor):
+    search.create_index(schema_editor)
+    search.reset()
+    if not search.is_available():
+        return
+    DoctorProfile = apps.get_model("booking", "DoctorProfile")
+    # fields as of this migration (search._fields follows the current models)
+    rows = []
+    for doctor in DoctorProfile.objects.select_related("user"):
+        user = doctor.user
+        name = f"{user.first_name} {user.last_name}".strip() or user.username
+        rows.append((doctor.id, [name, doctor.specialization or "", doctor.hospital or "", doctor.city or ""]))
+    search._write(rows)
+
+
+def drop(apps, schema_editor):
+    search.drop_index(schema_editor)
+    search.reset()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0021_systemlog_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_and_fill, drop),
+    ]
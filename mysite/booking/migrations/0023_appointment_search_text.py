@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+from booking import search
+from booking.models import appointment_search_text
+
+
+def fill_search_text(apps, schema_editor):
+    Appointment = apps.get_model("booking", "Appointment")
+    batch = []
+    for appt in Appointment.objects.select_related("patient", "doctor", "doctor__user").iterator(chunk_size=2000):
+        appt.search_text = appointment_search_text(appt.patient, appt.doctor, appt.hospital, appt.department)
+        batch.append(appt)
+        if len(batch) >= 2000:
+            Appointment.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    Appointment.objects.bulk_update(batch, ["search_text"])
+
+
+def create_index(apps, schema_editor):
+    search.create_appointment_index(schema_editor)
+    search.reset()
+    search.rebuild_appointment_index()
+
+
+def drop_index(apps, schema_editor):
+    search.drop_appointment_index(schema_editor)
+    search.reset()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0022_doctor_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'time', 'id'], name='appointment_date_idx'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
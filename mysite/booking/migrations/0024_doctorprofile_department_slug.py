@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_department_slugs(apps, schema_editor):
+    DoctorProfile = apps.get_model("booking", "DoctorProfile")
+    doctors = list(DoctorProfile.objects.only("id", "specialization"))
+    for doctor in doctors:
+        doctor.department_slug = slugify(doctor.specialization or "")
+    DoctorProfile.objects.bulk_update(doctors, ["department_slug"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0023_appointment_search_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='department_slug',
+            field=models.SlugField(blank=True, db_index=False, editable=False, max_length=80),
+        ),
+        migrations.RunPython(fill_department_slugs, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['hospital_slug', 'department_slug'], name='doctor_department_idx'),
+        ),
+    ]
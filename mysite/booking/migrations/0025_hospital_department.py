@@ -0,0 +1,232 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:12
+
+import re
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def hospital_slug(name):
+    # booking.utils.clean_slug, kept here so the migration does not change with it
+    return re.sub(r"[-_]+", "", slugify(name or ""))
+
+
+def _pick(names):
+    """Most common spelling; doctors' spellings win over appointments'."""
+    return names.most_common(1)[0][0]
+
+
+def fill_hospitals_and_departments(apps, schema_editor):
+    Hospital = apps.get_model("booking", "Hospital")
+    Department = apps.get_model("booking", "Department")
+    DoctorProfile = apps.get_model("booking", "DoctorProfile")
+    Appointment = apps.get_model("booking", "Appointment")
+
+    doctors = list(DoctorProfile.objects.only("id", "hospital", "specialization"))
+    pairs = list(
+        Appointment.objects.order_by().values_list("hospital", "department").distinct()
+    )
+
+    # ----- dedupe names by slug -----
+    doctor_hospitals = defaultdict(Counter)
+    other_hospitals = defaultdict(Counter)
+    doctor_departments = defaultdict(Counter)
+    other_departments = defaultdict(Counter)
+    for d in doctors:
+        h = (d.hospital or "").strip()
+        s = (d.specialization or "").strip()
+        doctor_hospitals[hospital_slug(h)][h] += 1
+        doctor_departments[(hospital_slug(h), slugify(s))][s] += 1
+    for h, s in pairs:
+        h = (h or "").strip()
+        s = (s or "").strip()
+        other_hospitals[hospital_slug(h)][h] += 1
+        other_departments[(hospital_slug(h), slugify(s))][s] += 1
+
+    hospital_ids = {}
+    for slug in {*doctor_hospitals, *other_hospitals}:
+        name = _pick(doctor_hospitals.get(slug) or other_hospitals[slug])
+        hospital_ids[slug] = Hospital.objects.create(name=name, slug=slug).id
+
+    department_ids = {}
+    for key in {*doctor_departments, *other_departments}:
+        name = _pick(doctor_departments.get(key) or other_departments[key])
+        department_ids[key] = Department.objects.create(
+            hospital_id=hospital_ids[key[0]], name=name, slug=key[1]
+        ).id
+
+    # ----- point rows at them -----
+    for d in doctors:
+        h_slug = hospital_slug(d.hospital)
+        d.hospital_ref_id = hospital_ids[h_slug]
+        d.department_id = department_ids[(h_slug, slugify((d.specialization or "").strip()))]
+    DoctorProfile.objects.bulk_update(doctors, ["hospital_ref", "department"], batch_size=1000)
+
+    # one UPDATE per distinct (hospital, department) text pair
+    for h, s in pairs:
+        h_slug = hospital_slug(h)
+        Appointment.objects.filter(hospital=h, department=s).update(
+            hospital_ref_id=hospital_ids[h_slug],
+            department_ref_id=department_ids[(h_slug, slugify((s or "").strip()))],
+        )
+
+
+def restore_names(apps, schema_editor):
+    DoctorProfile = apps.get_model("booking", "DoctorProfile")
+    Appointment = apps.get_model("booking", "Appointment")
+    Department = apps.get_model("booking", "Department")
+
+    doctors = list(DoctorProfile.objects.select_related("hospital_ref", "department"))
+    for d in doctors:
+        d.hospital = d.hospital_ref.name
+        d.hospital_slug = d.hospital_ref.slug
+        d.department_slug = d.department.slug
+    DoctorProfile.objects.bulk_update(
+        doctors, ["hospital", "hospital_slug", "department_slug"], batch_size=1000
+    )
+    for dept in Department.objects.select_related("hospital"):
+        Appointment.objects.filter(department_ref=dept).update(
+            hospital=dept.hospital.name, department=dept.name
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0024_doctorprofile_department_slug'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hospital',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120)),
+                ('slug', models.CharField(max_length=120, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Department',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(db_index=False, max_length=100)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='departments', to='booking.hospital')),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'slug'), name='uniq_department_slug')],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='doctorprofile',
+            name='doctor_department_idx',
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='hospital_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='doctors', to='booking.hospital'),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='department',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='doctors', to='booking.department'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='hospital_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='booking.hospital'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='department_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='booking.department'),
+        ),
+        migrations.RunPython(fill_hospitals_and_departments, restore_names),
+        # blank=True only so that migrating backwards can re-add the text
+        # columns (empty) before restore_names fills them; no schema change
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='hospital',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='hospital_slug',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='hospital',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='department',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RemoveField(
+            model_name='doctorprofile',
+            name='hospital',
+        ),
+        migrations.RemoveField(
+            model_name='doctorprofile',
+            name='hospital_slug',
+        ),
+        migrations.RemoveField(
+            model_name='doctorprofile',
+            name='department_slug',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='hospital',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='department',
+        ),
+        migrations.RenameField(
+            model_name='doctorprofile',
+            old_name='hospital_ref',
+            new_name='hospital',
+        ),
+        migrations.RenameField(
+            model_name='appointment',
+            old_name='hospital_ref',
+            new_name='hospital',
+        ),
+        migrations.RenameField(
+            model_name='appointment',
+            old_name='department_ref',
+            new_name='department',
+        ),
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='hospital',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='doctors', to='booking.hospital'),
+        ),
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='department',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='doctors', to='booking.department'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='hospital',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='booking.hospital'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='department',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='booking.department'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['hospital', 'date'], name='appointment_hospital_idx'),
+        ),
+    ]
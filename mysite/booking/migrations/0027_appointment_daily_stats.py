@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_daily_stats(apps, schema_editor):
+    # same as booking.stats.rebuild(), against the historical models
+    Appointment = apps.get_model("booking", "Appointment")
+    AppointmentDailyStats = apps.get_model("booking", "AppointmentDailyStats")
+    rows = (
+        Appointment.objects.order_by()
+        .values_list("date", "doctor_id", "hospital_id", "status")
+        .annotate(total=Count("id"))
+    )
+    AppointmentDailyStats.objects.bulk_create(
+        (
+            AppointmentDailyStats(date=day, doctor_id=doctor_id, hospital_id=hospital_id,
+                                  status=status, count=total)
+            for day, doctor_id, hospital_id, status, total in rows
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0026_appointment_status_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rescheduled', 'Rescheduled'), ('Cancelled', 'Cancelled'), ('Completed', 'Completed'), ('Rejected', 'Rejected'), ('Offered', 'Offered')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='booking.doctorprofile')),
+                ('hospital', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='booking.hospital')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['doctor', 'status', 'date'], name='appointment_stats_doctor_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'doctor', 'hospital', 'status'), name='uniq_appointment_daily_stats')],
+            },
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0029_appointment_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='systemlog',
+            name='event_type',
+            field=models.CharField(choices=[('login', 'User login'), ('logout', 'User logout'), ('login_failed', 'User login failed'), ('user_created', 'User created'), ('appointment_created', 'Appointment created'), ('appointment_updated', 'Appointment updated'), ('appointment_deleted', 'Appointment deleted'), ('bulk_import', 'Bulk import')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='systemlogrollup',
+            name='event_type',
+            field=models.CharField(choices=[('login', 'User login'), ('logout', 'User logout'), ('login_failed', 'User login failed'), ('user_created', 'User created'), ('appointment_created', 'Appointment created'), ('appointment_updated', 'Appointment updated'), ('appointment_deleted', 'Appointment deleted'), ('bulk_import', 'Bulk import')], max_length=50),
+        ),
+    ]
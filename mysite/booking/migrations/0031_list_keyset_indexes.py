@@ -0,0 +1,88 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# The single-column foreign key indexes replaced by the new composite
+# indexes (which start with the same column).
+FK_INDEXES = [
+    ("Appointment", "patient"),
+    ("Appointment", "doctor"),
+    ("Feedback", "doctor"),
+]
+
+
+def drop_fk_indexes(apps, schema_editor):
+    # On SQLite an AlterField(db_index=False) copies the whole table; only
+    # the index has to go.
+    for model_name, field_name in FK_INDEXES:
+        model = apps.get_model("booking", model_name)
+        column = model._meta.get_field(field_name).column
+        for name in schema_editor._constraint_names(model, [column], index=True, unique=False, primary_key=False):
+            schema_editor.execute(schema_editor._delete_index_sql(model, name))
+
+
+def create_fk_indexes(apps, schema_editor):
+    for model_name, field_name in FK_INDEXES:
+        model = apps.get_model("booking", model_name)
+        schema_editor.execute(schema_editor._create_index_sql(model, fields=[model._meta.get_field(field_name)]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0030_systemlog_bulk_import_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='appointment',
+                    name='doctor',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='doctor_appointments', to='booking.doctorprofile'),
+                ),
+                migrations.AlterField(
+                    model_name='appointment',
+                    name='patient',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='patient_appointments', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='feedback',
+                    name='doctor',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feedbacks', to='booking.doctorprofile'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_fk_indexes, create_fk_indexes),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date', 'time', 'id'], name='appointment_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date', 'time', 'id'], name='appointment_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', 'date', 'time', 'id'], name='appointment_doctor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['created_at', 'id'], name='feedback_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['doctor', 'created_at', 'id'], name='feedback_doctor_idx'),
+        ),
+        # patient lists (admin_patients, doctor_patients) are paged by name
+        migrations.RunSQL(
+            'CREATE INDEX "booking_user_name_idx" ON "auth_user" ("first_name", "last_name", "username")',
+            'DROP INDEX "booking_user_name_idx"',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0031_list_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='waitlist',
+            name='waitlist_queue_idx',
+        ),
+        migrations.AddIndex(
+            model_name='waitlist',
+            index=models.Index(fields=['doctor', 'status', 'date_from'], name='waitlist_window_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from booking import search
+
+
+def recreate_index(apps, schema_editor):
+    # the prefix-word table becomes a trigram (substring) table
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    search.drop_appointment_index(schema_editor)
+    search.create_appointment_index(schema_editor)
+    search.reset()
+    search.rebuild_appointment_index()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0032_waitlist_window_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0033_appointment_search_trigram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='waitlist',
+            name='waitlist_window_idx',
+        ),
+        migrations.AddIndex(
+            model_name='waitlist',
+            index=models.Index(condition=models.Q(('status', 'Waiting')), fields=['doctor', 'created_at', 'id', 'date_from', 'date_to'], name='waitlist_fifo_idx'),
+        ),
+    ]
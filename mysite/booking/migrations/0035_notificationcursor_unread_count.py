@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0034_waitlist_fifo_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationcursor',
+            name='unread_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationcursor',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,62 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
 
 
+class Hospital(models.Model):
+    """
+    A hospital / clinic. Doctors and appointments point here by id instead
+    of repeating the name; slug (clean_slug of the name) is the key in the
+    directory URLs.
+    """
+    name = models.CharField(max_length=120)
+    slug = models.CharField(max_length=120, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    @classmethod
+    def for_name(cls, name: str) -> "Hospital":
+        """The hospital a free-text name refers to, created on first use."""
+        from .utils import clean_slug
+
+        name = (name or "").strip()
+        hospital, _ = cls.objects.get_or_create(slug=clean_slug(name), defaults={"name": name})
+        return hospital
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Department(models.Model):
+    """
+    A department of one hospital (what doctors enter as specialization).
+    slug = slugify(name), unique per hospital.
+    """
+    hospital = models.ForeignKey(Hospital, on_delete=models.PROTECT, related_name="departments")
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, db_index=False)
+
+    class Meta:
+        ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=["hospital", "slug"], name="uniq_department_slug"),
+        ]
+
+    @classmethod
+    def for_name(cls, hospital: Hospital, name: str) -> "Department":
+        """The department of hospital a free-text name refers to, created on first use."""
+        name = (name or "").strip()
+        department, _ = cls.objects.get_or_create(
+            hospital=hospital, slug=slugify(name), defaults={"name": name}
+        )
+        return department
+
+    def __str__(self) -> str:
+        return self.name
+
 
 class DoctorProfile(models.Model):
     STATUS_CHOICES = [
@@ -18,8 +72,14 @@ class DoctorProfile(models.Model):
     registration_no = models.CharField(max_length=50)
     specialization = models.CharField(max_length=80)
     experience_years = models.PositiveIntegerField(default=0)
-    hospital = models.CharField(max_length=120)
-    hospital_slug = models.CharField(max_length=120)
+    hospital = models.ForeignKey(Hospital, on_delete=models.PROTECT, related_name="doctors")
+    # (hospital, specialization) as a Department row; set on save
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.PROTECT,
+        related_name="doctors",
+        editable=False,
+    )
     city = models.CharField(max_length=80)
     slot_preference = models.CharField(max_length=120)
 
@@ -56,10 +116,45 @@ class DoctorProfile(models.Model):
     )
     reviewed_at = models.DateTimeField(null=True, blank=True)
 
+    def save(self, *args, **kwargs):
+        # look the department up only when hospital or specialization changed
+        key = (self.hospital_id, self.specialization)
+        if self.department_id is None or key != getattr(self, "_department_key", None):
+            self.department = Department.for_name(self.hospital, self.specialization)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and {"hospital", "specialization"} & set(update_fields):
+                kwargs["update_fields"] = {*update_fields, "department"}
+        super().save(*args, **kwargs)
+        self._department_key = key
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # appointments copy the specialization into their search text
+        instance._loaded_specialization = instance.__dict__.get("specialization")
+        instance._department_key = (instance.__dict__.get("hospital_id"), instance._loaded_specialization)
+        return instance
+
     def __str__(self) -> str:
         full_name = self.user.get_full_name() or self.user.username
         return f"Dr. {full_name} — {self.specialization}"
 
+def appointment_search_text(patient, doctor, hospital: str, department: str) -> str:
+    """Text of Appointment.search_text (also used by migrations)."""
+    parts = [
+        patient.first_name,
+        patient.last_name,
+        patient.username,
+        patient.email,
+        doctor.user.first_name,
+        doctor.user.last_name,
+        doctor.specialization,
+        hospital,
+        department,
+    ]
+    return " ".join(p for p in parts if p).lower()
+
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -68,21 +163,37 @@ class Appointment(models.Model):
         ('Cancelled', 'Cancelled'),
         ('Completed', 'Completed'),
         ('Rejected', 'Rejected'),
+        ('Offered', 'Offered'),  # slot held for a waitlisted patient
     ]
 
+    # indexed through appointment_patient_idx / appointment_doctor_idx only
     patient = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='patient_appointments',
+        db_index=False,
     )
     doctor = models.ForeignKey(
         DoctorProfile,
         on_delete=models.CASCADE,
         related_name='doctor_appointments',
+        db_index=False,
     )
 
-    department = models.CharField(max_length=100)
-    hospital = models.CharField(max_length=120)
+    # the doctor's hospital / department when booked (defaulted on save);
+    # indexed through appointment_hospital_idx only
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.PROTECT,
+        related_name="appointments",
+        db_index=False,
+    )
+    hospital = models.ForeignKey(
+        Hospital,
+        on_delete=models.PROTECT,
+        related_name="appointments",
+        db_index=False,
+    )
     date = models.DateField()
     time = models.TimeField()
     symptoms = models.TextField(blank=True)
@@ -96,11 +207,190 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Lower-cased patient / doctor / hospital / department text for the
+    # admin search (see booking/search.py). Filled on save.
+    search_text = models.TextField(blank=True, default="", editable=False)
+
+    # Statuses that hold a doctor's slot (see booking/slots.py)
+    ACTIVE_STATUSES = ("Pending", "Approved", "Rescheduled", "Offered")
+
+    # Fields search_text is built from
+    SEARCH_SOURCE_FIELDS = ("patient_id", "doctor_id", "hospital_id", "department_id")
+
+    class Meta:
+        constraints = [
+            # Only one active appointment per doctor slot.
+            # Cancelled / Rejected / Completed rows don't block the slot.
+            models.UniqueConstraint(
+                fields=["doctor", "date", "time"],
+                condition=models.Q(status__in=["Pending", "Approved", "Rescheduled", "Offered"]),
+                name="uniq_active_doctor_slot",
+            ),
+        ]
+        indexes = [
+            # admin lists are ordered newest first
+            models.Index(fields=["date", "time", "id"], name="appointment_date_idx"),
+            # a patient's / doctor's appointment lists, keyset-paged in date order
+            models.Index(fields=["patient", "date", "time", "id"], name="appointment_patient_idx"),
+            models.Index(fields=["doctor", "date", "time", "id"], name="appointment_doctor_idx"),
+            # a doctor's appointments of one status (approvals, schedule,
+            # status filter) without walking the rest of their history
+            models.Index(fields=["doctor", "status", "date", "time", "id"], name="appointment_doctor_status_idx"),
+            # reports filter / group by hospital within a date range
+            models.Index(fields=["hospital", "date"], name="appointment_hospital_idx"),
+            # reports: per-status counts, status-filtered days / pages and
+            # per-hospital counts within a status, all from the index
+            models.Index(fields=["status", "date", "hospital"], name="appointment_status_idx"),
+            # incremental data exports: rows changed since a watermark
+            models.Index(fields=["updated_at", "id"], name="appointment_updated_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the row as loaded, so signals can tell what changed on save
+        loaded = dict(zip(field_names, values))
+        instance._loaded_values = loaded
+        if {"date", "time", "status"} <= loaded.keys():
+            instance._loaded_slot = (instance.date, instance.time, instance.status)
+        return instance
+
+    def build_search_text(self) -> str:
+        return appointment_search_text(self.patient, self.doctor, self.hospital.name, self.department.name)
+
+    def save(self, *args, **kwargs):
+        if self.hospital_id is None:
+            self.hospital = self.doctor.hospital
+        if self.department_id is None:
+            self.department = self.doctor.department
+        # rebuild search_text only when a field it is built from changed,
+        # so status-only saves don't load patient / doctor
+        update_fields = kwargs.get("update_fields")
+        touched = update_fields is None or bool(
+            {self._meta.get_field(f).attname for f in update_fields} & set(self.SEARCH_SOURCE_FIELDS)
+        )
+        if touched:
+            loaded = getattr(self, "_loaded_values", None)
+            if (
+                loaded is None
+                or not self.search_text
+                or any(getattr(self, f) != loaded.get(f) for f in self.SEARCH_SOURCE_FIELDS)
+            ):
+                self.search_text = self.build_search_text()
+                if update_fields is not None:
+                    kwargs["update_fields"] = {*update_fields, "search_text"}
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return f"{self.patient.username} → Dr. {self.doctor.user.last_name} ({self.status})"
 
 
 
+class AppointmentDailyStats(models.Model):
+    """
+    Number of appointments per day, doctor, hospital and status.
+    Kept in step with Appointment by the appointment signals (see
+    booking/stats.py), so reports sum a few rows per day instead of
+    counting appointments. rebuild_appointment_stats refills it.
+    """
+    date = models.DateField()
+    doctor = models.ForeignKey(
+        DoctorProfile,
+        on_delete=models.CASCADE,
+        related_name="daily_stats",
+        db_index=False,
+    )
+    hospital = models.ForeignKey(
+        Hospital,
+        on_delete=models.CASCADE,
+        related_name="daily_stats",
+        db_index=False,
+    )
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "doctor", "hospital", "status"],
+                name="uniq_appointment_daily_stats",
+            ),
+        ]
+        indexes = [
+            # doctor dashboard: one doctor's counts by status / day
+            models.Index(fields=["doctor", "status", "date"], name="appointment_stats_doctor_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.date} doctor #{self.doctor_id} {self.status}: {self.count}"
+
+
+class Waitlist(models.Model):
+    """
+    Patient waiting for a free slot with a doctor between date_from and date_to.
+    When an appointment in that window is cancelled / rejected, the slot is
+    held for the first waiting patient as an 'Offered' appointment until
+    offer_expires_at (see booking/waitlist.py).
+    """
+    STATUS_CHOICES = [
+        ('Waiting', 'Waiting'),
+        ('Offered', 'Offered'),
+        ('Booked', 'Booked'),
+        ('Declined', 'Declined'),
+        ('Expired', 'Expired'),
+        ('Cancelled', 'Cancelled'),
+    ]
+
+    patient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+    )
+    doctor = models.ForeignKey(
+        DoctorProfile,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+    )
+    date_from = models.DateField()
+    date_to = models.DateField()
+
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='Waiting',
+    )
+
+    # the held appointment while status is Offered / Booked
+    appointment = models.ForeignKey(
+        Appointment,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='waitlist_entries',
+    )
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            # a doctor's waiters in queue order, with their windows, so
+            # offer_slot() stops at the first fitting ones (no sort)
+            models.Index(
+                fields=["doctor", "created_at", "id", "date_from", "date_to"],
+                condition=models.Q(status="Waiting"),
+                name="waitlist_fifo_idx",
+            ),
+            # offers that ran out
+            models.Index(fields=["status", "offer_expires_at"], name="waitlist_expiry_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.patient.username} waiting for Dr. {self.doctor.user.last_name} ({self.status})"
+
+
 class SecurityLog(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -131,6 +421,10 @@ class SystemSetting(models.Model):
     allow_doctor_registration = models.BooleanField(default=True)
     maintenance_mode = models.BooleanField(default=False)
 
+    # SystemLog retention (see booking/retention.py); 0 days = keep forever
+    log_retention_days = models.PositiveIntegerField(default=90)
+    archive_old_logs = models.BooleanField(default=True)
+
     updated_at = models.DateTimeField(auto_now=True)
     updated_by = models.ForeignKey(
         User,
@@ -152,6 +446,7 @@ class SystemLog(models.Model):
         ("appointment_created", "Appointment created"),
         ("appointment_updated", "Appointment updated"),
         ("appointment_deleted", "Appointment deleted"),
+        ("bulk_import", "Bulk import"),
     ]
 
     user = models.ForeignKey(
@@ -167,16 +462,44 @@ class SystemLog(models.Model):
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.CharField(max_length=255, blank=True)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # set when the event happens, not when the buffered row is written
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # admin_logs pages on (created_at, id), optionally per event type
+            # or per user; retention walks old rows in the same order
+            models.Index(fields=["created_at", "id"], name="systemlog_created_idx"),
+            models.Index(fields=["event_type", "created_at", "id"], name="systemlog_event_idx"),
+            models.Index(fields=["user", "created_at", "id"], name="systemlog_user_idx"),
+        ]
 
     def __str__(self) -> str:
         username = self.user.username if self.user else "system"
         return f"[{self.created_at:%Y-%m-%d %H:%M}] {self.event_type} ({username})"
 
 
+class SystemLogRollup(models.Model):
+    """
+    Number of SystemLog events per day and event type.
+    Filled by the retention job before old raw rows are purged, so the
+    counts stay available after the rows are gone.
+    """
+    day = models.DateField()
+    event_type = models.CharField(max_length=50, choices=SystemLog.EVENT_TYPES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-day", "event_type"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "event_type"], name="uniq_systemlog_rollup"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} {self.event_type}: {self.count}"
+
+
 class Notification(models.Model):
     """
     Simple per-user in-site notification.
@@ -198,14 +521,42 @@ class Notification(models.Model):
     )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Per-item read flag; "mark all as read" moves NotificationCursor instead
     is_read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # notifications page: WHERE user = ? ORDER BY created_at DESC, id DESC (keyset)
+            models.Index(fields=["user", "-created_at", "-id"], name="notification_user_page_idx"),
+        ]
 
     def str(self) -> str:
         return f"Notification for {self.user.username} - {self.message[:40]}"
 
+
+class NotificationCursor(models.Model):
+    """
+    Per-user read cursor: every notification created up to last_read_at
+    counts as read. Marking all as read is one write to this row instead of
+    an UPDATE over all unread notifications.
+
+    The row also keeps the user's unread count for the dashboard badge
+    (see booking/notifications.py).
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="notification_cursor",
+    )
+    # None: never marked everything as read
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    # None: not counted yet (the next read counts from the table)
+    unread_count = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.user} read up to {self.last_read_at}"
+
 class Feedback(models.Model):
         """
         Feedback from patient about an appointment / doctor.
@@ -225,6 +576,7 @@ class Feedback(models.Model):
             "DoctorProfile",
             on_delete=models.CASCADE,
             related_name="feedbacks",
+            db_index=False,  # feedback_doctor_idx
         )
         rating = models.PositiveSmallIntegerField(default=5)  # 1–5
         comments = models.TextField(blank=True)
@@ -232,6 +584,106 @@ class Feedback(models.Model):
 
         class Meta:
             ordering = ["-created_at"]
+            indexes = [
+                # feedback lists, keyset-paged newest first (all / per doctor)
+                models.Index(fields=["created_at", "id"], name="feedback_created_idx"),
+                models.Index(fields=["doctor", "created_at", "id"], name="feedback_doctor_idx"),
+            ]
 
         def str(self):
-            return f"Feedback {self.rating}/5 for {self.doctor} by {self.patient}"
\ No newline at end of file
+            return f"Feedback {self.rating}/5 for {self.doctor} by {self.patient}"
+
+
+class OutboxEmail(models.Model):
+    """
+    Email waiting to be sent by the outbox worker (booking/outbox.py).
+    Request handlers only insert rows here; the SMTP round trip happens in
+    the send_outbox_emails management command.
+    """
+    STATUS_CHOICES = [
+        ("Pending", "Pending"),
+        ("Sending", "Sending"),
+        ("Sent", "Sent"),
+        ("Failed", "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to_email = models.CharField(max_length=254)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.to_email}: {self.subject} ({self.status})"
+
+
+
+class ExportJob(models.Model):
+    """
+    Appointment CSV export run by the export worker (booking/exportjobs.py),
+    outside the web process. The gzip-compressed result is written to
+    EXPORT_DIR; identical filters requested again within
+    EXPORT_DEDUPE_SECONDS share one job.
+    """
+    STATUS_CHOICES = [
+        ("Pending", "Pending"),
+        ("Running", "Running"),
+        ("Done", "Done"),
+        ("Failed", "Failed"),
+    ]
+
+    filters = models.JSONField(default=dict)
+    filters_key = models.CharField(max_length=40)  # sha1 of the sorted filters
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="export_jobs",
+    )
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)
+    file_size = models.PositiveBigIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["filters_key", "created_at"], name="export_job_dedupe_idx"),
+            models.Index(fields=["status", "id"], name="export_job_status_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Export #{self.id} ({self.status})"
+
+    @property
+    def progress(self) -> int:
+        """Percentage of rows written so far."""
+        if self.status == "Done":
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, self.rows_done * 100 // self.rows_total)
@@ -0,0 +1,211 @@
+"""
+In-app notifications (+ the matching emails).
+
+notify_many() is the batched API: any number of (user, message, link)
+items cost one bulk INSERT of Notification rows and one bulk INSERT into
+the email outbox, whatever the number of users. notify_user() is the
+single-item shortcut used by most views.
+
+Read state: a notification is unread when it is newer than the user's
+NotificationCursor.last_read_at and its own is_read flag is not set.
+"Mark all as read" just moves the cursor (one row), the per-item flag is
+only used when a single notification is opened.
+
+Unread counts per user are kept on the NotificationCursor row and
+changed with F() increments / decrements in the same transaction as the
+notifications, so the dashboard badge reads one row instead of counting,
+and every process sees the same number. A missing count is taken from the
+table on first read; the rebuild_unread_counters command recounts all of
+them.
+"""
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import outbox
+from .models import Notification, NotificationCursor
+
+
+EMAIL_SUBJECT = "DABS Notification"
+
+
+def notify_many(items: Iterable[Tuple[object, str, str]], *, send_email: bool = True,
+                email_subject: str = EMAIL_SUBJECT) -> List[Notification]:
+    """
+    Create notifications for many (user, message, link) items at once and
+    queue one email per user that has an address.
+    Items with user=None are skipped.
+    """
+    items = [(user, message, link or "") for user, message, link in items if user]
+    if not items:
+        return []
+
+    notes = Notification.objects.bulk_create([
+        Notification(user=user, message=message[:255], link=link)
+        for user, message, link in items
+    ])
+
+    _add_unread(Counter(user.pk for user, _, _ in items))
+
+    if send_email:
+        outbox.enqueue_many(
+            (email_subject, message, user.email)
+            for user, message, _ in items
+            if user.email
+        )
+    return notes
+
+
+def notify_user(user, message: str, *, link: str = "", send_email: bool = True):
+    """
+    Create an in-app notification and optionally send an email.
+    """
+    if not user:
+        return
+    notify_many([(user, message, link)], send_email=send_email)
+
+
+def waitlist_offer_item(entry) -> Tuple[object, str, str]:
+    """(user, message, link) telling a waitlisted patient a slot is held for them."""
+    appt = entry.appointment
+    return (
+        entry.patient,
+        f"A slot with Dr. {appt.doctor.user.get_full_name() or appt.doctor.user.username} "
+        f"on {appt.date} at {appt.time} is free. Accept it before "
+        f"{timezone.localtime(entry.offer_expires_at):%Y-%m-%d %H:%M}.",
+        "/dashboard/patient/appointments/",
+    )
+
+
+def notify_waitlist_offers(entries) -> None:
+    """Notify every patient that just got a waitlist offer (one batch)."""
+    notify_many(waitlist_offer_item(e) for e in entries if e)
+
+
+# ---------- UNREAD COUNTERS ----------
+
+
+def _by_count(per_user) -> dict:
+    """{user_id: n} -> {n: [user_id, ...]}, so equal counts share one UPDATE."""
+    groups = defaultdict(list)
+    for user_id, n in per_user.items():
+        groups[n].append(user_id)
+    return groups
+
+
+def _add_unread(per_user) -> None:
+    # users not counted yet are left alone: the next read counts the table
+    for n, user_ids in _by_count(per_user).items():
+        NotificationCursor.objects.filter(user_id__in=user_ids, unread_count__isnull=False).update(
+            unread_count=F("unread_count") + n,
+        )
+
+
+def last_read_at(user):
+    """The user's read cursor (None if they never opened their notifications)."""
+    return (
+        NotificationCursor.objects
+        .filter(user=user)
+        .values_list("last_read_at", flat=True)
+        .first()
+    )
+
+
+def unread_filter(cursor=None) -> Q:
+    """Q for unread notifications given a read cursor (or none yet)."""
+    q = Q(is_read=False)
+    if cursor is not None:
+        q &= Q(created_at__gt=cursor)
+    return q
+
+
+def unread_count(user) -> int:
+    """Unread notifications of a user; one row read once the count is kept."""
+    row = (
+        NotificationCursor.objects
+        .filter(user=user)
+        .values_list("unread_count", "last_read_at")
+        .first()
+    )
+    if row is not None and row[0] is not None:
+        return row[0]
+
+    n = Notification.objects.filter(unread_filter(row and row[1]), user=user).count()
+    cursor, created = NotificationCursor.objects.get_or_create(user=user, defaults={"unread_count": n})
+    if not created:
+        NotificationCursor.objects.filter(id=cursor.id, unread_count__isnull=True).update(unread_count=n)
+    return n
+
+
+def mark_all_read(user, now=None):
+    """
+    Move the user's read cursor to now and reset the count (a single-row
+    write). Returns the previous cursor, so a page can still highlight
+    what was new.
+    """
+    now = now or timezone.now()
+    previous = last_read_at(user)
+    NotificationCursor.objects.update_or_create(user=user, defaults={"last_read_at": now, "unread_count": 0})
+    return previous
+
+
+def mark_read(notification: Notification) -> bool:
+    """
+    Mark one notification as read (per-item flag). Returns True if it was
+    unread before, in which case the count is decremented.
+    """
+    if notification.is_read:
+        return False
+    cursor = last_read_at(notification.user_id)
+    if cursor is not None and notification.created_at <= cursor:
+        return False  # already read through the cursor
+
+    updated = Notification.objects.filter(id=notification.id, is_read=False).update(is_read=True)
+    notification.is_read = True
+    if updated:
+        NotificationCursor.objects.filter(user_id=notification.user_id, unread_count__gt=0).update(
+            unread_count=F("unread_count") - 1,
+        )
+    return bool(updated)
+
+
+def rebuild_unread_counters(user_ids: Optional[Iterable[int]] = None, chunk_size: int = 1000) -> int:
+    """
+    Recount unread notifications from the table and overwrite the kept
+    counts (all users, or just user_ids). Returns the number of users.
+    """
+    unread = Notification.objects.filter(is_read=False).filter(
+        Q(user__notification_cursor__last_read_at__isnull=True)
+        | Q(created_at__gt=F("user__notification_cursor__last_read_at"))
+    )
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        unread = unread.filter(user_id__in=user_ids)
+    counts = dict(
+        unread.values("user_id").annotate(n=Count("id")).values_list("user_id", "n")
+    )
+
+    if user_ids is None:
+        user_ids = get_user_model().objects.values_list("id", flat=True).iterator(chunk_size=chunk_size)
+
+    done = 0
+    user_ids = iter(user_ids)
+    while True:
+        chunk = list(islice(user_ids, chunk_size))
+        if not chunk:
+            break
+        have_row = set(
+            NotificationCursor.objects.filter(user_id__in=chunk).values_list("user_id", flat=True)
+        )
+        NotificationCursor.objects.bulk_create([
+            NotificationCursor(user_id=user_id, unread_count=counts.get(user_id, 0))
+            for user_id in chunk if user_id not in have_row
+        ])
+        for n, ids in _by_count({user_id: counts.get(user_id, 0) for user_id in have_row}).items():
+            NotificationCursor.objects.filter(user_id__in=ids).update(unread_count=n)
+        done += len(chunk)
+    return done
@@ -0,0 +1,153 @@
+"""
+Email outbox.
+
+Views never talk to SMTP directly any more. They call enqueue(), which only
+inserts an OutboxEmail row (inside the same transaction as the change that
+caused the mail). The send_outbox_emails command calls drain(), which sends
+due rows in batches over ONE reused SMTP connection and retries failures
+with exponential backoff. When the SMTP server can't be reached at all,
+the claimed batch goes back to Pending with the same backoff.
+"""
+from datetime import timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5)
+# first retry after BACKOFF_SECONDS, then 2x, 4x, ...
+BACKOFF_SECONDS = getattr(settings, "OUTBOX_BACKOFF_SECONDS", 60)
+# a claimed row whose worker died is picked up again after this long
+LEASE_SECONDS = getattr(settings, "OUTBOX_LEASE_SECONDS", 300)
+
+
+def _from_email(from_email: Optional[str]) -> str:
+    return from_email or getattr(settings, "DEFAULT_FROM_EMAIL", "") or settings.EMAIL_HOST_USER
+
+
+def enqueue(subject: str, body: str, recipients: Iterable[str],
+            from_email: Optional[str] = None) -> List[OutboxEmail]:
+    """Queue one email per recipient. Blank addresses are skipped."""
+    return enqueue_many(((subject, body, to) for to in recipients), from_email=from_email)
+
+
+def enqueue_many(mails: Iterable[Tuple[str, str, str]],
+                 from_email: Optional[str] = None) -> List[OutboxEmail]:
+    """
+    Queue many (subject, body, to_email) mails with a single INSERT.
+    """
+    sender = _from_email(from_email)
+    rows = [
+        OutboxEmail(subject=subject[:255], body=body, from_email=sender, to_email=to)
+        for subject, body, to in mails
+        if to
+    ]
+    if not rows:
+        return []
+    return OutboxEmail.objects.bulk_create(rows)
+
+
+def _claim(batch_size: int) -> List[OutboxEmail]:
+    """
+    Take up to batch_size due rows for this worker.
+    Claimed rows get status 'Sending' and a lease; if the worker dies they
+    become due again when the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        qs = OutboxEmail.objects.filter(
+            status__in=["Pending", "Sending"],
+            next_attempt_at__lte=now,
+        ).order_by("next_attempt_at", "id")
+        if db_connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        rows = list(qs[:batch_size])
+        if rows:
+            OutboxEmail.objects.filter(id__in=[r.id for r in rows]).update(
+                status="Sending",
+                next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+            )
+    return rows
+
+
+def _send_batch(rows: Sequence[OutboxEmail], mail_connection) -> Tuple[int, int]:
+    sent_ids, failed = [], []
+    for row in rows:
+        msg = EmailMessage(
+            subject=row.subject,
+            body=row.body,
+            from_email=row.from_email or None,
+            to=[row.to_email],
+            connection=mail_connection,
+        )
+        try:
+            msg.send(fail_silently=False)
+            sent_ids.append(row.id)
+        except Exception as exc:  # SMTP errors come in many types
+            failed.append((row, exc))
+            # the connection may be broken now; start a fresh one for the rest
+            try:
+                mail_connection.close()
+                mail_connection.open()
+            except Exception:
+                pass
+
+    if sent_ids:
+        OutboxEmail.objects.filter(id__in=sent_ids).update(status="Sent", sent_at=timezone.now(), last_error="")
+    _retry_later(failed)
+    return len(sent_ids), len(failed)
+
+
+def _retry_later(failed: Sequence[Tuple[OutboxEmail, Exception]]) -> None:
+    """Count a failed attempt per row: Pending again after the backoff, or Failed."""
+    now = timezone.now()
+    for row, exc in failed:
+        attempts = row.attempts + 1
+        if attempts >= MAX_ATTEMPTS:
+            status, next_at = "Failed", now
+        else:
+            status = "Pending"
+            next_at = now + timedelta(seconds=BACKOFF_SECONDS * 2 ** (attempts - 1))
+        OutboxEmail.objects.filter(id=row.id).update(
+            status=status,
+            attempts=attempts,
+            next_attempt_at=next_at,
+            last_error=str(exc)[:1000],
+        )
+
+
+def drain(batch_size: int = 100, max_batches: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Send everything that is due, batch by batch, over one SMTP connection.
+    Returns (sent, failed) counts.
+    """
+    total_sent = total_failed = 0
+    mail_connection = get_connection(fail_silently=False)
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            rows = _claim(batch_size)
+            if not rows:
+                break
+            try:
+                mail_connection.open()
+            except Exception as exc:  # server down / refused / bad login
+                # the batch waits for its next attempt; so does everything else
+                _retry_later([(row, exc) for row in rows])
+                total_failed += len(rows)
+                break
+            sent, failed = _send_batch(rows, mail_connection)
+            total_sent += sent
+            total_failed += failed
+            batches += 1
+    finally:
+        try:
+            mail_connection.close()
+        except Exception:  # a dead connection can fail to say goodbye
+            pass
+    return total_sent, total_failed
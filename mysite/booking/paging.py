@@ -0,0 +1,148 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, the next page starts right after the last row of the
+current one: WHERE (a, b, id) < (last_a, last_b, last_id) in the ordering
+of the list. With an index on the ordering columns every page costs the
+same, no matter how deep.
+
+The position is handed to the browser as an opaque signed token, so pages
+are linked as ?after=<token>. The ordering must end with a unique column
+(normally "id" / "-id") and should not use nullable columns.
+
+List views call request_page() and include booking/keyset_pager.html for
+the "first page" / "next page" links (page.query keeps the other GET
+parameters, e.g. the filters).
+"""
+from typing import Any, List, Optional, Sequence
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.http import urlencode
+
+
+TOKEN_SALT = "booking.paging"
+
+DEFAULT_PAGE_SIZE = 50
+
+
+class KeysetPage:
+    """One page of rows plus the token of the next page (None on the last page)."""
+
+    def __init__(self, items: List[Any], next_token: Optional[str], is_first: bool):
+        self.items = items
+        self.next_token = next_token
+        self.is_first = is_first
+        # query string of the list without the cursor (set by request_page)
+        self.query = ""
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_token is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _value(row, path: str):
+    """Read a (possibly related, a__b) field from a model instance or a values() dict."""
+    if isinstance(row, dict):
+        return row[path]
+    for part in path.split("__"):
+        row = getattr(row, part)
+        if row is None:
+            return None
+    if hasattr(row, "pk") and not isinstance(row, (str, int)):
+        return row.pk
+    return row
+
+
+def encode_token(values: Sequence[Any]) -> str:
+    return signing.dumps([None if v is None else str(v) for v in values], salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(token: str, size: int) -> Optional[List[str]]:
+    """Values of a token, or None for a missing / tampered / wrong-shape token."""
+    if not token:
+        return None
+    try:
+        values = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def after_filter(ordering: Sequence[str], values: Sequence[Any]) -> Q:
+    """
+    Q for "rows that come after values" in ordering, e.g. for
+    ("-date", "-id"): date <= d AND (date < d OR (date = d AND id < i)).
+    The redundant bound on the first column lets the database seek the
+    index instead of scanning it from the start (SQLite can't do that
+    with the OR alone).
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        op = "lt" if field.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{name}__{op}": value})
+        equal &= Q(**{name: value})
+
+    first = ordering[0]
+    bound = "lte" if first.startswith("-") else "gte"
+    return Q(**{f"{first.lstrip('-')}__{bound}": values[0]}) & condition
+
+
+def keyset_page(qs, ordering: Sequence[str], token: str = "",
+                page_size: int = DEFAULT_PAGE_SIZE, ids_first: bool = False) -> KeysetPage:
+    """
+    Return the page of qs (ordered by ordering) that starts after token.
+    Costs one query: page_size + 1 rows are read to know if there is more.
+
+    ids_first: read only the ordering columns of the page first (which an
+    index on them can answer without touching the rows), then the rows of
+    the page by id, with qs's select_related joins done for those rows
+    only. Costs a second query; the ordering must end with "id" / "-id".
+    """
+    names = [f.lstrip("-") for f in ordering]
+    page_qs = qs.order_by(*ordering)
+    values = decode_token(token, len(ordering))
+    if values is not None:
+        page_qs = page_qs.filter(after_filter(ordering, values))
+
+    if ids_first:
+        keys = list(page_qs.values_list(*names)[: page_size + 1])
+        next_token = None
+        if len(keys) > page_size:
+            keys = keys[:page_size]
+            next_token = encode_token(keys[-1])
+        by_id = qs.order_by().in_bulk([key[-1] for key in keys])
+        # a row deleted in between is left out
+        rows = [by_id[key[-1]] for key in keys if key[-1] in by_id]
+        return KeysetPage(rows, next_token, is_first=values is None)
+
+    rows = list(page_qs[: page_size + 1])
+    next_token = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_token = encode_token([_value(last, name) for name in names])
+
+    return KeysetPage(rows, next_token, is_first=values is None)
+
+
+def request_page(request, qs, ordering: Sequence[str], page_size: int = DEFAULT_PAGE_SIZE,
+                 ids_first: bool = False, param: str = "after") -> KeysetPage:
+    """keyset_page() at the ?after=<token> of request, with page.query set for the page links."""
+    page = keyset_page(qs, ordering, request.GET.get(param, ""), page_size=page_size, ids_first=ids_first)
+    page.query = urlencode([
+        (name, value)
+        for name, values in request.GET.lists() if name != param
+        for value in values
+    ])
+    return page
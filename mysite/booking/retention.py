@@ -0,0 +1,122 @@
+"""
+SystemLog retention.
+
+Raw SystemLog rows older than SystemSetting.log_retention_days are:
+
+1. written to compressed JSONL archives on disk (if archive_old_logs is
+   on), one file per day: <LOG_ARCHIVE_DIR>/YYYY/MM/systemlog-YYYY-MM-DD.jsonl.gz
+2. counted into SystemLogRollup (per day and event type)
+3. deleted
+
+Rows are handled in chunks of CHUNK_SIZE in (created_at, id) order. Each
+chunk deletes its rows and adds its counts in one short transaction, so
+the table is never locked for long and an interrupted run can simply be
+started again (at worst a chunk appears twice in an archive file, the
+counts stay exact).
+"""
+import gzip
+import json
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SystemLog, SystemLogRollup, SystemSetting
+
+
+CHUNK_SIZE = getattr(settings, "LOG_RETENTION_CHUNK_SIZE", 1000)
+ARCHIVE_DIR = Path(getattr(settings, "LOG_ARCHIVE_DIR", settings.BASE_DIR / "log_archive"))
+
+_ARCHIVE_FIELDS = ("id", "created_at", "event_type", "message", "user_id", "ip_address", "user_agent")
+
+
+def cutoff_for(retention_days: int, now: Optional[datetime] = None) -> datetime:
+    """Start of the first day that is kept (local midnight)."""
+    today = timezone.localdate(now or timezone.now())
+    first_kept = today - timedelta(days=retention_days)
+    return timezone.make_aware(datetime.combine(first_kept, time.min))
+
+
+def archive_path(day: date, base: Path = ARCHIVE_DIR) -> Path:
+    return base / f"{day:%Y}" / f"{day:%m}" / f"systemlog-{day:%Y-%m-%d}.jsonl.gz"
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _archive(rows_by_day: Dict[date, List[dict]], base: Path) -> None:
+    for day, rows in rows_by_day.items():
+        path = archive_path(day, base)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # appending adds a new gzip member; gzip readers read them all
+        with gzip.open(path, "at", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps(row, default=_json_default, ensure_ascii=False))
+                fh.write("\n")
+
+
+def _add_counts(counts: Counter) -> None:
+    for (day, event_type), n in counts.items():
+        updated = SystemLogRollup.objects.filter(day=day, event_type=event_type).update(
+            count=F("count") + n
+        )
+        if not updated:
+            SystemLogRollup.objects.create(day=day, event_type=event_type, count=n)
+
+
+def purge_old_logs(retention_days: Optional[int] = None, archive: Optional[bool] = None,
+                   now: Optional[datetime] = None, chunk_size: int = CHUNK_SIZE,
+                   archive_dir: Optional[Path] = None, dry_run: bool = False) -> dict:
+    """
+    Archive, roll up and delete SystemLog rows older than the retention period.
+    Defaults come from SystemSetting. Returns a summary dict.
+    """
+    setting, _ = SystemSetting.objects.get_or_create(pk=1)
+    if retention_days is None:
+        retention_days = setting.log_retention_days
+    if archive is None:
+        archive = setting.archive_old_logs
+    base = Path(archive_dir) if archive_dir else ARCHIVE_DIR
+
+    summary = {"cutoff": None, "purged": 0, "chunks": 0, "days": set()}
+    if not retention_days:
+        return summary
+
+    cutoff = cutoff_for(retention_days, now)
+    summary["cutoff"] = cutoff
+    old = SystemLog.objects.filter(created_at__lt=cutoff)
+
+    if dry_run:
+        summary["purged"] = old.count()
+        return summary
+
+    while True:
+        rows = list(old.order_by("created_at", "id").values(*_ARCHIVE_FIELDS)[:chunk_size])
+        if not rows:
+            break
+
+        rows_by_day = defaultdict(list)
+        counts = Counter()
+        for row in rows:
+            day = timezone.localdate(row["created_at"])
+            rows_by_day[day].append(row)
+            counts[(day, row["event_type"])] += 1
+
+        if archive:
+            _archive(rows_by_day, base)
+
+        with transaction.atomic():
+            SystemLog.objects.filter(id__in=[row["id"] for row in rows]).delete()
+            _add_counts(counts)
+
+        summary["purged"] += len(rows)
+        summary["chunks"] += 1
+        summary["days"].update(rows_by_day)
+
+    return summary
@@ -0,0 +1,387 @@
+"""
+Search indexes for doctors and appointments.
+
+Doctors
+-------
+
+find_doctor used to OR five icontains filters over DoctorProfile and
+auth_user, which is a full scan + join on every search. Doctors are now
+looked up in a dedicated full-text index over name, specialization,
+hospital and city:
+
+- SQLite: FTS5 virtual table (rowid = doctor id), prefix indexes for
+  2 and 3 characters, ranked with bm25
+- PostgreSQL: table with a weighted tsvector and a GIN index, ranked
+  with ts_rank
+- any other database (or SQLite without FTS5): icontains fallback
+
+Every word of the query is a prefix match ("card lon" finds
+"Cardiology, London"). The index is kept in sync by signals (see
+signals.py); rebuild() / `manage.py rebuild_doctor_search` refills it.
+
+Appointments
+------------
+Appointment.search_text holds the lower-cased patient, doctor, hospital
+and department text (filled on save), so the admin search needs no
+joins. Every whitespace-separated term of the query must occur somewhere
+in it as a substring, like the icontains filters this replaced ("arma"
+finds "Sharma", "@gmail.com" finds e-mail addresses). It is indexed too:
+
+- SQLite 3.34+: FTS5 table over search_text with the trigram tokenizer
+  (rowid = appointment id); terms shorter than 3 characters can't use
+  it and are checked on the column
+- PostgreSQL: trigram GIN index on the column, so a plain substring
+  filter uses it
+- otherwise: substring filter on the column
+"""
+import re
+import sqlite3
+from typing import Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Appointment, DoctorProfile
+
+
+TABLE = "booking_doctor_search"
+APPOINTMENT_TABLE = "booking_appointment_search"
+
+# shortest term the trigram index can look up
+MIN_INDEXED_TERM = 3
+
+# name counts most, city least
+WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_tables = None
+
+
+# ----- schema (used by the migration) -----
+
+def create_index(schema_editor) -> None:
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "name, specialization, hospital, city, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            "doctor_id integer PRIMARY KEY REFERENCES booking_doctorprofile (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING gin (document)"
+        )
+
+
+def drop_index(schema_editor) -> None:
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def create_appointment_index(schema_editor) -> None:
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        if sqlite3.sqlite_version_info < (3, 34, 0):
+            return  # no trigram tokenizer: the substring filter scans the column
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {APPOINTMENT_TABLE} USING fts5("
+            "search_text, tokenize = 'trigram')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS booking_appointment_search_trgm "
+            "ON booking_appointment USING gin (search_text gin_trgm_ops)"
+        )
+
+
+def drop_appointment_index(schema_editor) -> None:
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {APPOINTMENT_TABLE}")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS booking_appointment_search_trgm")
+
+
+def reset() -> None:
+    """Forget which search tables exist (after migrations)."""
+    global _tables
+    _tables = None
+
+
+def _has_table(name: str) -> bool:
+    global _tables
+    if _tables is None:
+        _tables = set(connection.introspection.table_names())
+    return name in _tables
+
+
+def is_available() -> bool:
+    """True if this database has the doctor search table."""
+    return connection.vendor in ("sqlite", "postgresql") and _has_table(TABLE)
+
+
+def _appointment_fts() -> bool:
+    return connection.vendor == "sqlite" and _has_table(APPOINTMENT_TABLE)
+
+
+# ----- keeping the index in sync -----
+
+def _fields(doctor: DoctorProfile, user=None) -> List[str]:
+    user = user or doctor.user
+    name = f"{user.first_name} {user.last_name}".strip() or user.username
+    return [name, doctor.specialization or "", doctor.hospital.name, doctor.city or ""]
+
+
+def _write(rows) -> None:
+    """rows: [(doctor_id, [name, specialization, hospital, city])]"""
+    if not rows:
+        return
+    # one transaction: in autocommit mode every row would be its own commit
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            ids = [(doctor_id,) for doctor_id, _ in rows]
+            cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", ids)
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, name, specialization, hospital, city) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [(doctor_id, *fields) for doctor_id, fields in rows],
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (doctor_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'D')) "
+                "ON CONFLICT (doctor_id) DO UPDATE SET document = EXCLUDED.document",
+                [(doctor_id, *fields) for doctor_id, fields in rows],
+            )
+
+
+def index_doctor(doctor: DoctorProfile, user=None) -> None:
+    """(Re)index one doctor."""
+    if is_available():
+        _write([(doctor.id, _fields(doctor, user))])
+
+
+def index_doctors(doctors: Iterable[DoctorProfile]) -> int:
+    """(Re)index many doctors (user and hospital preloaded) in one batch."""
+    if not is_available():
+        return 0
+    rows = [(d.id, _fields(d)) for d in doctors]
+    _write(rows)
+    return len(rows)
+
+
+def remove_doctor(doctor_id: int) -> None:
+    if not is_available():
+        return
+    column = "rowid" if connection.vendor == "sqlite" else "doctor_id"
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE {column} = %s", [doctor_id])
+
+
+def rebuild(batch_size: int = 2000) -> int:
+    """Empty the index and fill it again from DoctorProfile."""
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    done = 0
+    batch = []
+    for doctor in DoctorProfile.objects.select_related("user", "hospital").order_by("id").iterator(chunk_size=batch_size):
+        batch.append(doctor)
+        if len(batch) >= batch_size:
+            done += index_doctors(batch)
+            batch = []
+    done += index_doctors(batch)
+    return done
+
+
+# ----- querying -----
+
+def _words(query: str) -> List[str]:
+    return _WORD.findall(query.lower())[:8]
+
+
+def search_ids(query: str, limit: Optional[int] = 200, status: Optional[str] = "Active") -> Optional[List[int]]:
+    """
+    Ids of doctors matching every word of query (as prefixes), best match
+    first. Returns None when the index is not available (use
+    fallback_filter then).
+    """
+    if not is_available():
+        return None
+    words = _words(query)
+    if not words:
+        return []
+
+    params = []
+    status_sql = ""
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{w}"*' for w in words)
+        weights = ", ".join(str(w) for w in WEIGHTS)
+        if status:
+            status_sql = "AND d.status = %s"
+        sql = (
+            f"SELECT s.rowid FROM {TABLE} s "
+            f"JOIN booking_doctorprofile d ON d.id = s.rowid "
+            f"WHERE {TABLE} MATCH %s {status_sql} "
+            f"ORDER BY bm25({TABLE}, {weights}), s.rowid"
+        )
+    else:
+        match = " & ".join(f"{w}:*" for w in words)
+        weights = "{" + ", ".join(str(w / WEIGHTS[0]) for w in reversed(WEIGHTS)) + "}"
+        if status:
+            status_sql = "AND d.status = %s"
+        sql = (
+            f"SELECT s.doctor_id FROM {TABLE} s "
+            f"JOIN booking_doctorprofile d ON d.id = s.doctor_id "
+            f"WHERE s.document @@ to_tsquery('simple', %s) {status_sql} "
+            f"ORDER BY ts_rank('{weights}', s.document, to_tsquery('simple', %s)) DESC, s.doctor_id"
+        )
+    params.append(match)
+    if status:
+        params.append(status)
+    if connection.vendor != "sqlite":
+        params.append(match)
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fallback_filter(query: str) -> Q:
+    """The old icontains search, for databases without the index."""
+    return (
+        Q(user__first_name__icontains=query)
+        | Q(user__last_name__icontains=query)
+        | Q(specialization__icontains=query)
+        | Q(hospital__name__icontains=query)
+        | Q(city__icontains=query)
+    )
+
+
+def search_doctors(query: str, limit: Optional[int] = 200, status: Optional[str] = "Active") -> List[DoctorProfile]:
+    """Matching doctors (user and hospital preloaded), best match first."""
+    doctors = DoctorProfile.objects.select_related("user", "hospital")
+    ids = search_ids(query, limit=limit, status=status)
+    if ids is None:
+        if status:
+            doctors = doctors.filter(status=status)
+        doctors = doctors.filter(fallback_filter(query))
+        return list(doctors[:limit] if limit else doctors)
+
+    by_id = doctors.in_bulk(ids)
+    return [by_id[i] for i in ids if i in by_id]
+
+
+# ----- appointments -----
+
+def index_appointments(rows, replace: bool = True) -> None:
+    """
+    rows: [(appointment_id, search_text)]; SQLite FTS only.
+    replace=False skips removing old entries (for new rows / a fresh index).
+    """
+    if not rows or not _appointment_fts():
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        if replace:
+            cursor.executemany(f"DELETE FROM {APPOINTMENT_TABLE} WHERE rowid = %s", [(i,) for i, _ in rows])
+        cursor.executemany(
+            f"INSERT INTO {APPOINTMENT_TABLE} (rowid, search_text) VALUES (%s, %s)",
+            list(rows),
+        )
+
+
+def remove_appointment(appointment_id: int) -> None:
+    if not _appointment_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {APPOINTMENT_TABLE} WHERE rowid = %s", [appointment_id])
+
+
+def refresh_appointment_text(appointments, batch_size: int = 2000) -> int:
+    """
+    Rebuild search_text of the given appointments (queryset), e.g. after a
+    patient or doctor was renamed. Only rows whose text changed are
+    written. Returns the number of rows changed.
+    """
+    changed = 0
+    batch = []
+
+    def flush():
+        # updated_at moves too, so incremental exports pick the rows up
+        now = timezone.now()
+        for appt in batch:
+            appt.updated_at = now
+        Appointment.objects.bulk_update(batch, ["search_text", "updated_at"])
+        index_appointments([(a.id, a.search_text) for a in batch])
+
+    qs = appointments.select_related("patient", "doctor", "doctor__user", "hospital", "department").order_by("id")
+    for appt in qs.iterator(chunk_size=batch_size):
+        text = appt.build_search_text()
+        if text != appt.search_text:
+            appt.search_text = text
+            batch.append(appt)
+        if len(batch) >= batch_size:
+            flush()
+            changed += len(batch)
+            batch = []
+    if batch:
+        flush()
+        changed += len(batch)
+    return changed
+
+
+def rebuild_appointment_index(batch_size: int = 5000) -> int:
+    """Refill the SQLite FTS table from Appointment.search_text."""
+    if not _appointment_fts():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {APPOINTMENT_TABLE}")
+    done = 0
+    batch = []
+    for row in Appointment.objects.order_by("id").values_list("id", "search_text").iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_appointments(batch, replace=False)
+            done += len(batch)
+            batch = []
+    index_appointments(batch, replace=False)
+    return done + len(batch)
+
+
+def appointment_filter(query: str) -> Q:
+    """Q matching appointments whose search text contains every term of query."""
+    terms = query.lower().split()[:8]
+    fts = _appointment_fts()
+    indexed = [t for t in terms if fts and len(t) >= MIN_INDEXED_TERM]
+
+    # search_text is lower-case, so a case-sensitive contains is enough
+    # (and can use the trigram index on PostgreSQL)
+    condition = Q()
+    for term in terms:
+        if term not in indexed:
+            condition &= Q(search_text__contains=term)
+    if indexed:
+        # each term is a quoted FTS string: a substring, punctuation included
+        match = " ".join('"' + t.replace('"', '""') + '"' for t in indexed)
+        condition &= Q(id__in=RawSQL(
+            f"SELECT rowid FROM {APPOINTMENT_TABLE} WHERE {APPOINTMENT_TABLE} MATCH %s",
+            [match],
+        ))
+    return condition
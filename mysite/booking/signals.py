@@ -1,13 +1,18 @@
+from typing import Dict, Tuple
+
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import (
     user_logged_in,
     user_logged_out,
     user_login_failed,
 )
-from django.db.models.signals import post_save, pre_delete
+from django.core.signals import request_finished
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import Appointment
+from . import directory, logsink, search, slots, stats
+from .models import Appointment, Department, DoctorProfile, Hospital
 from .utils import log_event
 
 
@@ -47,6 +52,13 @@ def log_user_logout(sender, request, user: User, **kwargs):
     )
 
 
+@receiver(post_delete, sender=User)
+def unlink_user_logs(sender, instance: User, **kwargs):
+    # buffered rows (e.g. of the user's cascaded appointments) can't point
+    # at the deleted user once they are written
+    logsink.forget_user(instance.id)
+
+
 @receiver(user_login_failed)
 def log_user_login_failed(sender, credentials, request, **kwargs):
     username = credentials.get("username") or "unknown"
@@ -58,20 +70,147 @@ def log_user_login_failed(sender, credentials, request, **kwargs):
     )
 
 
+# ---------- NAME CACHE ----------
+# Appointment log messages need the patient's username and the doctor's
+# name. Loading them on every save costs up to three SELECTs, so they are
+# taken from objects already loaded on the instance, or from this small
+# per-process cache (one query on a miss).
+
+NAME_CACHE_SIZE = 5000
+
+_user_names: Dict[int, Tuple[str, str]] = {}  # user id -> (username, full name)
+_doctor_users: Dict[int, int] = {}  # doctor profile id -> user id
+
+
+def _remember_user(user: User) -> None:
+    if len(_user_names) >= NAME_CACHE_SIZE:
+        _user_names.clear()
+    _user_names[user.id] = (user.username, user.get_full_name())
+
+
+def _appointment_names(instance: Appointment) -> Tuple[str, str]:
+    """(patient username, "Dr. Full Name") of an appointment."""
+    if Appointment.patient.is_cached(instance):
+        _remember_user(instance.patient)
+    if Appointment.doctor.is_cached(instance) and DoctorProfile.user.is_cached(instance.doctor):
+        _doctor_users[instance.doctor_id] = instance.doctor.user_id
+        _remember_user(instance.doctor.user)
+
+    doctor_user_id = _doctor_users.get(instance.doctor_id)
+    if instance.patient_id not in _user_names or doctor_user_id not in _user_names:
+        rows = User.objects.filter(
+            Q(id=instance.patient_id) | Q(doctorprofile__id=instance.doctor_id)
+        ).values("id", "username", "first_name", "last_name", "doctorprofile__id")
+        if len(_user_names) >= NAME_CACHE_SIZE:
+            _user_names.clear()
+        for row in rows:
+            full_name = f"{row['first_name']} {row['last_name']}".strip()
+            _user_names[row["id"]] = (row["username"], full_name)
+            if row["doctorprofile__id"] == instance.doctor_id:
+                _doctor_users[instance.doctor_id] = row["id"]
+                doctor_user_id = row["id"]
+
+    patient = _user_names.get(instance.patient_id)
+    doctor = _user_names.get(doctor_user_id)
+    patient_username = patient[0] if patient else "unknown"
+    doctor_name = f"Dr. {doctor[1]}" if doctor else "Unknown doctor"
+    return patient_username, doctor_name
+
+
+# User fields that appear in the doctor search, the directory and the
+# appointments' search text
+_NAME_FIELDS = ("first_name", "last_name", "username", "email")
+
+
+def _names(user: User) -> Tuple:
+    return tuple(user.__dict__.get(name) for name in _NAME_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_user_names(sender, instance: User, **kwargs):
+    instance._loaded_names = _names(instance)
+
+
+@receiver(post_save, sender=User)
+def refresh_user_name(sender, instance: User, created: bool, update_fields=None, **kwargs):
+    # names shown in appointment logs and the doctor search follow renames
+    _user_names.pop(instance.id, None)
+    if update_fields and not set(_NAME_FIELDS) & set(update_fields):
+        return  # e.g. the last_login update on every login
+    names = _names(instance)
+    if names == getattr(instance, "_loaded_names", None):
+        return  # saved, but not renamed (e.g. the doctor profile form)
+    instance._loaded_names = names
+    if created:
+        return  # no doctor profile yet
+    for doctor in DoctorProfile.objects.filter(user=instance).select_related("hospital"):
+        search.index_doctor(doctor, user=instance)
+        directory.invalidate()
+    search.refresh_appointment_text(
+        Appointment.objects.filter(Q(patient=instance) | Q(doctor__user=instance))
+    )
+
+
+# updated_at moves on every save, so it does not count as a change
+_IGNORED_ON_SAVE = {"updated_at"}
+
+
+def _is_noop_save(instance: Appointment, update_fields) -> bool:
+    """True if the save wrote back exactly the values that were loaded."""
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is None:
+        return False
+    if update_fields:
+        names = [Appointment._meta.get_field(name).attname for name in update_fields]
+    else:
+        names = list(loaded)
+    return all(
+        name in loaded and getattr(instance, name) == loaded[name]
+        for name in names
+        if name not in _IGNORED_ON_SAVE
+    )
+
+
+def _remember_saved_values(instance: Appointment, update_fields) -> None:
+    """Later saves of the same instance compare against what is stored now."""
+    if update_fields:
+        fields = [Appointment._meta.get_field(name) for name in update_fields]
+        saved = dict(getattr(instance, "_loaded_values", None) or {})
+    else:
+        fields = Appointment._meta.concrete_fields
+        saved = {}
+    for field in fields:
+        saved[field.attname] = getattr(instance, field.attname)
+    instance._loaded_values = saved
+
+
 # ---------- APPOINTMENT EVENTS ----------
 
 
+@receiver(pre_save, sender=Appointment)
+def note_appointment_saving(sender, instance: Appointment, **kwargs):
+    stats.note_appointment_saving(instance)
+
+
 @receiver(post_save, sender=Appointment)
-def log_appointment_save(sender, instance: Appointment, created: bool, **kwargs):
+def log_appointment_save(sender, instance: Appointment, created: bool, update_fields=None, **kwargs):
     """
     Logs creation and updates (status change, reschedule, etc.) of appointments.
+    Also keeps the cached availability of the doctor and the daily
+    counts in step.
+    Saves that changed nothing are not logged.
     """
-    patient_username = instance.patient.username if instance.patient else "unknown"
-    doctor_name = (
-        f"Dr. {instance.doctor.user.get_full_name()}"
-        if instance.doctor and instance.doctor.user
-        else "Unknown doctor"
-    )
+    if not created and _is_noop_save(instance, update_fields):
+        return
+
+    slots.note_appointment_saved(instance)
+    stats.note_appointment_saved(instance, created)
+    loaded = getattr(instance, "_loaded_values", None) or {}
+    if created or instance.search_text != loaded.get("search_text"):
+        search.index_appointments([(instance.id, instance.search_text)], replace=not created)
+    _remember_saved_values(instance, update_fields)
+
+    patient_username, doctor_name = _appointment_names(instance)
 
     if created:
         msg = (
@@ -82,7 +221,7 @@ def log_appointment_save(sender, instance: Appointment, created: bool, **kwargs)
         log_event(
             event_type="appointment_created",
             message=msg,
-            user=instance.patient,
+            user_id=instance.patient_id,
         )
     else:
         msg = (
@@ -93,20 +232,66 @@ def log_appointment_save(sender, instance: Appointment, created: bool, **kwargs)
         log_event(
             event_type="appointment_updated",
             message=msg,
-            user=instance.patient,
+            user_id=instance.patient_id,
         )
 
 
 @receiver(pre_delete, sender=Appointment)
 def log_appointment_deleted(sender, instance: Appointment, **kwargs):
-    patient_username = instance.patient.username if instance.patient else "unknown"
+    slots.note_appointment_deleted(instance)
+    stats.note_appointment_deleted(instance)
+    search.remove_appointment(instance.id)
+
+    patient_username, doctor_name = _appointment_names(instance)
     msg = (
         f"Appointment #{instance.id} deleted: "
-        f"{patient_username} → Dr. {instance.doctor.user.get_full_name() if instance.doctor and instance.doctor.user else 'Unknown'}."
+        f"{patient_username} → {doctor_name}."
     )
     log_event(
         event_type="appointment_deleted",
         message=msg,
-        user=instance.patient,
+        user_id=instance.patient_id,
     )
 
+
+# ---------- DOCTOR SEARCH INDEX + DIRECTORY ----------
+
+
+@receiver(post_save, sender=DoctorProfile)
+def index_doctor(sender, instance: DoctorProfile, created: bool, **kwargs):
+    search.index_doctor(instance)
+    directory.invalidate()
+    if not created and instance.specialization != getattr(instance, "_loaded_specialization", None):
+        search.refresh_appointment_text(Appointment.objects.filter(doctor=instance))
+    instance._loaded_specialization = instance.specialization
+
+
+@receiver(post_delete, sender=DoctorProfile)
+def unindex_doctor(sender, instance: DoctorProfile, **kwargs):
+    search.remove_doctor(instance.id)
+    directory.invalidate()
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_save, sender=Department)
+def rename_place(sender, instance, created: bool, **kwargs):
+    # hospital / department names appear in the directory, the doctor
+    # search and the appointments' search text
+    if created:
+        return  # nothing points at it yet
+    directory.invalidate()
+    field = "hospital" if sender is Hospital else "department"
+    search.index_doctors(DoctorProfile.objects.filter(**{field: instance}).select_related("user", "hospital"))
+    search.refresh_appointment_text(Appointment.objects.filter(**{field: instance}))
+
+
+# ---------- LOG BUFFER ----------
+
+
+@receiver(request_finished)
+def flush_system_logs(sender, **kwargs):
+    """
+    Runs after the response went out: write buffered SystemLog rows once
+    they have waited long enough (the buffer also flushes itself when full).
+    """
+    logsink.flush_if_due()
@@ -0,0 +1,454 @@
+"""
+Slot engine for doctor availability.
+
+Turns the schedule fields on DoctorProfile (working_days, clinic hours,
+break, slot_minutes) into a fixed grid of slot start times, then removes
+slots that are already taken by an Appointment.
+
+- The grid is the same for every working day of a doctor, so it is built
+  once per schedule and cached.
+- One day's state is a plain int bitmap over that grid (bit i set = slot i
+  is free), so checking / clearing a slot is a single bit operation.
+- Booked appointments for a whole date range (and many doctors) are read
+  with ONE query.
+"""
+import heapq
+import re
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from . import availability
+from .models import Appointment, DoctorProfile
+
+
+# Appointments in these states hold their slot.
+ACTIVE_STATUSES = Appointment.ACTIVE_STATUSES
+
+# Used when neither the doctor nor SystemSetting gives a slot length.
+DEFAULT_SLOT_MINUTES = 15
+
+DAY_NAMES = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+
+def parse_working_days(text: str) -> frozenset:
+    """
+    Parse the free-text working_days field into weekday numbers (Mon = 0).
+
+    Accepts things like "Mon-Fri", "Mon, Wed, Fri", "Monday to Saturday".
+    An empty value means the doctor works every day.
+    """
+    text = (text or "").strip().lower()
+    if not text:
+        return frozenset(range(7))
+
+    days = set()
+    # ranges first: "mon-fri", "mon to fri"
+    for start, end in re.findall(r"([a-z]{3})[a-z]*\s*(?:-|–|to)\s*([a-z]{3})[a-z]*", text):
+        if start in DAY_NAMES and end in DAY_NAMES:
+            i, j = DAY_NAMES[start], DAY_NAMES[end]
+            while True:
+                days.add(i)
+                if i == j:
+                    break
+                i = (i + 1) % 7
+
+    for word in re.findall(r"[a-z]+", text):
+        if word[:3] in DAY_NAMES:
+            days.add(DAY_NAMES[word[:3]])
+
+    return frozenset(days)
+
+
+def _minutes(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+
+def _slot_index(starts: Tuple[int, ...], slot_minutes: int, t: time) -> Optional[int]:
+    m = _minutes(t)
+    i = bisect_right(starts, m) - 1
+    if i >= 0 and m < starts[i] + slot_minutes:
+        return i
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _build_grid(start: time, end: time, break_start: Optional[time],
+                break_end: Optional[time], slot_minutes: int) -> Tuple[int, ...]:
+    """
+    Slot start times (in minutes from midnight) for one clinic day.
+    A slot is only kept if it fits fully before the break or clinic end.
+    """
+    s, e = _minutes(start), _minutes(end)
+    bs = _minutes(break_start) if break_start else None
+    be = _minutes(break_end) if break_end else None
+
+    grid = []
+    m = s
+    while m + slot_minutes <= e:
+        if bs is not None and be is not None and m < be and m + slot_minutes > bs:
+            # slot overlaps the break -> continue after the break
+            m = be
+            continue
+        grid.append(m)
+        m += slot_minutes
+    return tuple(grid)
+
+
+class DoctorGrid:
+    """
+    The slot grid of one doctor: which weekdays they work and the slot
+    start times (minutes from midnight) of a working day.
+    """
+
+    __slots__ = ("doctor_id", "weekdays", "starts", "slot_minutes", "full")
+
+    def __init__(self, doctor: DoctorProfile, default_minutes: int = DEFAULT_SLOT_MINUTES):
+        self.doctor_id = doctor.id
+        self.slot_minutes = doctor.slot_minutes or default_minutes or DEFAULT_SLOT_MINUTES
+        self.weekdays = parse_working_days(doctor.working_days)
+
+        if doctor.clinic_start_time and doctor.clinic_end_time:
+            self.starts = _build_grid(
+                doctor.clinic_start_time,
+                doctor.clinic_end_time,
+                doctor.break_start_time,
+                doctor.break_end_time,
+                self.slot_minutes,
+            )
+        else:
+            # schedule not filled in yet -> no bookable slots
+            self.starts = ()
+
+        # bitmap with every slot free
+        self.full = (1 << len(self.starts)) - 1
+
+    @property
+    def sig(self):
+        """Identifies the grid layout; cached bitmaps are only valid for the same sig."""
+        return (self.starts, self.slot_minutes)
+
+    def __bool__(self):
+        return bool(self.starts and self.weekdays)
+
+    def works_on(self, day: date) -> bool:
+        return bool(self.starts) and day.weekday() in self.weekdays
+
+    def index_of(self, t: time) -> Optional[int]:
+        """
+        Index of the slot that contains time t, or None if t falls outside
+        every slot (before opening, in the break, after closing).
+        """
+        return _slot_index(self.starts, self.slot_minutes, t)
+
+    def is_on_grid(self, t: time) -> bool:
+        """True if t is exactly a slot start time."""
+        i = self.index_of(t)
+        return i is not None and self.starts[i] == _minutes(t)
+
+    def day_bitmap(self, booked: Iterable[time] = ()) -> int:
+        """Free-slot bitmap for one day, given the booked times of that day."""
+        bits = self.full
+        for t in booked:
+            i = self.index_of(t)
+            if i is not None:
+                bits &= ~(1 << i)
+        return bits
+
+    def times(self, bits: int, after: Optional[time] = None) -> List[time]:
+        """Turn a bitmap back into slot start times (optionally only those after a time)."""
+        floor = _minutes(after) if after is not None else -1
+        out = []
+        i = 0
+        while bits:
+            if bits & 1 and self.starts[i] > floor:
+                m = self.starts[i]
+                out.append(time(m // 60, m % 60))
+            bits >>= 1
+            i += 1
+        return out
+
+
+def booked_times(doctor_ids: Iterable[int], start: date, end: date,
+                 exclude_appt_id: Optional[int] = None) -> Dict[Tuple[int, date], Set[time]]:
+    """
+    All active appointment times for the given doctors between start and end
+    (inclusive), read in ONE query. Keyed by (doctor_id, date).
+    """
+    qs = Appointment.objects.filter(
+        doctor_id__in=list(doctor_ids),
+        date__gte=start,
+        date__lte=end,
+        status__in=ACTIVE_STATUSES,
+    )
+    if exclude_appt_id:
+        qs = qs.exclude(id=exclude_appt_id)
+
+    booked: Dict[Tuple[int, date], Set[time]] = {}
+    for doctor_id, day, t in qs.values_list("doctor_id", "date", "time"):
+        booked.setdefault((doctor_id, day), set()).add(t)
+    return booked
+
+
+def _daterange(start: date, end: date):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def free_slots_for_doctors(doctors: Iterable[DoctorProfile], start: date, end: date,
+                           now: Optional[datetime] = None,
+                           default_minutes: int = DEFAULT_SLOT_MINUTES) -> Dict[int, Dict[date, List[time]]]:
+    """
+    Free slots for many doctors between start and end (inclusive).
+
+    Returns {doctor_id: {date: [time, ...]}}; days without free slots are
+    left out. Past days and already-passed slots of today are skipped.
+    Day bitmaps come from the availability cache; whatever is missing is
+    computed with one query no matter how many doctors or days.
+    """
+    now = timezone.localtime(now) if now else timezone.localtime()
+    today = now.date()
+    start = max(start, today)
+
+    grids = [DoctorGrid(d, default_minutes) for d in doctors]
+    result: Dict[int, Dict[date, List[time]]] = {g.doctor_id: {} for g in grids}
+    grids = [g for g in grids if g]
+    if not grids or start > end:
+        return result
+
+    bitmaps = _day_bitmaps(grids, start, end)
+
+    for g in grids:
+        days = result[g.doctor_id]
+        for day, bits in sorted(bitmaps[g.doctor_id].items()):
+            free = g.times(bits, after=now.time() if day == today else None)
+            if free:
+                days[day] = free
+    return result
+
+
+def _day_bitmaps(grids: List[DoctorGrid], start: date, end: date) -> Dict[int, Dict[date, int]]:
+    """
+    Free-slot bitmaps of every working day in [start, end] for each grid.
+    Cached days are reused (one cache read for all grids); the rest are
+    computed from ONE booked-slots query and written back to the cache.
+    """
+    bitmaps: Dict[int, Dict[date, int]] = {}
+    missing: Dict[int, List[date]] = {}
+
+    cached = availability.get_days_many({
+        g.doctor_id: (g.sig, [day for day in _daterange(start, end) if g.works_on(day)])
+        for g in grids
+    })
+    for doctor_id, (found, miss) in cached.items():
+        bitmaps[doctor_id] = found
+        if miss:
+            missing[doctor_id] = miss
+
+    if not missing:
+        return bitmaps
+
+    first = min(days[0] for days in missing.values())
+    last = max(days[-1] for days in missing.values())
+    booked = booked_times(missing.keys(), first, last)
+
+    fresh = {}
+    for g in grids:
+        days = {
+            day: g.day_bitmap(booked.get((g.doctor_id, day), ()))
+            for day in missing.get(g.doctor_id, ())
+        }
+        bitmaps[g.doctor_id].update(days)
+        fresh[g.doctor_id] = (g.sig, days)
+    availability.put_days_many(fresh)
+    return bitmaps
+
+
+def free_slots(doctor: DoctorProfile, start: date, end: date,
+               now: Optional[datetime] = None,
+               default_minutes: int = DEFAULT_SLOT_MINUTES) -> Dict[date, List[time]]:
+    """Free slots for one doctor between start and end: {date: [time, ...]}."""
+    return free_slots_for_doctors([doctor], start, end, now, default_minutes)[doctor.id]
+
+
+def earliest_available(doctors: Iterable[DoctorProfile], k: int,
+                       start: Optional[date] = None, horizon_days: int = 60,
+                       window_days: int = 7, distinct_doctors: bool = False,
+                       now: Optional[datetime] = None,
+                       default_minutes: int = DEFAULT_SLOT_MINUTES) -> List[Tuple[datetime, int]]:
+    """
+    The first k free slots across many doctors, soonest first:
+    [(slot_datetime, doctor_id), ...].
+
+    Every doctor gets a lazy generator of their free slots; heapq.merge pulls
+    from them in time order and we stop after k results. Bitmaps are loaded
+    in windows of window_days for all doctors at once (cache first, then one
+    query), and a window is only loaded when some generator reaches it, so
+    calendars are never materialised beyond what the first k slots need.
+
+    distinct_doctors=True keeps only the first slot of each doctor
+    ("which doctor can see me soonest").
+    """
+    now = timezone.localtime(now) if now else timezone.localtime()
+    today = now.date()
+    start = max(start or today, today)
+    end = start + timedelta(days=horizon_days - 1)
+
+    grids = [g for g in (DoctorGrid(d, default_minutes) for d in doctors) if g]
+    windows: Dict[int, Dict[int, Dict[date, int]]] = {}
+
+    def window(i: int) -> Dict[int, Dict[date, int]]:
+        if i not in windows:
+            w_start = start + timedelta(days=i * window_days)
+            w_end = min(w_start + timedelta(days=window_days - 1), end)
+            windows[i] = _day_bitmaps(grids, w_start, w_end)
+        return windows[i]
+
+    def stream(g: DoctorGrid):
+        for day in _daterange(start, end):
+            if not g.works_on(day):
+                continue
+            bits = window((day - start).days // window_days)[g.doctor_id].get(day, 0)
+            for t in g.times(bits, after=now.time() if day == today else None):
+                yield (datetime.combine(day, t), g.doctor_id)
+
+    merged = heapq.merge(*(stream(g) for g in grids))
+    if distinct_doctors:
+        merged = _first_per_doctor(merged)
+    return list(islice(merged, k))
+
+
+def _first_per_doctor(slots_iter):
+    seen = set()
+    for slot_dt, doctor_id in slots_iter:
+        if doctor_id not in seen:
+            seen.add(doctor_id)
+            yield slot_dt, doctor_id
+
+
+def is_slot_free(doctor: DoctorProfile, day: date, t: time,
+                 exclude_appt_id: Optional[int] = None,
+                 default_minutes: int = DEFAULT_SLOT_MINUTES) -> bool:
+    """
+    True if t is a slot start on one of the doctor's working days and no
+    active appointment holds that slot.
+    Doctors without a filled-in schedule accept any time (old behaviour).
+    """
+    grid = DoctorGrid(doctor, default_minutes)
+    if not grid:
+        return True
+    if not grid.works_on(day) or not grid.is_on_grid(t):
+        return False
+
+    booked = booked_times([doctor.id], day, day, exclude_appt_id=exclude_appt_id)
+    bits = grid.day_bitmap(booked.get((doctor.id, day), ()))
+    return bool(bits >> grid.index_of(t) & 1)
+
+
+class SlotTaken(Exception):
+    """The requested slot is already held by another active appointment."""
+
+
+def claim_slot(*, patient, doctor: DoctorProfile, day: date, t: time,
+               status: str = "Pending", **fields) -> Appointment:
+    """
+    Create an appointment (Pending by default) for (doctor, day, t) or raise SlotTaken.
+
+    The uniq_active_doctor_slot constraint on Appointment is what makes this
+    race-free: if two requests claim the same slot at the same moment, the
+    database lets exactly one INSERT through.
+    """
+    try:
+        with transaction.atomic():
+            return Appointment.objects.create(
+                patient=patient,
+                doctor=doctor,
+                date=day,
+                time=t,
+                status=status,
+                **fields,
+            )
+    except IntegrityError:
+        raise SlotTaken(f"Slot {day} {t:%H:%M} is already booked for doctor #{doctor.id}.")
+
+
+def move_slot(appt: Appointment, day: date, t: time, status: str) -> Appointment:
+    """
+    Move an existing appointment to another slot (reschedule) or raise SlotTaken.
+    """
+    old = (appt.date, appt.time, appt.status)
+    appt.date = day
+    appt.time = t
+    appt.status = status
+    try:
+        with transaction.atomic():
+            appt.save(update_fields=["date", "time", "status"])
+    except IntegrityError:
+        appt.date, appt.time, appt.status = old
+        raise SlotTaken(f"Slot {day} {t:%H:%M} is already booked for doctor #{appt.doctor_id}.")
+    return appt
+
+
+# ---------- CACHE UPDATES FROM APPOINTMENT SIGNALS ----------
+
+
+def _as_date(value) -> Optional[date]:
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def _as_time(value) -> Optional[time]:
+    return parse_time(value) if isinstance(value, str) else value
+
+
+def _update_cached_slot(doctor_id: int, day, t, free: bool) -> None:
+    entry = availability.get_entry(doctor_id)
+    day, t = _as_date(day), _as_time(t)
+    if entry is None or day is None or t is None:
+        return
+
+    starts, slot_minutes = entry["sig"]
+    i = _slot_index(starts, slot_minutes, t)
+    if i is None:
+        return
+    if free and starts[i] != _minutes(t):
+        # off-grid (old free-typed) booking; can't be sure the slot is
+        # really free now, so let the day be recomputed
+        availability.drop_day(doctor_id, day)
+        return
+    availability.set_bit(doctor_id, day, i, free)
+
+
+def note_appointment_saved(appt: Appointment) -> None:
+    """
+    Keep cached availability in step with one saved appointment:
+    free the slot it held before (if it moved or stopped being active)
+    and take the slot it holds now.
+    """
+    new = (appt.date, appt.time, appt.status)
+    old = getattr(appt, "_loaded_slot", None)
+    appt._loaded_slot = new
+
+    if old == new:
+        return
+    # cache is only touched once the change is really committed
+    if old and old[2] in ACTIVE_STATUSES:
+        transaction.on_commit(lambda: _update_cached_slot(appt.doctor_id, old[0], old[1], free=True))
+    if new[2] in ACTIVE_STATUSES:
+        transaction.on_commit(lambda: _update_cached_slot(appt.doctor_id, new[0], new[1], free=False))
+
+
+def note_appointment_deleted(appt: Appointment) -> None:
+    """Free the slot of an appointment that is being deleted."""
+    slot = getattr(appt, "_loaded_slot", None) or (appt.date, appt.time, appt.status)
+    if slot[2] in ACTIVE_STATUSES:
+        transaction.on_commit(lambda: _update_cached_slot(appt.doctor_id, slot[0], slot[1], free=True))
@@ -0,0 +1,191 @@
+"""
+Daily appointment counts (AppointmentDailyStats).
+
+One row per (date, doctor, hospital, status) holds how many appointments
+have that key. The appointment signals move an appointment's +1 from its
+old key to its new key whenever it is created, changes date / doctor /
+hospital / status, or is deleted. That costs one or two single-row
+writes in the same transaction as the appointment itself, so the counts
+can't drift from a committed change.
+
+Readers sum these rows instead of counting appointments; the cost grows
+with days x active doctors, not with the number of appointments.
+
+The old key of a saved appointment comes from the snapshot taken when it
+was loaded (Appointment._loaded_values). Only an instance saved without
+one (built by hand with an existing pk) costs an extra SELECT.
+
+rebuild() refills the table (or a date range of it) from Appointment,
+e.g. after rows were changed with queryset.update() or raw SQL.
+"""
+from datetime import date
+from typing import Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils.dateparse import parse_date
+
+from .models import Appointment, AppointmentDailyStats
+
+
+Key = Tuple[date, int, int, str]
+
+KEY_FIELDS = ("date", "doctor_id", "hospital_id", "status")
+
+REBUILD_BATCH_SIZE = 2000
+
+
+def _as_date(value) -> Optional[date]:
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def _key(values: dict) -> Key:
+    return (_as_date(values["date"]), values["doctor_id"], values["hospital_id"], values["status"])
+
+
+def _lookup(key: Key) -> dict:
+    day, doctor_id, hospital_id, status = key
+    return {"date": day, "doctor_id": doctor_id, "hospital_id": hospital_id, "status": status}
+
+
+def _add(key: Key) -> None:
+    lookup = _lookup(key)
+    if AppointmentDailyStats.objects.filter(**lookup).update(count=F("count") + 1):
+        return
+    try:
+        with transaction.atomic():
+            AppointmentDailyStats.objects.create(count=1, **lookup)
+    except IntegrityError:
+        # another request created the row first
+        AppointmentDailyStats.objects.filter(**lookup).update(count=F("count") + 1)
+
+
+def _remove(key: Key) -> None:
+    lookup = _lookup(key)
+    rows = AppointmentDailyStats.objects.filter(**lookup)
+    while True:
+        if rows.filter(count__gt=1).update(count=F("count") - 1):
+            return
+        # last one of its key: drop the row instead of keeping a zero
+        if rows.filter(count__lte=1).delete()[0]:
+            return
+        if not rows.exists():
+            return  # nothing counted under that key
+        # an _add() raised the count in between: decrement after all
+
+
+# ---------- UPDATES FROM APPOINTMENT SIGNALS ----------
+
+
+def note_appointment_saving(appt: Appointment) -> None:
+    """
+    pre_save: make sure the key stored in the database is known.
+    Loaded instances already carry it; anything else is read once.
+    """
+    if appt.pk is None:
+        return
+    loaded = getattr(appt, "_loaded_values", None) or {}
+    if all(name in loaded for name in KEY_FIELDS):
+        return
+    appt._stats_key = next(
+        (_key(row) for row in Appointment.objects.filter(pk=appt.pk).values(*KEY_FIELDS)),
+        None,
+    )
+
+
+def note_appointment_saved(appt: Appointment, created: bool) -> None:
+    """post_save: move the appointment's count from its old key to its new one."""
+    new = _key({name: getattr(appt, name) for name in KEY_FIELDS})
+    old = None
+    if not created:
+        loaded = getattr(appt, "_loaded_values", None) or {}
+        if all(name in loaded for name in KEY_FIELDS):
+            old = _key(loaded)
+        else:
+            old = getattr(appt, "_stats_key", None)
+
+    if old == new:
+        return
+    if old is not None:
+        _remove(old)
+    _add(new)
+
+
+def note_appointment_deleted(appt: Appointment) -> None:
+    """pre_delete: take the appointment's count away."""
+    loaded = getattr(appt, "_loaded_values", None) or {}
+    if all(name in loaded for name in KEY_FIELDS):
+        _remove(_key(loaded))
+    else:
+        _remove(_key({name: getattr(appt, name) for name in KEY_FIELDS}))
+
+
+# ---------- REBUILD ----------
+
+
+def rebuild(date_from: Optional[date] = None, date_to: Optional[date] = None,
+            batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """
+    Recount AppointmentDailyStats from Appointment, for all days or for
+    date_from..date_to (inclusive). Returns the number of rows written.
+    """
+    appointments = Appointment.objects.order_by()
+    existing = AppointmentDailyStats.objects.all()
+    if date_from:
+        appointments = appointments.filter(date__gte=date_from)
+        existing = existing.filter(date__gte=date_from)
+    if date_to:
+        appointments = appointments.filter(date__lte=date_to)
+        existing = existing.filter(date__lte=date_to)
+
+    rows = (
+        appointments
+        .values_list(*KEY_FIELDS)
+        .annotate(total=Count("id"))
+        .iterator(chunk_size=batch_size)
+    )
+
+    written = 0
+    with transaction.atomic():
+        existing.delete()
+        batch = []
+        for day, doctor_id, hospital_id, status, total in rows:
+            batch.append(AppointmentDailyStats(
+                date=day, doctor_id=doctor_id, hospital_id=hospital_id, status=status, count=total,
+            ))
+            if len(batch) >= batch_size:
+                AppointmentDailyStats.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        AppointmentDailyStats.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+# ---------- READING ----------
+
+
+def counts(date_from: Optional[date] = None, date_to: Optional[date] = None,
+           doctor_id: Optional[int] = None, hospital_id: Optional[int] = None,
+           status: Optional[str] = None):
+    """
+    AppointmentDailyStats rows matching the filters, unordered, ready for
+    .values(...).annotate(total=Sum("count")).
+    """
+    qs = AppointmentDailyStats.objects.order_by()
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+    if doctor_id:
+        qs = qs.filter(doctor_id=doctor_id)
+    if hospital_id:
+        qs = qs.filter(hospital_id=hospital_id)
+    if status:
+        qs = qs.filter(status=status)
+    return qs
+
+
+def total(**filters) -> int:
+    """Number of appointments matching the filters of counts()."""
+    return counts(**filters).aggregate(total=Sum("count"))["total"] or 0
@@ -1,3 +1,1456 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    availability, dataexports, directory, exportjobs, exports, imports, logsink, notifications, outbox, paging,
+    retention, search, signals, slots, stats, waitlist,
+)
+from .models import (
+    Appointment, AppointmentDailyStats, Department, DoctorProfile, ExportJob, Hospital, Notification,
+    NotificationCursor, OutboxEmail, SystemLog, SystemLogRollup, Waitlist,
+)
+from .utils import log_event
+
+
+# log rows are written on the spot, inside each test's transaction
+unbuffered_logs = override_settings(SYSTEM_LOG_BUFFERED=False)
+
+
+def make_patient(username: str = "pat") -> User:
+    return User.objects.create_user(username=username, email=f"{username}@example.com", password="pw")
+
+
+def make_doctor(username: str = "doc", **fields) -> DoctorProfile:
+    user = User.objects.create_user(username=username, email=f"{username}@example.com", password="pw")
+    defaults = dict(
+        registration_no="R-1",
+        specialization="Cardiology",
+        hospital=Hospital.for_name("City Hospital"),
+        city="Pune",
+        slot_preference="Morning",
+        bio="",
+        status="Active",
+        working_days="Mon,Tue,Wed,Thu,Fri,Sat,Sun",
+        clinic_start_time=time(9, 0),
+        clinic_end_time=time(12, 0),
+        slot_minutes=15,
+    )
+    defaults.update(fields)
+    return DoctorProfile.objects.create(user=user, **defaults)
+
+
+# ---------- HOSPITALS / DEPARTMENTS ----------
+
+
+@unbuffered_logs
+class HospitalDepartmentTests(TestCase):
+    def test_spellings_of_a_hospital_share_one_row(self):
+        hospital = Hospital.for_name("City Hospital")
+        self.assertEqual(hospital.slug, "cityhospital")
+        for name in ("  city-hospital ", "CITY HOSPITAL", "City_Hospital"):
+            self.assertEqual(Hospital.for_name(name), hospital)
+        self.assertEqual(Hospital.objects.get().name, "City Hospital")  # first spelling wins
+
+    def test_departments_are_per_hospital(self):
+        city, lake = Hospital.for_name("City Hospital"), Hospital.for_name("Lake Clinic")
+        cardiology = Department.for_name(city, "Cardiology")
+        self.assertEqual(Department.for_name(city, " cardiology"), cardiology)
+        self.assertNotEqual(Department.for_name(lake, "Cardiology"), cardiology)
+        self.assertEqual(cardiology.slug, "cardiology")
+
+    def test_doctor_and_appointments_point_at_the_rows(self):
+        doctor = make_doctor()
+        appt = Appointment.objects.create(
+            patient=make_patient(), doctor=doctor, date=timezone.localdate(), time=time(9, 0)
+        )
+        self.assertEqual((appt.hospital, appt.department), (doctor.hospital, doctor.department))
+        self.assertEqual(doctor.department.name, "Cardiology")
+
+        with mock.patch.object(Department, "for_name", wraps=Department.for_name) as for_name:
+            doctor.bio = "Twenty years of practice."
+            doctor.save()
+            for_name.assert_not_called()  # hospital and specialization unchanged
+            doctor.specialization = "Neurology"
+            doctor.save(update_fields=["specialization"])
+        doctor.refresh_from_db()
+        self.assertEqual(doctor.department.name, "Neurology")
+        self.assertEqual(doctor.department.hospital, doctor.hospital)
+
+
+# ---------- DIRECTORY ----------
+
+
+@unbuffered_logs
+class DirectoryTests(TestCase):
+    departments_url = "/hospital/cityhospital/departments/"
+    doctors_url = "/hospital/cityhospital/cardiology/doctors/"
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.client.force_login(make_patient())
+
+    def test_departments_need_a_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.departments_url).status_code, 302)
+
+    @mock.patch.object(directory, "VERSION_CHECK_SECONDS", 60)
+    def test_matching_etag_gets_a_304_without_queries(self):
+        response = self.client.get(self.doctors_url)
+        self.assertEqual(response.json()["doctors"][0]["id"], self.doctor.id)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.doctors_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.departments_url)
+        self.assertEqual(response.json(), {"departments": [{"name": "Cardiology", "slug": "cardiology"}]})
+        response = self.client.get(self.departments_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_in_this_process_is_served_at_once(self):
+        etag = self.client.get(self.doctors_url)["ETag"]
+        self.doctor.status = "Inactive"
+        self.doctor.save()
+        response = self.client.get(self.doctors_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"doctors": []})
+
+    def test_change_made_by_another_process_is_picked_up(self):
+        self.assertEqual(len(directory.get().doctors), 1)
+        # what another worker / import_csv leaves behind: new rows and a new
+        # version in the shared cache, while this process keeps its copy
+        DoctorProfile.objects.filter(id=self.doctor.id).update(status="Inactive")
+        cache.set(directory.VERSION_KEY, "changed elsewhere", None)
+        self.assertEqual(len(directory.get().doctors), 1)  # within VERSION_CHECK_SECONDS
+        with mock.patch.object(directory, "_checked_until", 0.0):  # ... and later
+            self.assertEqual(directory.get().doctors, {})
+
+
+# ---------- SLOTS ----------
+
+
+@unbuffered_logs
+class DoctorFreeSlotsViewTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.client.force_login(make_patient())
+        self.url = reverse("doctor_free_slots", args=[self.doctor.id])
+
+    def test_lists_free_slots(self):
+        start = timezone.localdate() + timedelta(days=1)
+        response = self.client.get(self.url, {"start": start.isoformat(), "days": 1})
+        self.assertEqual(response.status_code, 200)
+        day = response.json()["slots"][0]
+        self.assertEqual(day["date"], start.isoformat())
+        self.assertEqual(day["times"][0], "09:00")
+
+    def test_impossible_start_date_is_a_bad_request(self):
+        response = self.client.get(self.url, {"start": "2024-02-30"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_or_garbled_start_falls_back_to_today(self):
+        for params in ({}, {"start": "soon"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+
+
+@unbuffered_logs
+class DepartmentAvailabilityViewTests(TestCase):
+    url = "/hospital/cityhospital/cardiology/availability/"
+
+    def setUp(self):
+        availability._local.clear()  # doctor ids come back after each test's rollback
+        self.client.force_login(make_patient())
+        self.in_two_days = timezone.localdate() + timedelta(days=2)
+        self.every_day = make_doctor("every")
+        self.one_day = make_doctor("one", working_days=self.in_two_days.strftime("%a"))
+        make_doctor("new", status="Pending")
+        slots.claim_slot(patient=make_patient("other"), doctor=self.one_day, day=self.in_two_days, t=time(9, 0))
+
+    def test_soonest_doctor_first_with_n_free_slots(self):
+        response = self.client.get(self.url, {"n": 3, "days": 3})
+        doctors = response.json()["doctors"]
+        self.assertEqual([d["id"] for d in doctors], [self.every_day.id, self.one_day.id])
+        self.assertEqual([len(d["next_slots"]) for d in doctors], [3, 3])
+        self.assertEqual(
+            doctors[1]["next_slots"][0], {"date": self.in_two_days.isoformat(), "time": "09:15"}
+        )
+
+    def test_doctor_without_free_slots_comes_last(self):
+        response = self.client.get(self.url, {"days": 1})
+        doctors = response.json()["doctors"]
+        self.assertEqual([d["id"] for d in doctors][-1], self.one_day.id)
+        self.assertEqual(doctors[-1]["next_slots"], [])
+
+    def test_query_count_does_not_grow_with_doctors(self):
+        def cached_request():
+            self.client.get(self.url)  # fills the shared cache
+            availability._local.clear()  # as seen from another process
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+            return response, len(queries)
+
+        _, two_doctors = cached_request()
+        for n in range(5):
+            make_doctor(f"more{n}")
+        response, seven_doctors = cached_request()
+        self.assertEqual(len(response.json()["doctors"]), 7)
+        self.assertEqual(seven_doctors, two_doctors)
+
+
+@unbuffered_logs
+class ClaimSlotTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def test_second_claim_of_an_active_slot_is_refused(self):
+        slots.claim_slot(patient=make_patient("a"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        with self.assertRaises(slots.SlotTaken):
+            slots.claim_slot(patient=make_patient("b"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_cancelled_appointment_frees_the_slot(self):
+        first = slots.claim_slot(patient=make_patient("a"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        first.status = "Cancelled"
+        first.save()
+        slots.claim_slot(patient=make_patient("b"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        self.assertFalse(slots.is_slot_free(self.doctor, self.day, time(9, 0)))
+
+    def test_move_onto_a_taken_slot_keeps_the_old_slot(self):
+        slots.claim_slot(patient=make_patient("a"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        appt = slots.claim_slot(patient=make_patient("b"), doctor=self.doctor, day=self.day, t=time(9, 15))
+        with self.assertRaises(slots.SlotTaken):
+            slots.move_slot(appt, self.day, time(9, 0), "Rescheduled")
+        self.assertEqual((appt.time, appt.status), (time(9, 15), "Pending"))
+        appt.refresh_from_db()
+        self.assertEqual((appt.time, appt.status), (time(9, 15), "Pending"))
+
+    def test_move_to_a_free_slot(self):
+        appt = slots.claim_slot(patient=make_patient("a"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        slots.move_slot(appt, self.day, time(10, 0), "Rescheduled")
+        self.assertTrue(slots.is_slot_free(self.doctor, self.day, time(9, 0)))
+        self.assertFalse(slots.is_slot_free(self.doctor, self.day, time(10, 0)))
+
+
+@unbuffered_logs
+class AvailabilityCacheTests(TestCase):
+    def setUp(self):
+        availability._local.clear()  # doctor ids come back after each test's rollback
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.localdate() + timedelta(days=1)
+        slots.free_slots(self.doctor, self.day, self.day)  # fills the cache
+
+    def cached_free(self):
+        with self.assertNumQueries(0):  # served from the in-process copy
+            return slots.free_slots(self.doctor, self.day, self.day)[self.day][:2]
+
+    def claim(self, t):
+        with self.captureOnCommitCallbacks(execute=True):
+            return slots.claim_slot(patient=self.patient, doctor=self.doctor, day=self.day, t=t)
+
+    def test_booking_takes_the_cached_slot(self):
+        self.claim(time(9, 0))
+        self.assertEqual(self.cached_free(), [time(9, 15), time(9, 30)])
+
+    def test_cancel_and_move_free_the_cached_slot(self):
+        appt = self.claim(time(9, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            slots.move_slot(appt, self.day, time(9, 15), "Rescheduled")
+        self.assertEqual(self.cached_free(), [time(9, 0), time(9, 30)])
+        with self.captureOnCommitCallbacks(execute=True):
+            appt.status = "Cancelled"
+            appt.save()
+        self.assertEqual(self.cached_free(), [time(9, 0), time(9, 15)])
+
+    def test_refused_claim_leaves_the_cache_alone(self):
+        self.claim(time(9, 0))
+        with self.assertRaises(slots.SlotTaken):
+            self.claim(time(9, 0))
+        self.assertEqual(self.cached_free(), [time(9, 15), time(9, 30)])
+
+    def test_schedule_edit_drops_the_doctor_entry(self):
+        self.client.force_login(self.doctor.user)
+        self.client.post(reverse("doctor_schedule"), {
+            "working_days": "Mon,Tue,Wed,Thu,Fri,Sat,Sun",
+            "clinic_start_time": "10:00",
+            "clinic_end_time": "12:00",
+            "slot_minutes": "30",
+        })
+        self.assertIsNone(availability.get_entry(self.doctor.id))
+        self.doctor.refresh_from_db()
+        free = slots.free_slots(self.doctor, self.day, self.day)[self.day]
+        self.assertEqual(free[:2], [time(10, 0), time(10, 30)])
+
+
+@unbuffered_logs
+class FindDoctorViewTests(TestCase):
+    def setUp(self):
+        self.client.force_login(make_patient())
+        in_three_days = (timezone.localdate() + timedelta(days=3)).strftime("%a")
+        for username, first, fields in (
+            ("carl", "Carl", {"clinic_start_time": None, "clinic_end_time": None}),  # no schedule yet
+            ("aaron", "Aaron", {"working_days": in_three_days}),
+            ("bella", "Bella", {}),  # works every day
+        ):
+            doctor = make_doctor(username, **fields)
+            doctor.user.first_name = first
+            doctor.user.save()
+
+    def names(self, response):
+        return [d.user.first_name for d in response.context["doctors"]]
+
+    def test_soonest_sorts_by_first_free_slot(self):
+        response = self.client.get(reverse("find_doctor"), {"sort": "soonest"})
+        self.assertEqual(self.names(response), ["Bella", "Aaron", "Carl"])
+        self.assertIsNone(response.context["doctors"][-1].next_slot)
+
+    def test_soonest_search_results(self):
+        response = self.client.get(reverse("find_doctor"), {"q": "cardiology", "sort": "soonest"})
+        self.assertEqual(self.names(response), ["Bella", "Aaron", "Carl"])
+
+    @mock.patch("booking.views.FIND_DOCTOR_PAGE_SIZE", 2)
+    def test_soonest_looks_at_one_page_of_doctors(self):
+        with mock.patch.object(slots, "earliest_available", wraps=slots.earliest_available) as earliest:
+            response = self.client.get(reverse("find_doctor"), {"sort": "soonest"})
+        self.assertEqual(len(earliest.call_args.args[0]), 2)
+        self.assertEqual(self.names(response), ["Bella", "Aaron"])
+        page = response.context["page"]
+        response = self.client.get(reverse("find_doctor") + f"?{page.query}&after={page.next_token}")
+        self.assertEqual(self.names(response), ["Carl"])
+
+
+@unbuffered_logs
+class RescheduleViewTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor(working_days="Mon,Tue,Wed,Thu,Fri")
+        self.patient = make_patient()
+        self.day = timezone.localdate() + timedelta(days=1)
+        while self.day.weekday() >= 5:
+            self.day += timedelta(days=1)
+        self.appt = slots.claim_slot(patient=self.patient, doctor=self.doctor, day=self.day, t=time(9, 0))
+
+    def move(self, url_name, day, t):
+        self.client.post(reverse(url_name, args=[self.appt.id]), {"date": day.isoformat(), "time": t})
+        self.appt.refresh_from_db()
+        return self.appt.date, self.appt.time
+
+    def test_patient_cannot_move_off_the_schedule(self):
+        self.client.force_login(self.patient)
+        saturday = self.day + timedelta(days=5 - self.day.weekday())
+        # off the grid, after hours, a day off, inside a booking that starts off the grid
+        Appointment.objects.create(patient=make_patient("b"), doctor=self.doctor, date=self.day, time=time(10, 5))
+        for day, t in ((self.day, "09:07"), (self.day, "13:00"), (saturday, "09:00"), (self.day, "10:00")):
+            self.assertEqual(self.move("reschedule_appointment", day, t), (self.day, time(9, 0)), (day, t))
+        self.assertEqual(self.move("reschedule_appointment", self.day, "09:15"), (self.day, time(9, 15)))
+
+    def test_doctor_cannot_move_off_the_schedule(self):
+        self.client.force_login(self.doctor.user)
+        self.assertEqual(self.move("doctor_reschedule", self.day, "09:07"), (self.day, time(9, 0)))
+        self.assertEqual(self.move("doctor_reschedule", self.day, "11:45"), (self.day, time(11, 45)))
+
+
+@unbuffered_logs
+class ClaimSlotRaceTests(TransactionTestCase):
+    THREADS = 8
+
+    def test_concurrent_claims_of_one_slot_have_one_winner(self):
+        doctor = make_doctor()
+        patients = [make_patient(f"p{i}") for i in range(self.THREADS)]
+        day = timezone.localdate() + timedelta(days=1)
+        start = threading.Barrier(self.THREADS)
+        won, taken, errors = [], [], []
+
+        def claim(patient):
+            try:
+                start.wait()
+                slots.claim_slot(patient=patient, doctor=doctor, day=day, t=time(9, 0))
+                won.append(patient.id)
+            except slots.SlotTaken:
+                taken.append(patient.id)
+            except Exception as exc:  # reported below, not lost in the thread
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim, args=(p,)) for p in patients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(won), 1)
+        self.assertEqual(len(taken), self.THREADS - 1)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor, date=day, time=time(9, 0)).count(), 1)
+
+
+# ---------- APPOINTMENT SIGNALS ----------
+
+
+@unbuffered_logs
+class AppointmentSaveQueryTests(TestCase):
+    def setUp(self):
+        doctor = make_doctor()
+        appt = slots.claim_slot(patient=make_patient(), doctor=doctor, day=timezone.localdate() + timedelta(days=1), t=time(9, 0))
+        self.appt = Appointment.objects.get(id=appt.id)  # as a view would load it
+
+    def test_noop_save_is_only_the_update(self):
+        with self.assertNumQueries(1):
+            self.appt.save(update_fields=["status"])
+        with self.assertNumQueries(1):
+            self.appt.save()
+        self.assertFalse(SystemLog.objects.filter(event_type="appointment_updated").exists())
+
+    def test_status_change_needs_no_name_lookups(self):
+        # the UPDATE, the daily counts (old key down: 2, new key up: 4
+        # with the savepoint around the INSERT) and the log row
+        with self.assertNumQueries(8):
+            self.appt.status = "Approved"
+            self.appt.save(update_fields=["status"])
+        message = SystemLog.objects.get(event_type="appointment_updated").message
+        self.assertIn("pat → Dr. ", message)
+        self.assertIn("status=Approved", message)
+
+    def test_cold_name_cache_costs_one_query(self):
+        signals._user_names.clear()
+        signals._doctor_users.clear()
+        with self.assertNumQueries(9):
+            self.appt.status = "Approved"
+            self.appt.save(update_fields=["status"])
+
+
+# ---------- DAILY STATS ----------
+
+
+@unbuffered_logs
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.appts = [
+            slots.claim_slot(patient=make_patient(f"p{n}"), doctor=self.doctor, day=self.day, t=time(9, 15 * n))
+            for n in range(3)
+        ]
+
+    def counts(self):
+        return dict(AppointmentDailyStats.objects.values_list("status", "count"))
+
+    def test_counts_follow_saves_and_deletes(self):
+        self.assertEqual(self.counts(), {"Pending": 3})
+        self.appts[0].status = "Approved"
+        self.appts[0].save()
+        self.appts[1].delete()
+        self.assertEqual(self.counts(), {"Pending": 1, "Approved": 1})
+        self.assertEqual(stats.total(status="Pending"), 1)
+        self.appts[2].status = "Cancelled"
+        self.appts[2].save()
+        self.assertEqual(self.counts(), {"Approved": 1, "Cancelled": 1})  # no zero rows
+
+    def test_remove_racing_an_add_keeps_the_added_count(self):
+        self.appts[0].status = "Approved"
+        self.appts[0].save()
+        key = (self.day, self.doctor.id, self.doctor.hospital_id, "Approved")
+        row = AppointmentDailyStats.objects.get(status="Approved")
+        original_update = type(AppointmentDailyStats.objects.all()).update
+        raced = []
+
+        def update_then_add(qs, **kwargs):
+            n = original_update(qs, **kwargs)
+            if not raced:  # another request's _add() commits right after the decrement missed
+                raced.append(True)
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {AppointmentDailyStats._meta.db_table} SET count = count + 1 WHERE id = %s",
+                        [row.id],
+                    )
+            return n
+
+        with mock.patch("django.db.models.query.QuerySet.update", update_then_add):
+            stats._remove(key)
+        self.assertEqual(self.counts()["Approved"], 1)
+
+    def test_rebuild_recounts_after_bulk_updates(self):
+        Appointment.objects.filter(id=self.appts[0].id).update(status="Completed")  # no signals
+        other_day = self.day + timedelta(days=1)
+        Appointment.objects.filter(id=self.appts[1].id).update(date=other_day)
+        stats.rebuild(date_from=other_day)
+        self.assertEqual(stats.total(date_to=self.day), 3)  # outside the range: untouched
+        call_command("rebuild_appointment_stats", stdout=mock.Mock())
+        self.assertEqual(
+            sorted(AppointmentDailyStats.objects.values_list("date", "status", "count")),
+            [(self.day, "Completed", 1), (self.day, "Pending", 1), (other_day, "Pending", 1)],
+        )
+
+    def test_rebuild_command_rejects_an_impossible_date(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_appointment_stats", "--from", "2024-02-30", stdout=mock.Mock())
+
+
+# ---------- DOCTOR SEARCH ----------
+
+
+@unbuffered_logs
+class DoctorSearchTests(TestCase):
+    def doctor(self, username, first, last, **fields):
+        doctor = make_doctor(username, **fields)
+        doctor.user.first_name, doctor.user.last_name = first, last
+        doctor.user.save()
+        return doctor
+
+    def setUp(self):
+        self.asha = self.doctor("asha", "Asha", "Sharma", city="Pune")  # Cardiology, City Hospital
+        self.ravi = self.doctor("ravi", "Ravi", "Cardoso", specialization="Neurology", city="London")
+        self.new = self.doctor("nina", "Nina", "Cardwell", status="Pending")
+
+    def names(self, query, **kwargs):
+        return [d.user.last_name for d in search.search_doctors(query, **kwargs)]
+
+    def test_words_are_prefixes_and_names_rank_first(self):
+        self.assertEqual(self.names("card"), ["Cardoso", "Sharma"])
+        self.assertEqual(self.names("card pun"), ["Sharma"])
+        self.assertEqual(self.names("city hosp neuro"), ["Cardoso"])
+        with_pending = self.names("card", status=None)
+        self.assertCountEqual(with_pending[:2], ["Cardoso", "Cardwell"])  # name matches
+        self.assertEqual(with_pending[2:], ["Sharma"])
+
+    def test_index_follows_renames_and_deletes(self):
+        self.ravi.user.last_name = "Menon"
+        self.ravi.user.save()
+        hospital = self.asha.hospital
+        hospital.name = "Sunrise Clinic"
+        hospital.save()
+        self.assertEqual(self.names("card"), ["Sharma"])
+        self.assertCountEqual(self.names("sunrise"), ["Menon", "Sharma"])
+        self.asha.delete()
+        self.assertEqual(self.names("sunrise"), ["Menon"])
+
+    def test_rebuild_refills_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.TABLE}")
+        self.assertEqual(self.names("card"), [])
+        self.assertEqual(search.rebuild(batch_size=2), 3)
+        self.assertEqual(self.names("card"), ["Cardoso", "Sharma"])
+
+    @mock.patch.object(search, "is_available", return_value=False)
+    def test_fallback_without_the_index(self, is_available):
+        self.assertEqual(self.names("Cardiology"), ["Sharma"])
+
+    @mock.patch("booking.views.AUTOCOMPLETE_LIMIT", 1)
+    def test_autocomplete(self):
+        url = reverse("doctor_autocomplete")
+        self.assertEqual(self.client.get(url, {"q": "ca"}).status_code, 302)  # login first
+        self.client.force_login(make_patient())
+        self.assertEqual(self.client.get(url, {"q": "c"}).json(), {"results": []})
+        results = self.client.get(url, {"q": "ca"}).json()["results"]
+        self.assertEqual(results, [{
+            "id": self.ravi.id,
+            "name": "Dr. Ravi Cardoso",
+            "specialization": "Neurology",
+            "hospital": "City Hospital",
+            "city": "London",
+            "url": reverse("book_appointment", args=[self.ravi.id]),
+        }])
+
+
+# ---------- ADMIN APPOINTMENT SEARCH ----------
+
+
+@unbuffered_logs
+class AppointmentSearchTests(TestCase):
+    def setUp(self):
+        doctor = make_doctor()
+        doctor.user.first_name, doctor.user.last_name = "Anil", "Kapoor"
+        doctor.user.save()
+        patient = make_patient("priya.sharma")
+        patient.first_name, patient.last_name = "Priya", "Sharma"
+        patient.save()
+        self.appt = slots.claim_slot(patient=patient, doctor=doctor, day=timezone.localdate() + timedelta(days=1), t=time(9, 0))
+        slots.claim_slot(patient=make_patient("rahul"), doctor=doctor, day=timezone.localdate() + timedelta(days=1), t=time(9, 15))
+
+    def ids(self, query):
+        return list(Appointment.objects.filter(search.appointment_filter(query)).values_list("id", flat=True))
+
+    def test_terms_match_anywhere_in_the_text(self):
+        for query in ("arma", "PRIYA card", "ya.sh", "a@example.com kapoor", "ri sh"):
+            self.assertEqual(self.ids(query), [self.appt.id], query)
+        self.assertEqual(self.ids("sharma zzz"), [])
+        self.assertEqual(len(self.ids("")), 2)
+
+    def test_save_without_a_rename_leaves_the_text_alone(self):
+        patient = User.objects.get(id=self.appt.patient_id)
+        with mock.patch.object(search, "refresh_appointment_text") as refresh:
+            patient.save()
+            patient.last_login = timezone.now()
+            patient.save()
+            patient.email = "new@example.com"
+            patient.save()
+            patient.save()
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_rename_refreshes_text_and_updated_at(self):
+        before = Appointment.objects.get(id=self.appt.id).updated_at
+        patient = self.appt.patient
+        patient.last_name = "Verma"
+        patient.save()
+        self.assertEqual(self.ids("verma"), [self.appt.id])
+        self.assertGreater(Appointment.objects.get(id=self.appt.id).updated_at, before)
+
+
+# ---------- WAITLIST ----------
+
+
+@unbuffered_logs
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.day = timezone.localdate() + timedelta(days=2)
+        self.booked = slots.claim_slot(patient=make_patient("a"), doctor=self.doctor, day=self.day, t=time(9, 0))
+        self.first = waitlist.join(make_patient("w1"), self.doctor, self.day, self.day + timedelta(days=1))
+        self.second = waitlist.join(make_patient("w2"), self.doctor, self.day - timedelta(days=1), self.day)
+
+    def cancel_booked(self):
+        self.booked.status = "Cancelled"
+        self.booked.save(update_fields=["status"])
+        return waitlist.slot_freed(self.booked)
+
+    def test_freed_slot_is_offered_to_the_first_waiter(self):
+        offered = self.cancel_booked()
+        self.assertEqual(offered.id, self.first.id)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, "Offered")
+        self.assertEqual(self.first.appointment.status, "Offered")
+        self.assertFalse(slots.is_slot_free(self.doctor, self.day, time(9, 0)))
+
+    def test_waiter_outside_the_date_window_is_skipped(self):
+        self.first.date_from = self.first.date_to = self.day + timedelta(days=1)
+        self.first.save()
+        self.assertEqual(self.cancel_booked().id, self.second.id)
+
+    def test_accept_turns_the_offer_into_a_pending_appointment(self):
+        self.cancel_booked()
+        appt = Appointment.objects.get(status="Offered")
+        waitlist.accept_offer(appt)
+        appt.refresh_from_db()
+        self.first.refresh_from_db()
+        self.assertEqual((appt.status, self.first.status), ("Pending", "Booked"))
+        # the daily counts followed the status change
+        counts = dict(AppointmentDailyStats.objects.filter(date=self.day).values_list("status", "count"))
+        self.assertEqual(counts, {"Cancelled": 1, "Pending": 1})
+
+    def test_expire_passes_the_slot_on(self):
+        self.cancel_booked()
+        later = timezone.now() + timedelta(minutes=waitlist.OFFER_MINUTES + 1)
+        new_offers = waitlist.expire_offers(later)
+        self.assertEqual([e.id for e in new_offers], [self.second.id])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, "Expired")
+        self.assertEqual(self.first.appointment.status, "Cancelled")
+
+    def test_accepting_an_expired_offer_notifies_the_next_waiter(self):
+        self.cancel_booked()
+        appt = Appointment.objects.get(status="Offered")
+        later = timezone.now() + timedelta(minutes=waitlist.OFFER_MINUTES + 1)
+        with self.assertRaises(waitlist.OfferUnavailable):
+            waitlist.accept_offer(appt, now=later)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.status, "Offered")
+        self.assertTrue(Notification.objects.filter(user=self.second.patient).exists())
+
+    def test_accept_racing_an_expire_is_refused(self):
+        self.cancel_booked()
+        appt = Appointment.objects.get(status="Offered")
+        later = timezone.now() + timedelta(minutes=waitlist.OFFER_MINUTES + 1)
+
+        def expire_first(*args, **kwargs):
+            # an expire run commits between accept_offer's checks and its writes
+            patcher.stop()
+            waitlist.expire_offers(later)
+            return transaction.atomic(*args, **kwargs)
+
+        patcher = mock.patch("django.db.transaction.atomic", expire_first)
+        patcher.start()
+        with self.assertRaises(waitlist.OfferUnavailable):
+            waitlist.accept_offer(appt)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.status, "Offered")
+        self.assertEqual(
+            sorted(Appointment.objects.filter(date=self.day).values_list("status", flat=True)),
+            ["Cancelled", "Cancelled", "Offered"],
+        )
+
+    def test_expire_that_fails_midway_keeps_the_offer_open(self):
+        self.cancel_booked()
+        later = timezone.now() + timedelta(minutes=waitlist.OFFER_MINUTES + 1)
+        with mock.patch.object(Appointment, "save", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                waitlist.expire_offers(later)
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.status, self.first.appointment.status), ("Offered", "Offered"))
+
+    def test_accepting_an_expired_offer_leaves_other_offers_alone(self):
+        other_doctor = make_doctor("doc2")
+        other = waitlist.join(make_patient("w4"), other_doctor, self.day, self.day)
+        waitlist.offer_slot(other_doctor, self.day, time(9, 0))
+        self.cancel_booked()
+        appt = Appointment.objects.get(doctor=self.doctor, status="Offered")
+        later = timezone.now() + timedelta(minutes=waitlist.OFFER_MINUTES + 1)
+        with self.assertRaises(waitlist.OfferUnavailable):
+            waitlist.accept_offer(appt, now=later)
+        other.refresh_from_db()
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.status, other.status), ("Expired", "Offered"))
+
+    def test_offers_go_to_the_oldest_fitting_waiters(self):
+        Waitlist.objects.update(status="Cancelled")
+        for n in range(waitlist.OFFER_BATCH + 5):
+            # queued first, but none of these windows contains the freed day
+            waitlist.join(make_patient(f"x{n}"), self.doctor, self.day + timedelta(days=3), self.day + timedelta(days=4))
+        late = waitlist.join(make_patient("late"), self.doctor, self.day, self.day)
+        waitlist.join(make_patient("later"), self.doctor, self.day, self.day)
+        self.assertEqual(self.cancel_booked().id, late.id)
+
+    def test_join_rejects_an_impossible_date(self):
+        self.client.force_login(make_patient("w3"))
+        response = self.client.post(
+            reverse("join_waitlist", args=[self.doctor.id]),
+            {"date_from": "2024-02-30", "date_to": "2024-03-01"},
+        )
+        self.assertRedirects(response, reverse("book_appointment", args=[self.doctor.id]), fetch_redirect_response=False)
+        self.assertEqual(Waitlist.objects.count(), 2)
+
+
+# ---------- NOTIFICATIONS ----------
+
+
+@unbuffered_logs
+class NotifyManyTests(TestCase):
+    def notify_users(self, prefix, n):
+        users = User.objects.bulk_create(
+            User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com") for i in range(n)
+        )
+        items = [(user, "Clinic closed on Friday", "/news/") for user in users]
+        with CaptureQueriesContext(connection) as queries:
+            notifications.notify_many(items)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_users(self):
+        self.assertEqual(self.notify_users("many", 30), self.notify_users("few", 3))
+        self.assertEqual(Notification.objects.count(), 33)
+        self.assertEqual(OutboxEmail.objects.filter(status="Pending").count(), 33)
+
+    def test_items_without_a_user_or_email(self):
+        quiet = make_patient("quiet")
+        quiet.email = ""
+        quiet.save()
+        notes = notifications.notify_many([
+            (None, "nobody", ""),
+            (quiet, "x" * 300, None),
+            (make_patient(), "hello", "/here/"),
+        ])
+        self.assertEqual([(len(n.message), n.link) for n in notes], [(255, ""), (5, "/here/")])
+        self.assertEqual(list(OutboxEmail.objects.values_list("to_email", flat=True)), ["pat@example.com"])
+
+
+@unbuffered_logs
+class NotificationPageTests(TestCase):
+    url = "/dashboard/patient/notifications/"
+
+    def setUp(self):
+        self.user = make_patient()
+        self.client.force_login(self.user)
+        self.notes = notifications.notify_many(
+            [(self.user, text, "/dashboard/patient/appointments/") for text in ("a", "b", "c")],
+            send_email=False,
+        )
+
+    def shown(self, response):
+        return [(n.message, n.is_new) for n in response.context["notifications"]]
+
+    @mock.patch("booking.views.NOTIFICATIONS_PAGE_SIZE", 2)
+    def test_pages_newest_first_and_marks_all_read_with_the_cursor(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.shown(response), [("c", True), ("b", True)])
+        page = response.context["page"]
+        response = self.client.get(self.url, {"after": page.next_token})
+        self.assertEqual(self.shown(response), [("a", False)])  # read by the first visit
+
+        self.assertEqual(notifications.unread_count(self.user), 0)
+        self.assertFalse(Notification.objects.filter(is_read=True).exists())  # no per-row writes
+
+    def test_open_marks_one_notification_read(self):
+        response = self.client.get(f"/dashboard/patient/notifications/{self.notes[1].id}/open/")
+        self.assertRedirects(response, "/dashboard/patient/appointments/", fetch_redirect_response=False)
+        self.assertEqual(notifications.unread_count(self.user), 2)
+        response = self.client.get(self.url)
+        self.assertEqual(self.shown(response), [("c", True), ("b", False), ("a", True)])
+
+    def test_open_only_follows_local_links(self):
+        note = notifications.notify_many([(self.user, "x", "https://example.com/")], send_email=False)[0]
+        response = self.client.get(f"/dashboard/patient/notifications/{note.id}/open/")
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+
+    def test_cannot_open_another_users_notification(self):
+        self.client.force_login(make_patient("other"))
+        response = self.client.get(f"/dashboard/patient/notifications/{self.notes[0].id}/open/")
+        self.assertEqual(response.status_code, 404)
+
+
+@unbuffered_logs
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        self.user = make_patient()
+
+    def notify(self, *messages):
+        return notifications.notify_many([(self.user, m, "") for m in messages], send_email=False)
+
+    def test_count_follows_notify_read_and_read_all(self):
+        self.notify("one")
+        self.assertEqual(notifications.unread_count(self.user), 1)  # counted from the table
+        notes = self.notify("two", "three")
+        self.assertEqual(notifications.unread_count(self.user), 3)
+        self.assertTrue(notifications.mark_read(notes[0]))
+        self.assertFalse(notifications.mark_read(notes[0]))
+        self.assertEqual(notifications.unread_count(self.user), 2)
+        notifications.mark_all_read(self.user)
+        self.assertEqual(notifications.unread_count(self.user), 0)
+        self.notify("four")
+        self.assertEqual(notifications.unread_count(self.user), 1)
+
+    def test_count_is_kept_in_the_database(self):
+        self.notify("one", "two")
+        notifications.unread_count(self.user)
+        self.assertEqual(NotificationCursor.objects.get(user=self.user).unread_count, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(notifications.unread_count(self.user), 2)
+
+    def test_rebuild_fixes_drifted_counts(self):
+        other = make_patient("other")
+        self.notify("one", "two")
+        notifications.mark_all_read(self.user)
+        self.notify("three")
+        NotificationCursor.objects.filter(user=self.user).update(unread_count=99)
+        notifications.notify_user(other, "hi", send_email=False)
+
+        call_command("rebuild_unread_counters", stdout=mock.Mock())
+        counts = dict(NotificationCursor.objects.values_list("user__username", "unread_count"))
+        self.assertEqual(counts, {"pat": 1, "other": 1})
+
+        NotificationCursor.objects.update(unread_count=5)
+        self.assertEqual(notifications.rebuild_unread_counters([other.id]), 1)
+        self.assertEqual(notifications.unread_count(other), 1)
+        self.assertEqual(notifications.unread_count(self.user), 5)
+
+
+# ---------- EMAIL OUTBOX ----------
+
+
+class RefusingEmailBackend(locmem.EmailBackend):
+    """The SMTP server is down."""
+
+    def open(self):
+        raise ConnectionRefusedError("Connection refused")
+
+
+class RejectingEmailBackend(locmem.EmailBackend):
+    """The server is up but refuses every message."""
+
+    def send_messages(self, messages):
+        raise OSError("550 mailbox unavailable")
+
+
+@unbuffered_logs
+class OutboxTests(TestCase):
+    def setUp(self):
+        outbox.enqueue("Hello", "Body", ["a@example.com", "", "b@example.com"])
+
+    def statuses(self):
+        return list(OutboxEmail.objects.values_list("status", "attempts"))
+
+    def test_drain_sends_due_mails(self):
+        self.assertEqual(outbox.drain(), (2, 0))
+        self.assertEqual(self.statuses(), [("Sent", 0), ("Sent", 0)])
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["a@example.com", "b@example.com"])
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND="booking.tests.RejectingEmailBackend")
+    def test_failed_mail_backs_off_then_fails(self):
+        before = timezone.now()
+        self.assertEqual(outbox.drain(), (0, 2))
+        self.assertEqual(self.statuses(), [("Pending", 1), ("Pending", 1)])
+        row = OutboxEmail.objects.first()
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=outbox.BACKOFF_SECONDS))
+        self.assertEqual(outbox.drain(), (0, 0))  # not due yet
+
+        for _ in range(2, outbox.MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            outbox.drain()
+        self.assertEqual(self.statuses(), [("Failed", outbox.MAX_ATTEMPTS)] * 2)
+        self.assertIn("550", OutboxEmail.objects.first().last_error)
+
+    @override_settings(EMAIL_BACKEND="booking.tests.RefusingEmailBackend")
+    def test_unreachable_server_puts_the_batch_back(self):
+        self.assertEqual(outbox.drain(), (0, 2))
+        self.assertEqual(self.statuses(), [("Pending", 1), ("Pending", 1)])
+        self.assertIn("refused", OutboxEmail.objects.first().last_error)
+
+    def test_worker_loop_survives_a_failing_drain(self):
+        class Stop(Exception):
+            pass
+
+        drains = [RuntimeError("database is locked"), (1, 0)]
+        with mock.patch.object(outbox, "drain", side_effect=drains) as drain, \
+                mock.patch("time.sleep", side_effect=[None, Stop()]):
+            with self.assertRaises(Stop):
+                call_command("send_outbox_emails", "--loop", stdout=mock.Mock(), stderr=mock.Mock())
+        self.assertEqual(drain.call_count, 2)
+
+        with mock.patch.object(outbox, "drain", side_effect=RuntimeError("boom")):
+            with self.assertRaises(CommandError):
+                call_command("send_outbox_emails", stdout=mock.Mock(), stderr=mock.Mock())
+
+
+# ---------- SYSTEM LOG BUFFER ----------
+
+
+@override_settings(SYSTEM_LOG_BUFFERED=True)
+class LogSinkTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(logsink, "_start_flusher")  # flushes happen in the test only
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(logsink._take)
+        self.patient = make_patient()
+        logsink.flush()
+        self.failed = logsink.stats()["failed"]
+
+    def messages(self):
+        return dict(SystemLog.objects.exclude(event_type="user_created").values_list("message", "user_id"))
+
+    def test_rows_of_a_deleted_user_are_kept_without_the_user(self):
+        doctor = make_doctor()
+        slots.claim_slot(patient=self.patient, doctor=doctor, day=timezone.localdate() + timedelta(days=1), t=time(9, 0))
+        log_event("login", "unrelated", user=doctor.user)
+        self.patient.delete()  # cascades to the appointment, which logs its deletion
+
+        self.assertGreaterEqual(logsink.flush(), 3)
+        rows = self.messages()
+        self.assertEqual(rows["unrelated"], doctor.user.id)
+        deleted = [user_id for message, user_id in rows.items() if "deleted" in message]
+        self.assertEqual(deleted, [None])
+        self.assertEqual(logsink.stats()["failed"], self.failed)
+
+    def test_one_bad_row_does_not_drop_the_batch(self):
+        log_event("login", "good", user=self.patient)
+        log_event("login", "gone", user_id=self.patient.id + 1000)  # deleted in another process
+        log_event("login", "good too", user=self.patient)
+
+        self.assertEqual(logsink.flush(), 3)
+        self.assertEqual(
+            self.messages(),
+            {"good": self.patient.id, "gone": None, "good too": self.patient.id},
+        )
+
+    def test_flush_inside_a_transaction_waits_for_the_commit(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                log_event("login", "kept", user=self.patient)
+                self.assertEqual(logsink.flush(), 0)
+                raise RuntimeError("roll back")
+        self.assertFalse(SystemLog.objects.filter(message="kept").exists())
+
+        with transaction.atomic():
+            logsink.flush()
+            self.assertFalse(SystemLog.objects.filter(message="kept").exists())
+        self.assertTrue(SystemLog.objects.filter(message="kept").exists())
+
+    def test_full_buffer_wakes_the_flusher_instead_of_writing(self):
+        with mock.patch.object(logsink, "FLUSH_SIZE", 2):
+            logsink._wake.clear()
+            with transaction.atomic():
+                log_event("login", "one", user=self.patient)
+                log_event("login", "two", user=self.patient)
+                self.assertTrue(logsink._wake.is_set())
+        self.assertFalse(SystemLog.objects.filter(message__in=["one", "two"]).exists())
+        self.assertEqual(logsink.flush(), 2)
+
+
+# ---------- LOG RETENTION ----------
+
+
+@unbuffered_logs
+class RetentionTests(TestCase):
+    now = timezone.make_aware(datetime(2024, 3, 10, 12, 0))  # 7 days kept: cutoff 2024-03-03 00:00
+
+    def log_at(self, day, hour, event_type="login"):
+        log = SystemLog.objects.create(event_type=event_type, message=f"{event_type} at {day} {hour}:00")
+        SystemLog.objects.filter(id=log.id).update(
+            created_at=timezone.make_aware(datetime.combine(day, time(hour)))
+        )
+
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        SystemLog.objects.all().delete()
+        for day, hour, event_type in (
+            (date(2024, 3, 1), 9, "login"),
+            (date(2024, 3, 1), 10, "logout"),
+            (date(2024, 3, 1), 23, "login"),
+            (date(2024, 3, 2), 8, "login"),
+            (date(2024, 3, 3), 0, "login"),  # first kept day
+        ):
+            self.log_at(day, hour, event_type)
+
+    def purge(self, **kwargs):
+        return retention.purge_old_logs(
+            retention_days=7, archive=True, now=self.now, archive_dir=self.archive_dir.name, **kwargs
+        )
+
+    def rollups(self):
+        return sorted(SystemLogRollup.objects.values_list("day", "event_type", "count"))
+
+    def test_old_rows_are_archived_rolled_up_and_deleted(self):
+        summary = self.purge(chunk_size=2)
+        self.assertEqual((summary["purged"], summary["chunks"], len(summary["days"])), (4, 2, 2))
+        self.assertEqual(SystemLog.objects.count(), 1)
+        self.assertEqual(self.rollups(), [
+            (date(2024, 3, 1), "login", 2),
+            (date(2024, 3, 1), "logout", 1),
+            (date(2024, 3, 2), "login", 1),
+        ])
+
+        path = retention.archive_path(date(2024, 3, 1), Path(self.archive_dir.name))
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            rows = [json.loads(line) for line in fh]
+        self.assertEqual([row["event_type"] for row in rows], ["login", "logout", "login"])
+
+    def test_second_run_adds_to_the_day_counts(self):
+        self.purge()
+        self.log_at(date(2024, 3, 1), 12)
+        self.assertEqual(self.purge()["purged"], 1)
+        self.assertIn((date(2024, 3, 1), "login", 3), self.rollups())
+
+    def test_dry_run_and_no_retention_delete_nothing(self):
+        self.assertEqual(self.purge(dry_run=True)["purged"], 4)
+        self.assertIsNone(retention.purge_old_logs(retention_days=0, now=self.now)["cutoff"])
+        self.assertEqual(SystemLog.objects.count(), 5)
+        self.assertEqual(self.rollups(), [])
+
+
+# ---------- KEYSET PAGING ----------
+
+
+@unbuffered_logs
+class KeysetPagingTests(TestCase):
+    ordering = ("-date", "-time", "-id")
+
+    def setUp(self):
+        doctor, patient = make_doctor(), make_patient()
+        day = timezone.localdate() + timedelta(days=1)
+        # seven rows per date and time, so pages end in the middle of ties
+        for d in (day, day + timedelta(days=1)):
+            for t in (time(9, 0), time(9, 15)):
+                for _ in range(7):
+                    Appointment.objects.create(patient=patient, doctor=doctor, date=d, time=t, status="Cancelled")
+        self.expected = list(Appointment.objects.order_by(*self.ordering).values_list("id", flat=True))
+
+    def walk(self, page_size, **kwargs):
+        seen, token = [], ""
+        while True:
+            page = paging.keyset_page(Appointment.objects.all(), self.ordering, token, page_size=page_size, **kwargs)
+            seen += [appt.id for appt in page]
+            if not page.has_next:
+                return seen
+            token = page.next_token
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for page_size in (1, 3, 5, 28, 100):
+            self.assertEqual(self.walk(page_size), self.expected, page_size)
+            self.assertEqual(self.walk(page_size, ids_first=True), self.expected, page_size)
+
+    def test_tampered_token_starts_over(self):
+        page = paging.keyset_page(Appointment.objects.all(), self.ordering, "garbage", page_size=3)
+        self.assertTrue(page.is_first)
+        self.assertEqual([appt.id for appt in page], self.expected[:3])
+
+
+@unbuffered_logs
+class AdminReportsViewTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username="admin", password="pw", is_staff=True))
+        self.doctor = doctor = make_doctor()
+        self.day = day = timezone.localdate() + timedelta(days=1)
+        for n in range(3):
+            slots.claim_slot(patient=make_patient(f"p{n}"), doctor=doctor, day=day, t=time(9, 15 * n))
+        Appointment.objects.create(patient=make_patient("other"), doctor=doctor, date=day, time=time(10, 0), status="Cancelled")
+
+    def add_lake_clinic_appointment(self):
+        lake = make_doctor("lake", hospital=Hospital.for_name("Lake Clinic"))
+        slots.claim_slot(
+            patient=make_patient("lp"), doctor=lake, day=self.day + timedelta(days=1), t=time(9, 0), status="Approved"
+        )
+        return lake
+
+    def test_summary_status_hospital_and_daily_grains(self):
+        lake = self.add_lake_clinic_appointment()
+        context = self.client.get(reverse("admin_reports")).context
+        self.assertEqual(
+            (context["total_appointments"], context["pending_count"], context["approved_count"],
+             context["cancelled_count"]),
+            (5, 3, 1, 1),
+        )
+        self.assertEqual(
+            [(row["status"], row["total"]) for row in context["status_counts"]],
+            [("Approved", 1), ("Cancelled", 1), ("Pending", 3)],
+        )
+        self.assertEqual(
+            [(row["hospital"], row["total"]) for row in context["hospital_counts"]],
+            [("City Hospital", 4), (lake.hospital.name, 1)],
+        )
+        self.assertEqual(
+            [(row["date"], row["total"], row["pending"], row["approved"], row["cancelled"])
+             for row in context["daily_counts"]],
+            [(self.day + timedelta(days=1), 1, 0, 1, 0), (self.day, 4, 3, 0, 1)],
+        )
+
+    def test_filters_apply_to_every_grain(self):
+        lake = self.add_lake_clinic_appointment()
+        context = self.client.get(reverse("admin_reports"), {"hospital": lake.hospital_id}).context
+        self.assertEqual((context["total_appointments"], len(context["page"])), (1, 1))
+        context = self.client.get(
+            reverse("admin_reports"), {"doctor": self.doctor.id, "status": "Pending"}
+        ).context
+        self.assertEqual((context["total_appointments"], len(context["page"])), (3, 3))
+        self.assertEqual([row["total"] for row in context["daily_counts"]], [3])
+
+    def test_query_count_does_not_grow_with_appointments(self):
+        def report_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse("admin_reports"))
+            return len(queries)
+
+        before = report_queries()
+        for n in range(4):
+            slots.claim_slot(patient=make_patient(f"more{n}"), doctor=self.doctor, day=self.day, t=time(11, 15 * n))
+        self.assertEqual(report_queries(), before)
+
+    @mock.patch("booking.views.REPORTS_HISTORY_PAGE_SIZE", 2)
+    def test_history_pages_keep_the_filters(self):
+        response = self.client.get(reverse("admin_reports"), {"status": "Pending"})
+        page = response.context["page"]
+        self.assertEqual(page.query, "status=Pending")
+        self.assertTrue(page.has_next)
+        response = self.client.get(reverse("admin_reports") + f"?{page.query}&after={page.next_token}")
+        statuses = [appt.status for appt in response.context["page"]]
+        self.assertEqual(statuses, ["Pending"])
+
+    def test_impossible_dates_are_ignored_with_a_warning(self):
+        response = self.client.get(reverse("admin_reports"), {"start_date": "2024-02-30"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 4)
+        self.assertEqual(len(list(response.context["messages"])), 1)
+
+    def test_non_numeric_doctor_is_ignored_with_a_warning(self):
+        response = self.client.get(reverse("admin_reports"), {"doctor": "abc"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 4)
+        self.assertIsNone(response.context["doctor_filter"])
+        self.assertEqual(len(list(response.context["messages"])), 1)
+
+
+# ---------- ADMIN LOGS ----------
+
+
+@unbuffered_logs
+class AdminLogsViewTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user(username="admin", password="pw", is_staff=True)
+        self.client.force_login(admin)
+        log_event("login", "kept", user=admin)
+
+    def test_impossible_dates_are_ignored_with_a_warning(self):
+        response = self.client.get(reverse("admin_logs"), {"from": "2024-02-30", "to": "2024-13-01"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("kept", [log.message for log in response.context["logs"]])
+        self.assertEqual(len(list(response.context["messages"])), 2)
+
+    def test_date_range_filters(self):
+        today = timezone.localdate()
+        response = self.client.get(reverse("admin_logs"), {"from": (today + timedelta(days=1)).isoformat()})
+        self.assertEqual(list(response.context["logs"]), [])
+
+
+# ---------- CSV IMPORT ----------
+
+
+@unbuffered_logs
+class ImportTests(TestCase):
+    doctors_csv = (
+        "email,first_name,last_name,registration_no,specialization,hospital,city,fee,status\n"
+        "ann@example.com,Ann,Lee,R-10,Neurology,City Hospital,Pune,500,Active\n"
+        "bob@example.com,Bob,Ray,R-11,Neurology,Lake Clinic,Pune,,\n"
+        "ANN@example.com,Ann,Lee,R-10,Neurology,City Hospital,Pune,,\n"
+        "cid@example.com,,Roy,R-12,Neurology,City Hospital,Pune,,\n"
+        "dan@example.com,Dan,Roy,R-13,Neurology,City Hospital,Pune,lots,\n"
+        "eve@example.com,Eve,Roy,R-14,Neurology,City Hospital,Pune,,Retired\n"
+    )
+
+    def import_doctors(self, text, **kwargs):
+        return imports.import_doctors(io.StringIO(text), workers=1, **kwargs)
+
+    def import_appointments(self, text, **kwargs):
+        return imports.import_appointments(io.StringIO(text), **kwargs)
+
+    def test_doctors_file_with_bad_rows(self):
+        version = directory._version()
+        result = self.import_doctors(self.doctors_csv)
+
+        self.assertEqual((result.rows, result.created, result.skipped, result.invalid), (6, 2, 0, 4))
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6, 7])
+        ann = DoctorProfile.objects.select_related("user", "department").get(user__username="ann@example.com")
+        self.assertEqual((ann.user.first_name, ann.status, ann.department.name), ("Ann", "Active", "Neurology"))
+        bob = DoctorProfile.objects.get(user__username="bob@example.com")
+        self.assertEqual((bob.status, bob.hospital.slug), ("Pending", "lakeclinic"))
+        self.assertFalse(bob.user.has_usable_password())
+        self.assertTrue(SystemLog.objects.filter(event_type="bulk_import").exists())
+
+        # searchable, and the shared directory version moved for every process
+        self.assertEqual(search.search_doctors("ann lee"), [ann])
+        self.assertEqual(search.search_doctors("bob"), [])  # still Pending
+        self.assertNotEqual(cache.get(directory.VERSION_KEY), version)
+
+    def test_reimport_skips_existing_doctors(self):
+        self.import_doctors(self.doctors_csv)
+        result = self.import_doctors(self.doctors_csv)
+        self.assertEqual((result.created, result.skipped), (0, 3))
+        self.assertEqual(DoctorProfile.objects.count(), 2)
+
+    def test_dry_run_creates_nothing(self):
+        result = self.import_doctors(self.doctors_csv, dry_run=True)
+        self.assertEqual(result.created, 2)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(SystemLog.objects.filter(event_type="bulk_import").exists())
+
+    def test_missing_columns(self):
+        with self.assertRaisesMessage(ValueError, "Missing CSV columns: hospital, city"):
+            self.import_doctors("email,first_name,last_name,registration_no,specialization\n")
+
+    def test_appointments_update_stats_search_and_availability(self):
+        doctor = make_doctor("doc@example.com")
+        day = timezone.localdate() + timedelta(days=1)
+        availability.put_days(doctor.id, "sig", {day: 1})
+        text = (
+            "patient_email,doctor_email,date,time,status,symptoms,patient_first_name,patient_last_name\n"
+            f"new@example.com,doc@example.com,{day},09:00,Approved,chest pain,Nina,Park\n"
+            f"other@example.com,DOC@example.com,{day},09:00,Approved,,,\n"
+            f"new@example.com,nobody@example.com,{day},09:15,,,,\n"
+            "new@example.com,doc@example.com,2024-02-30,09:00,,,,\n"
+            "old@example.com,doc@example.com,2024-01-05,10:00,,,,\n"
+        )
+        result = self.import_appointments(text)
+
+        self.assertEqual((result.created, result.invalid), (2, 3))
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5])
+        self.assertIn("already has an active appointment", result.errors[0][1])
+        patient = User.objects.get(username="new@example.com")
+        self.assertEqual(patient.get_full_name(), "Nina Park")
+        self.assertFalse(patient.has_usable_password())
+
+        self.assertEqual(
+            sorted(AppointmentDailyStats.objects.values_list("date", "status", "count")),
+            [(date(2024, 1, 5), "Completed", 1), (day, "Approved", 1)],
+        )
+        found = Appointment.objects.filter(search.appointment_filter("nina park"))
+        self.assertEqual([a.symptoms for a in found], ["chest pain"])
+        self.assertIsNone(availability.get_entry(doctor.id))
+
+    def test_command_reports_bad_rows(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "doctors.csv")
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(self.doctors_csv)
+            out, err = io.StringIO(), io.StringIO()
+            call_command("import_csv", "doctors", path, "--workers", "1", stdout=out, stderr=err)
+            self.assertIn("2 created", out.getvalue())
+            self.assertIn("line 4: ann@example.com appears more than once", err.getvalue())
+
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write("email\n")
+            with self.assertRaises(CommandError):
+                call_command("import_csv", "doctors", path, stdout=out, stderr=err)
+
+
+# ---------- CSV EXPORT ----------
+
+
+@unbuffered_logs
+class AppointmentCsvExportTests(TestCase):
+    url = "/dabs-admin/appointments/export/csv/"
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.doctor.user.first_name, self.doctor.user.last_name = "Asha", "Sharma"
+        self.doctor.user.save()
+        self.patient = make_patient()
+        self.day = date(2024, 5, 1)
+        for n, status in enumerate(("Completed", "Cancelled", "Completed", "Cancelled")):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, date=self.day + timedelta(days=n // 2),
+                time=time(9, 0), status=status,
+            )
+
+    def rows(self, params=None):
+        response = self.client.get(self.url, params or {})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        text = b"".join(response.streaming_content).decode()
+        return list(csv.reader(io.StringIO(text)))
+
+    def test_staff_only(self):
+        self.client.force_login(self.patient)
+        self.assertRedirects(self.client.get(self.url), reverse("home"), fetch_redirect_response=False)
+
+    def test_rows_newest_first_with_the_filters(self):
+        self.client.force_login(User.objects.create_user(username="admin", password="pw", is_staff=True))
+        rows = self.rows()
+        self.assertEqual(rows[0], exports.APPOINTMENT_CSV_HEADER)
+        ids = sorted(Appointment.objects.values_list("id", flat=True))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [ids[3], ids[2], ids[1], ids[0]])
+        self.assertEqual(rows[1][2:], [
+            "pat", "pat@example.com", "Dr. Asha Sharma", "Cardiology", "City Hospital",
+            "2024-05-02", "09:00", "Cancelled",
+        ])
+        rows = self.rows({"status": "Completed", "start_date": "2024-05-02"})
+        self.assertEqual([int(row[0]) for row in rows[1:]], [ids[2]])
+
+    def test_rows_are_read_in_keyset_chunks(self):
+        qs = Appointment.objects.all()
+        whole = list(exports.appointment_csv_rows(qs))
+        with self.assertNumQueries(2):  # 3 + 1 rows, ties on date / time split by id
+            chunked = list(exports.appointment_csv_rows(qs, chunk_size=3))
+        self.assertEqual(chunked, whole)
+        with self.assertNumQueries(3):  # the last chunk is full: one empty read
+            self.assertEqual(list(exports.appointment_csv_rows(qs, chunk_size=2)), whole)
+
+    def test_lines_are_sent_in_blocks(self):
+        rows = list(exports.appointment_csv_rows(Appointment.objects.all()))
+        blocks = list(exports.csv_lines(rows, block_size=150))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(list(csv.reader(io.StringIO("".join(blocks)))), [
+            [str(value) for value in row] for row in rows
+        ])
+
+
+# ---------- EXPORT JOBS ----------
+
+
+@unbuffered_logs
+class ExportJobTests(TestCase):
+    def setUp(self):
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        patcher = mock.patch.object(exportjobs, "EXPORT_DIR", exportjobs.Path(export_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        doctor = make_doctor()
+        slots.claim_slot(patient=make_patient(), doctor=doctor, day=timezone.localdate() + timedelta(days=1), t=time(9, 0))
+        self.job, _ = exportjobs.request_export({})
+
+    def expire_lease(self):
+        ExportJob.objects.filter(id=self.job.id).update(lease_until=timezone.now() - timedelta(seconds=1))
+
+    def test_job_runs_to_a_file(self):
+        self.assertEqual(exportjobs.work(), (1, 0))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.rows_total, self.job.rows_done), ("Done", 1, 1))
+        with gzip.open(exportjobs.file_path(self.job), "rt") as fh:
+            self.assertEqual(len(fh.read().splitlines()), 2)
+
+    def test_impossible_filter_date_is_dropped(self):
+        job, created = exportjobs.request_export({"start_date": "2024-02-30"})
+        self.assertEqual((job.id, created), (self.job.id, False))
+
+    def test_expired_lease_is_claimed_again_with_a_new_attempt(self):
+        first = exportjobs._claim()
+        self.expire_lease()
+        second = exportjobs._claim()
+        self.assertEqual((first.id, first.attempts, second.attempts), (self.job.id, 1, 2))
+
+    def test_job_of_a_crashing_worker_fails_after_max_attempts(self):
+        for _ in range(exportjobs.MAX_ATTEMPTS):
+            self.assertIsNotNone(exportjobs._claim())
+            self.expire_lease()  # the worker died without a word
+        self.assertIsNone(exportjobs._claim())
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), ("Failed", exportjobs.MAX_ATTEMPTS))
+
+    def test_worker_that_lost_its_lease_leaves_the_job_alone(self):
+        stale = exportjobs._claim()
+        self.expire_lease()
+        current = exportjobs._claim()
+        with self.assertRaises(exportjobs.LeaseLost):
+            exportjobs.run_job(stale)
+        self.assertEqual(list(exportjobs.EXPORT_DIR.iterdir()), [])
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), ("Running", current.attempts))
+
+        exportjobs.run_job(current)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "Done")
+
+
+# ---------- INCREMENTAL DATA EXPORTS ----------
+
+
+@unbuffered_logs
+class ExportWatermarkTests(TestCase):
+    def setUp(self):
+        doctor = make_doctor()
+        self.appt = slots.claim_slot(patient=make_patient(), doctor=doctor, day=timezone.localdate() + timedelta(days=1), t=time(9, 0))
+
+    def ids(self, name, since=None, until=None):
+        spec = dataexports.DATASETS[name]
+        return [row[0] for chunk in dataexports.chunks(spec, since=since, until=until) for row in chunk]
+
+    def test_rows_of_a_late_commit_are_in_the_next_pull(self):
+        spec = dataexports.DATASETS["appointments"]
+        until = dataexports.current_watermark(spec)
+        self.assertEqual(self.ids("appointments", until=until), [])
+
+        # written by a transaction that was open when the first pull started
+        Appointment.objects.filter(id=self.appt.id).update(updated_at=timezone.now() - timedelta(seconds=30))
+        with mock.patch.object(dataexports, "WATERMARK_LAG_SECONDS", 0):
+            following = dataexports.current_watermark(spec, until)
+        self.assertEqual(self.ids("appointments", since=until, until=following), [self.appt.id])
+
+    def test_log_ids_stop_before_recent_rows(self):
+        spec = dataexports.DATASETS["systemlog"]
+        old = SystemLog.objects.order_by("id").first()
+        SystemLog.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(hours=1))
+        until = dataexports.current_watermark(spec)
+        self.assertEqual(self.ids("systemlog", until=until), [old.id])
+        self.assertGreater(SystemLog.objects.count(), 1)
+
+    def test_watermark_never_moves_back(self):
+        spec = dataexports.DATASETS["systemlog"]
+        self.assertEqual(dataexports.current_watermark(spec, since=10 ** 6), 10 ** 6)
@@ -18,16 +18,24 @@ urlpatterns = [
     # Patient area
     path('dashboard/patient/', views.patient_dashboard, name='patient_dashboard'),
     path('dashboard/patient/find/', views.find_doctor, name='find_doctor'),
+    path('dashboard/patient/find/suggest/', views.doctor_autocomplete, name='doctor_autocomplete'),
     path('dashboard/patient/bookAppointment/', views.book_appointment, name='book_appointment_doctor'),
     path('dashboard/patient/book/<int:doctor_id>/', views.book_appointment, name='book_appointment'),
     path('dashboard/patient/appointments/', views.my_appointments, name='my_appointments'),
     path('dashboard/patient/appointments/<int:appt_id>/cancel/', views.cancel_appointment, name='cancel_appointment'),
     path('dashboard/patient/appointments/<int:appt_id>/reschedule/', views.reschedule_appointment, name='reschedule_appointment'),
+    path('dashboard/patient/appointments/<int:appt_id>/accept/', views.accept_waitlist_offer, name='accept_waitlist_offer'),
+    path('dashboard/patient/waitlist/join/<int:doctor_id>/', views.join_waitlist, name='join_waitlist'),
+    path('dashboard/patient/waitlist/<int:entry_id>/leave/', views.leave_waitlist, name='leave_waitlist'),
     path('dashboard/patient/profile/', views.patient_profile, name='patient_profile'),
     path('dashboard/patient/notifications/', views.patient_notifications, name='patient_notifications'),
+    path('dashboard/patient/notifications/<int:notification_id>/open/', views.open_notification, name='open_notification'),
     path( "dashboard/patient/appointments/<int:appt_id>/feedback/",views.give_feedback,name="give_feedback",),
     path("hospital/<str:hospital_slug>/departments/",views.get_all_departments, name='patient_notifications'),
     path("hospital/<str:hospital_slug>/<str:department_slug>/doctors/",views.get_all_doctor, name='patient_notifications'),    
+    path("doctor/<int:doctor_id>/slots/", views.doctor_free_slots, name="doctor_free_slots"),
+    path("hospital/<str:hospital_slug>/<str:department_slug>/availability/", views.department_availability, name="department_availability"),
+    path("hospital/<str:hospital_slug>/<str:department_slug>/earliest/", views.department_earliest, name="department_earliest"),
 
     # Doctor area
     path('dashboard/doctor/', views.doctor_dashboard, name='doctor_dashboard'),
@@ -50,6 +58,11 @@ urlpatterns = [
     path('dabs-admin/patients/', views.admin_patients, name='admin_patients'),
     path('dabs-admin/appointments/', views.admin_appointments, name='admin_appointments'),
     path('dabs-admin/appointments/export/csv/', views.admin_appointments_export, name='admin_appointments_export'),
+    path('dabs-admin/appointments/export/jobs/', views.admin_export_job_create, name='admin_export_job_create'),
+    path('dabs-admin/exports/<int:job_id>/', views.admin_export_job, name='admin_export_job'),
+    path('dabs-admin/exports/<int:job_id>/download/', views.admin_export_download, name='admin_export_download'),
+    path('dabs-admin/data/<slug:dataset>/<slug:fmt>/', views.admin_data_export, name='admin_data_export'),
+    path('dabs-admin/import/', views.admin_import, name='admin_import'),
     path('dabs-admin/reports/', views.admin_reports, name='admin_reports'),
     path('dabs-admin/settings/', views.admin_settings, name='admin_settings'),
     path('dabs-admin/logs/', views.admin_logs, name='admin_logs'),
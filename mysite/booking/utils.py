@@ -5,6 +5,8 @@ import re
 from django.utils.text import slugify
 from .models import SystemLog
 from django.contrib.auth.models import User
+from django.utils import timezone
+from . import logsink
 
 
 def log_event(
@@ -12,12 +14,15 @@ def log_event(
     message: str,
     user: Optional[User] = None,
     request: Optional[HttpRequest] = None,
+    user_id: Optional[int] = None,
 ) -> None:
     """
     Central helper to create SystemLog entries.
 
     - If request is provided, it will auto-fill IP + user_agent.
     - If user is None and request.user is authenticated, it uses request.user.
+    - user_id can be passed instead of user when only the id is at hand.
+    - The row is buffered and written in batches (see logsink).
     """
 
     ip_address = None
@@ -33,13 +38,14 @@ def log_event(
     if user is not None and not user.is_authenticated:
         user = None
 
-    SystemLog.objects.create(
+    logsink.write(SystemLog(
         event_type=event_type,
         message=message,
-        user=user,
+        user_id=user.id if user is not None else user_id,
         ip_address=ip_address,
         user_agent=user_agent,
-    )
+        created_at=timezone.now(),
+    ))
 
 
 
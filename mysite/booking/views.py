@@ -1,5 +1,4 @@
 from datetime import datetime
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
@@ -7,13 +6,17 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q, Count
 from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
-from .utils import clean_slug
 from django.utils.text import slugify
-from .models import DoctorProfile, Appointment, SystemSetting,Feedback
-from django.http import JsonResponse
-from datetime import date, datetime
+from .models import DoctorProfile, Appointment, Hospital, SystemSetting,Feedback, Waitlist
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition
+from datetime import date, datetime, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
 from .utils import log_event
+from . import availability, dataexports, directory, exportjobs, exports, imports, logsink, notifications, outbox, paging, search, slots, stats, waitlist
+from .notifications import notify_many, notify_user, notify_waitlist_offers
 from django.contrib import messages
 from django.contrib.auth import (
     authenticate,
@@ -33,39 +36,29 @@ from django.shortcuts import (
 )
 
 from django.conf import settings
-from django.core.mail import send_mail
 from .models import Notification  # make sure Notification is imported
 
 
-def notify_user(user, message: str, *, link: str = "", send_email: bool = True):
-    """
-    Create an in-app notification and optionally send an email.
-    """
-    if not user:
-        return
+from .models import Feedback  # add import
 
-    # Save notification in DB
-    Notification.objects.create(
-        user=user,
-        message=message,
-        link=link or "",
-    )
+NOTIFICATIONS_PAGE_SIZE = 30
+LOGS_PAGE_SIZE = 100
+FIND_DOCTOR_LIMIT = 200
+FIND_DOCTOR_PAGE_SIZE = 50
+AUTOCOMPLETE_LIMIT = 10
 
-    # Optional email
-    if send_email and user.email:
-        try:
-            send_mail(
-                subject="DABS Notification",
-                message=message,
-                from_email=getattr(settings, "DEFAULT_FROM_EMAIL", settings.EMAIL_HOST_USER),
-                recipient_list=[user.email],
-                fail_silently=True,  # do NOT crash the site if email fails
-            )
-        except Exception:
-            # In production you would log this; for project report it's fine to ignore.
-            pass
 
-from .models import Feedback  # add import
+def _date_param(request, name: str):
+    """A YYYY-MM-DD GET filter as a date; None (with a warning) if it isn't a real date."""
+    value = request.GET.get(name, "").strip()
+    try:
+        day = parse_date(value) if value else None
+    except ValueError:  # well formed but impossible, e.g. 2024-02-30
+        day = None
+    if value and day is None:
+        messages.warning(request, f"Ignored the invalid date '{value}'.")
+    return day
+
 
 @login_required
 def give_feedback(request, appt_id):
@@ -136,46 +129,172 @@ def get_feedback_list(request):
     else:
         feedback_context = Feedback.objects.filter(doctor = docter_instance[0])
 
+    # newest first, one keyset page at a time (?after=<token>)
+    page = paging.request_page(
+        request,
+        feedback_context.select_related("patient", "doctor"),
+        ("-created_at", "-id"),
+    )
+
     return render(
         request,
         "booking/feedback_list.html",
-        {"feedback_list": feedback_context},
+        {"feedback_list": page, "page": page},
     )
 
+def _directory_response(entry):
+    body, _ = entry
+    response = HttpResponse(body, content_type="application/json")
+    # browsers must revalidate, which is a cheap 304 (see booking/directory.py)
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
 @login_required
-def get_all_departments(request,hospital_slug:str):
-    departments = (
-        DoctorProfile.objects
-        .filter(hospital_slug=hospital_slug)
-        .values_list("specialization", flat=True)
-        .distinct()
-        .order_by("specialization")
+@condition(etag_func=lambda request, hospital_slug: directory.departments(hospital_slug)[1])
+def get_all_departments(request, hospital_slug: str):
+    """JSON: departments of a hospital, from the in-memory directory."""
+    return _directory_response(directory.departments(hospital_slug))
+
+
+@condition(etag_func=lambda request, hospital_slug, department_slug: directory.doctors(hospital_slug, department_slug)[1])
+def get_all_doctor(request, hospital_slug, department_slug):
+    """JSON: Active doctors of one hospital department, from the in-memory directory."""
+    return _directory_response(directory.doctors(hospital_slug, department_slug))
+
+@login_required
+def doctor_free_slots(request, doctor_id):
+    """
+    JSON: free slots of one Active doctor.
+    ?start=YYYY-MM-DD (default today) & days=N (default 7, max 31)
+    """
+    doctor = get_object_or_404(DoctorProfile, id=doctor_id, status="Active")
+
+    try:
+        start = parse_date(request.GET.get("start", "").strip() or "") or timezone.localdate()
+    except ValueError:  # well formed but not a real date, e.g. 2024-02-30
+        return JsonResponse({"error": "Invalid start date."}, status=400)
+    days_raw = request.GET.get("days", "").strip()
+    days = int(days_raw) if days_raw.isdigit() else 7
+    days = max(1, min(days, 31))
+
+    settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+    free = slots.free_slots(
+        doctor,
+        start,
+        start + timedelta(days=days - 1),
+        default_minutes=settings_obj.default_slot_minutes,
     )
 
-    # generate slugs for departments
     data = [
-        {"name": d, "slug": slugify(d)}
-        for d in departments
+        {"date": d.isoformat(), "times": [t.strftime("%H:%M") for t in times]}
+        for d, times in sorted(free.items())
     ]
+    return JsonResponse({"doctor": doctor.id, "slots": data})
 
-    return JsonResponse({"departments": data})
+@login_required
+def department_availability(request, hospital_slug, department_slug):
+    """
+    JSON "first available" board: the next N free slots of every Active
+    doctor in one hospital department, in one response.
+    ?n=N (default 5, max 20) & days=D search window (default 14, max 60)
 
-def get_all_doctor(request,hospital_slug,department_slug):
-    doctors = (
+    Query count does not grow with the number of doctors:
+    doctors + settings + one booked-slots query.
+    """
+    n_raw = request.GET.get("n", "").strip()
+    n = max(1, min(int(n_raw) if n_raw.isdigit() else 5, 20))
+    days_raw = request.GET.get("days", "").strip()
+    days = max(1, min(int(days_raw) if days_raw.isdigit() else 14, 60))
+
+    doctors = list(
         DoctorProfile.objects
         .filter(
-            hospital_slug=hospital_slug,
-            specialization__iexact=department_slug.replace("-", " ")
+            department_id=directory.department_id(hospital_slug, department_slug),
+            status="Active",
         )
         .select_related("user")
     )
 
+    settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+    today = timezone.localdate()
+    free = slots.free_slots_for_doctors(
+        doctors,
+        today,
+        today + timedelta(days=days - 1),
+        default_minutes=settings_obj.default_slot_minutes,
+    )
+
+    data = []
+    for d in doctors:
+        next_slots = []
+        for day, times in sorted(free[d.id].items()):
+            for t in times[: n - len(next_slots)]:
+                next_slots.append({"date": day.isoformat(), "time": t.strftime("%H:%M")})
+            if len(next_slots) >= n:
+                break
+        data.append({
+            "id": d.id,
+            "name": d.user.get_full_name() or d.user.username,
+            "next_slots": next_slots,
+        })
+
+    # soonest doctor first, doctors without free slots last
+    def first_slot(row):
+        first = row["next_slots"][0] if row["next_slots"] else None
+        return (0, first["date"], first["time"]) if first else (1, "", "")
+
+    data.sort(key=first_slot)
+
+    return JsonResponse({
+        "hospital": hospital_slug,
+        "department": department_slug,
+        "doctors": data,
+    })
+
+@login_required
+def department_earliest(request, hospital_slug, department_slug):
+    """
+    JSON: the K soonest free slots in a hospital department, across all
+    Active doctors ("the soonest cardiologist").
+    ?k=K (default 5, max 50) & distinct=1 to get at most one slot per doctor
+    """
+    k_raw = request.GET.get("k", "").strip()
+    k = max(1, min(int(k_raw) if k_raw.isdigit() else 5, 50))
+    distinct = request.GET.get("distinct") == "1"
+
+    doctors = {
+        d.id: d
+        for d in DoctorProfile.objects
+        .filter(
+            department_id=directory.department_id(hospital_slug, department_slug),
+            status="Active",
+        )
+        .select_related("user")
+    }
+
+    settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+    found = slots.earliest_available(
+        doctors.values(),
+        k=k,
+        distinct_doctors=distinct,
+        default_minutes=settings_obj.default_slot_minutes,
+    )
+
     data = [
-        {"id": d.id, "name": d.user.get_full_name() or d.user.username}
-        for d in doctors
+        {
+            "doctor": doctor_id,
+            "name": doctors[doctor_id].user.get_full_name() or doctors[doctor_id].user.username,
+            "date": slot_dt.date().isoformat(),
+            "time": slot_dt.strftime("%H:%M"),
+        }
+        for slot_dt, doctor_id in found
     ]
-
-    return JsonResponse({"doctors": data})
+    return JsonResponse({
+        "hospital": hospital_slug,
+        "department": department_slug,
+        "slots": data,
+    })
 
 def send_appointment_email(appt, subject, message):
     """
@@ -186,17 +305,8 @@ def send_appointment_email(appt, subject, message):
     if not patient_email:
         return  # no email, nothing to send
 
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [patient_email],
-            fail_silently=True,  # avoid crashing the view if SMTP has an issue
-        )
-    except Exception:
-        # In production you might want to log this
-        pass
+    # queued in the outbox, the request never waits for SMTP
+    outbox.enqueue(subject, message, [patient_email], from_email=settings.DEFAULT_FROM_EMAIL)
 
 from .models import DoctorProfile, Appointment, SystemSetting
 from .models import SecurityLog
@@ -342,10 +452,8 @@ def patient_dashboard(request):
         status="Completed",
     ).order_by("-date", "-time").first()
 
-    notifications_count = Notification.objects.filter(
-        user=request.user,
-        is_read=False,
-    ).count()
+    # kept count: one row read, no COUNT over the notifications
+    notifications_count = notifications.unread_count(request.user)
 
     context = {
         "upcoming_count": upcoming_count,
@@ -402,19 +510,40 @@ def patient_profile(request):
 @login_required
 def patient_notifications(request):
     """
-    List notifications for logged-in patient. Marks them as read when opened.
+    List notifications for logged-in patient, newest first, one keyset page
+    at a time (?after=<token>). Opening the page marks everything as read by
+    moving the user's read cursor (one row), not by updating every row.
     """
-    qs = Notification.objects.filter(user=request.user).order_by("-created_at")
+    qs = Notification.objects.filter(user=request.user)
+    page = paging.keyset_page(
+        qs,
+        ("-created_at", "-id"),
+        request.GET.get("after", ""),
+        page_size=NOTIFICATIONS_PAGE_SIZE,
+    )
 
-    # Mark all as read once page is opened
-    qs.filter(is_read=False).update(is_read=True)
+    # Mark all as read once page is opened (also resets the unread counter)
+    previous_cursor = notifications.mark_all_read(request.user)
+    for n in page:
+        n.is_new = not n.is_read and (previous_cursor is None or n.created_at > previous_cursor)
 
     return render(
         request,
         "booking/patient_notifications.html",
-        {"notifications": qs},
+        {"notifications": page, "page": page},
     )
 
+@login_required
+def open_notification(request, notification_id):
+    """
+    Open a single notification: mark just this one as read, then follow its link.
+    """
+    note = get_object_or_404(Notification, id=notification_id, user=request.user)
+    notifications.mark_read(note)
+    if note.link.startswith("/"):
+        return redirect(note.link)
+    return redirect("patient_notifications")
+
 # ============================
 # DOCTOR REGISTRATION / DASHBOARD
 # ============================
@@ -484,8 +613,7 @@ def doctor_register(request):
             registration_no=regno,
             specialization=spec,
             experience_years=int(exp) if exp.isdigit() else 0,
-            hospital=hospital,
-            hospital_slug = clean_slug(hospital),
+            hospital=Hospital.for_name(hospital),
             city=city,
             slot_preference=slot,
             fee=fee_value,
@@ -508,90 +636,255 @@ def doctor_register(request):
 @login_required
 def find_doctor(request):
     q = request.GET.get("q", "").strip()
-    doctors = DoctorProfile.objects.filter(status="Active")
+    sort = request.GET.get("sort", "").strip()
+    doctors = DoctorProfile.objects.filter(status="Active").select_related("user", "hospital")
 
+    page = None
     if q:
-        doctors = doctors.filter(
-            Q(user__first_name__icontains=q)
-            | Q(user__last_name__icontains=q)
-            | Q(specialization__icontains=q)
-            | Q(hospital__icontains=q)
-            | Q(city__icontains=q)
+        # full-text index, best match first (see booking/search.py)
+        doctors = search.search_doctors(q, limit=FIND_DOCTOR_LIMIT)
+    else:
+        # everyone: by name, one keyset page at a time (?after=<token>)
+        page = paging.request_page(
+            request, doctors, ("user__first_name", "user__last_name", "id"),
+            page_size=FIND_DOCTOR_PAGE_SIZE,
         )
+        doctors = page.items
+
+    if sort == "soonest":
+        # The listed doctors (search results or this page) ordered by their
+        # first free slot; no free slot -> at the end
+        doctors = list(doctors)
+        settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+        first = {
+            doctor_id: slot_dt
+            for slot_dt, doctor_id in slots.earliest_available(
+                doctors,
+                k=len(doctors),
+                distinct_doctors=True,
+                default_minutes=settings_obj.default_slot_minutes,
+            )
+        }
+        for d in doctors:
+            d.next_slot = first.get(d.id)
+        doctors.sort(key=lambda d: (d.next_slot is None, d.next_slot or datetime.min))
 
     return render(
         request,
         "booking/find_doctor.html",
-        {"doctors": doctors, "q": q},
+        {"doctors": doctors, "page": page, "q": q, "sort": sort},
     )
 
 
+@login_required
+def doctor_autocomplete(request):
+    """
+    JSON suggestions for the find-doctor search box: ?q=<prefix words>.
+    """
+    q = request.GET.get("q", "").strip()
+    results = []
+    if len(q) >= 2:
+        for d in search.search_doctors(q, limit=AUTOCOMPLETE_LIMIT):
+            results.append({
+                "id": d.id,
+                "name": f"Dr. {d.user.first_name} {d.user.last_name}".strip(),
+                "specialization": d.specialization,
+                "hospital": d.hospital.name,
+                "city": d.city,
+                "url": reverse("book_appointment", args=[d.id]),
+            })
+    return JsonResponse({"results": results})
+
+
 from datetime import date, datetime
 from django.utils import timezone
 
 @login_required
 def book_appointment(request, doctor_id=None):
     if not doctor_id and request.method != "POST":
-        doctors = DoctorProfile.objects.all()
         return render(
         request,
         "booking/book_appointment_2.html",
-        {"today": date.today(),"doctors":doctors},
+        {"today": date.today(), "hospitals": directory.hospitals()},
     )
 
     post_doctor_id = request.POST.get("doctor", "").strip()
     if post_doctor_id:
         doctor_id = post_doctor_id
-    doctor = get_object_or_404(DoctorProfile, id=doctor_id, status="Active")
+    doctor = get_object_or_404(
+        DoctorProfile.objects.select_related("user", "hospital", "department"),
+        id=doctor_id,
+        status="Active",
+    )
 
     if request.method == "POST":
-        department = request.POST.get("department", "").strip()
-        hospital = request.POST.get("hospital", "").strip()
         appt_date = request.POST.get("date", "").strip()
         appt_time = request.POST.get("time", "").strip()
         symptoms = request.POST.get("symptoms", "").strip()
 
-        appt = Appointment.objects.create(
-            patient=request.user,
-            doctor=doctor,
-            department=department,
-            hospital=hospital,
-            date=appt_date,
-            time=appt_time,
-            symptoms=symptoms,
-            status="Pending",
-        )
-
-        # Notifications:
-        # to patient
-        notify_user(
-            request.user,
-            message=f"Your appointment request with Dr. {doctor.user.get_full_name() or doctor.user.username} "
-                    f"on {appt.date} at {appt.time} has been submitted (status: Pending).",
-            link="/dashboard/patient/appointments/",
-        )
+        try:
+            appt_date_val = datetime.strptime(appt_date, "%Y-%m-%d").date()
+            appt_time_val = datetime.strptime(appt_time[:5], "%H:%M").time()
+        except ValueError:
+            messages.error(request, "Invalid date or time.")
+            return redirect("book_appointment", doctor_id=doctor.id)
+
+        settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+        if not slots.is_slot_free(
+            doctor,
+            appt_date_val,
+            appt_time_val,
+            default_minutes=settings_obj.default_slot_minutes,
+        ):
+            messages.error(request, "This time is not available. Please pick one of the free slots.")
+            return redirect("book_appointment", doctor_id=doctor.id)
 
-        # to doctor
-        notify_user(
-            doctor.user,
-            message=f"New appointment request from {request.user.get_full_name() or request.user.username} "
-                    f"on {appt.date} at {appt.time}.",
-            link="/dashboard/doctor/approvals/",
-        )
+        # Atomic claim: the DB lets only one booking per active slot through
+        try:
+            appt = slots.claim_slot(
+                patient=request.user,
+                doctor=doctor,
+                day=appt_date_val,
+                t=appt_time_val,
+                department=doctor.department,
+                hospital=doctor.hospital,
+                symptoms=symptoms,
+            )
+        except slots.SlotTaken:
+            messages.error(request, "Sorry, this slot was just taken. Please pick another time.")
+            return redirect("book_appointment", doctor_id=doctor.id)
+
+        # Notifications (one batch): to patient + to doctor
+        notify_many([
+            (
+                request.user,
+                f"Your appointment request with Dr. {doctor.user.get_full_name() or doctor.user.username} "
+                f"on {appt.date} at {appt.time} has been submitted (status: Pending).",
+                "/dashboard/patient/appointments/",
+            ),
+            (
+                doctor.user,
+                f"New appointment request from {request.user.get_full_name() or request.user.username} "
+                f"on {appt.date} at {appt.time}.",
+                "/dashboard/doctor/approvals/",
+            ),
+        ])
 
         messages.success(request, "Appointment booked successfully!")
         return redirect("patient_dashboard")
 
+    # Free slots for the next 7 days so the patient can pick one
+    settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+    today = timezone.localdate()
+    free = slots.free_slots(
+        doctor,
+        today,
+        today + timedelta(days=6),
+        default_minutes=settings_obj.default_slot_minutes,
+    )
+
     return render(
         request,
         "booking/book_appointment.html",
-        {"doctor": doctor, "today": date.today()},
+        {
+            "doctor": doctor,
+            "today": date.today(),
+            "free_days": sorted(free.items()),
+            "waitlist_days": waitlist.MAX_WINDOW_DAYS,
+        },
     )
 
 @login_required
 def my_appointments(request):
-    appts = Appointment.objects.filter(patient=request.user).order_by("-date", "-time")
-    return render(request, "booking/my_appointments.html", {"appts": appts})
+    """Patient's appointments, newest first, one keyset page at a time (?after=<token>)."""
+    appts = paging.request_page(
+        request,
+        Appointment.objects
+        .filter(patient=request.user)
+        .select_related("doctor__user", "hospital", "department", "feedback"),
+        ("-date", "-time", "-id"),
+    )
+    waiting = (
+        Waitlist.objects
+        .filter(patient=request.user, status__in=["Waiting", "Offered"])
+        .select_related("doctor", "doctor__user")
+    )
+    return render(
+        request,
+        "booking/my_appointments.html",
+        {"appts": appts, "page": appts, "waitlist_entries": waiting},
+    )
+
+@login_required
+def join_waitlist(request, doctor_id):
+    """
+    Patient joins a doctor's waitlist for a date window.
+    """
+    if request.method != "POST":
+        return HttpResponseForbidden("POST required")
+
+    doctor = get_object_or_404(DoctorProfile, id=doctor_id, status="Active")
+
+    try:
+        date_from = parse_date(request.POST.get("date_from", "").strip() or "")
+        date_to = parse_date(request.POST.get("date_to", "").strip() or "")
+    except ValueError:  # well formed but not a real date, e.g. 2024-02-30
+        date_from = date_to = None
+    if not date_from or not date_to or date_to < date_from:
+        messages.error(request, "Please choose a valid date window.")
+        return redirect("book_appointment", doctor_id=doctor.id)
+    if (date_to - date_from).days >= waitlist.MAX_WINDOW_DAYS:
+        messages.error(request, f"The date window can be at most {waitlist.MAX_WINDOW_DAYS} days.")
+        return redirect("book_appointment", doctor_id=doctor.id)
+    if date_to < timezone.localdate():
+        messages.error(request, "The date window is in the past.")
+        return redirect("book_appointment", doctor_id=doctor.id)
+
+    waitlist.join(request.user, doctor, date_from, date_to)
+    messages.success(
+        request,
+        "You are on the waitlist. We will notify you as soon as a slot frees up.",
+    )
+    return redirect("my_appointments")
+
+@login_required
+def leave_waitlist(request, entry_id):
+    if request.method != "POST":
+        return HttpResponseForbidden("POST required")
+
+    entry = get_object_or_404(
+        Waitlist,
+        id=entry_id,
+        patient=request.user,
+        status__in=["Waiting", "Offered"],
+    )
+    waitlist.leave(entry)
+    messages.success(request, "You left the waitlist.")
+    return redirect("my_appointments")
+
+@login_required
+def accept_waitlist_offer(request, appt_id):
+    """
+    Waitlisted patient accepts a held slot -> normal Pending request.
+    """
+    if request.method != "POST":
+        return HttpResponseForbidden("POST required")
+
+    appt = get_object_or_404(Appointment, id=appt_id, patient=request.user)
+    try:
+        waitlist.accept_offer(appt)
+    except waitlist.OfferUnavailable as exc:
+        messages.error(request, str(exc))
+        return redirect("my_appointments")
+
+    notify_user(
+        appt.doctor.user,
+        message=f"New appointment request from {request.user.get_full_name() or request.user.username} "
+                f"on {appt.date} at {appt.time} (from waitlist).",
+        link="/dashboard/doctor/approvals/",
+    )
+    messages.success(request, "Slot accepted. Your appointment request is now pending.")
+    return redirect("my_appointments")
 
 @login_required
 def cancel_appointment(request, appt_id):
@@ -622,6 +915,9 @@ def cancel_appointment(request, appt_id):
     appt.status = "Cancelled"
     appt.save(update_fields=["status"])
 
+    # Offer the freed slot to the next patient on the waitlist
+    notify_waitlist_offers([waitlist.slot_freed(appt)])
+
     # Notify doctor
     notify_user(
         appt.doctor.user,
@@ -665,10 +961,22 @@ def reschedule_appointment(request, appt_id):
         messages.error(request, "Choose a future date/time.")
         return redirect("reschedule_appointment", appt_id=appt.id)
 
-    appt.date = new_date_val
-    appt.time = new_time_val
-    appt.status = "Rescheduled"
-    appt.save(update_fields=["date", "time", "status"])
+    settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+    if not slots.is_slot_free(
+        appt.doctor,
+        new_date_val,
+        new_time_val,
+        exclude_appt_id=appt.id,
+        default_minutes=settings_obj.default_slot_minutes,
+    ):
+        messages.error(request, "This time is not available. Please pick one of the free slots.")
+        return redirect("reschedule_appointment", appt_id=appt.id)
+
+    try:
+        slots.move_slot(appt, new_date_val, new_time_val, "Rescheduled")
+    except slots.SlotTaken:
+        messages.error(request, "This slot is already booked. Please choose another time.")
+        return redirect("reschedule_appointment", appt_id=appt.id)
 
     messages.success(request, "Appointment rescheduled.")
     return redirect("my_appointments")
@@ -687,15 +995,9 @@ def doctor_dashboard(request):
 
     today = timezone.localdate()
 
-    today_appointments = Appointment.objects.filter(
-        doctor=profile,
-        date=today,
-    ).count()
-
-    pending_approvals = Appointment.objects.filter(
-        doctor=profile,
-        status="Pending",
-    ).count()
+    # counts come from the daily rollup (AppointmentDailyStats)
+    today_appointments = stats.total(doctor_id=profile.id, date_from=today, date_to=today)
+    pending_approvals = stats.total(doctor_id=profile.id, status="Pending")
 
     total_patients = (
         Appointment.objects.filter(doctor=profile)
@@ -717,7 +1019,8 @@ def doctor_dashboard(request):
 @login_required
 def doctor_approvals(request):
     """
-    List all pending appointments for this doctor.
+    List all pending appointments for this doctor, oldest first, one
+    keyset page at a time (?after=<token>).
     """
     try:
         doctor = DoctorProfile.objects.get(user=request.user)
@@ -725,15 +1028,18 @@ def doctor_approvals(request):
         # If somehow a non-doctor hits this, send them to patient dashboard
         return redirect("patient_dashboard")
 
-    pending_appointments = (
-        Appointment.objects.filter(doctor=doctor, status="Pending")
-        .order_by("date", "time")
+    pending_appointments = paging.request_page(
+        request,
+        Appointment.objects
+        .filter(doctor=doctor, status="Pending")
+        .select_related("patient"),
+        ("date", "time", "id"),
     )
 
     return render(
         request,
         "booking/doctor_approvals.html",
-        {"pending_appointments": pending_appointments},
+        {"pending_appointments": pending_appointments, "page": pending_appointments},
     )
 
 @login_required
@@ -768,6 +1074,8 @@ def doctor_reject(request, appt_id):
     appt.status = "Rejected"
     appt.save(update_fields=["status"])
 
+    notify_waitlist_offers([waitlist.slot_freed(appt)])
+
     notify_user(
         appt.patient,
         message=f"Your appointment with Dr. {appt.doctor.user.get_full_name() or appt.doctor.user.username} "
@@ -803,10 +1111,17 @@ def doctor_reschedule(request, appt_id):
         messages.error(request, "Invalid date/time.")
         return redirect("doctor_reschedule", appt_id=appt.id)
 
-    appt.date = nd
-    appt.time = nt
-    appt.status = "Rescheduled"
-    appt.save(update_fields=["date", "time", "status"])
+    settings_obj, _ = SystemSetting.objects.get_or_create(pk=1)
+    if not slots.is_slot_free(appt.doctor, nd, nt, exclude_appt_id=appt.id,
+                              default_minutes=settings_obj.default_slot_minutes):
+        messages.error(request, "This time is not one of your free slots.")
+        return redirect("doctor_reschedule", appt_id=appt.id)
+
+    try:
+        slots.move_slot(appt, nd, nt, "Rescheduled")
+    except slots.SlotTaken:
+        messages.error(request, "You already have an appointment in this slot.")
+        return redirect("doctor_reschedule", appt_id=appt.id)
 
     notify_user(
         appt.patient,
@@ -822,7 +1137,8 @@ def doctor_reschedule(request, appt_id):
 def doctor_appointments(request):
     """
     Doctor: view appointments with simple filters.
-    Shows ALL appointments for this doctor.
+    Shows ALL appointments for this doctor, newest first, one keyset page
+    at a time (?after=<token>).
     """
     try:
         doctor = DoctorProfile.objects.get(user=request.user)
@@ -849,20 +1165,30 @@ def doctor_appointments(request):
     if status:
         qs = qs.filter(status=status)
 
-    appointments = qs.order_by("-date", "-time")  # newest first
+    appointments = paging.request_page(
+        request,
+        qs.select_related("patient"),
+        ("-date", "-time", "-id"),  # newest first
+    )
 
     context = {
         "appointments": appointments,
+        "page": appointments,
         "q": q,
         "status": status,
     }
     return render(request, "booking/doctor_appointments.html", context)
 
 
+# patient lists by name; username makes the order unique (booking_user_name_idx)
+PATIENT_ORDERING = ("first_name", "last_name", "username")
+
+
 @login_required
 def doctor_patients(request):
     """
-    Doctor: list unique patients who have appointments with this doctor.
+    Doctor: list unique patients who have appointments with this doctor,
+    by name, one keyset page at a time (?after=<token>).
     """
     try:
         doctor = DoctorProfile.objects.get(user=request.user)
@@ -888,18 +1214,25 @@ def doctor_patients(request):
             | Q(email__icontains=q)
         )
 
-    # patient_appointments = related_name on Appointment.patient
-    patients = (
-        patients_qs
-        .annotate(total_appointments=Count("patient_appointments"))
-        .order_by("first_name", "last_name")
+    patients = paging.request_page(request, patients_qs, PATIENT_ORDERING)
+
+    # appointment counts of this page's patients only (one grouped query)
+    totals = dict(
+        Appointment.objects
+        .filter(patient_id__in=[p.id for p in patients])
+        .values_list("patient_id")
+        .annotate(total=Count("id"))
+        .order_by()
     )
+    for p in patients:
+        p.total_appointments = totals.get(p.id, 0)
 
     return render(
         request,
         "booking/doctor_patients.html",
         {
             "patients": patients,
+            "page": patients,
             "q": q,
         },
     )
@@ -912,7 +1245,8 @@ def doctor_schedule(request):
 
     - POST: update schedule fields on DoctorProfile
     - GET: show all non-completed, non-pending, non-cancelled appointments
-      for this doctor (Approved + Rescheduled only), ordered oldest first.
+      for this doctor (Approved + Rescheduled only), ordered oldest first,
+      one keyset page at a time (?after=<token>).
     """
     try:
         profile = DoctorProfile.objects.get(user=request.user)
@@ -960,19 +1294,24 @@ def doctor_schedule(request):
         profile.schedule_published = published
         profile.save()
 
+        # slot grid may have changed -> cached availability is stale
+        availability.invalidate_doctor(profile.id)
+
         messages.success(request, "Schedule updated.")
         return redirect("doctor_schedule")
 
     # --- SCHEDULE LIST (GET) ---
     # Only appointments that are still to be done:
     # Approved + Rescheduled; everything else excluded.
-    upcoming_appointments = (
+    upcoming_appointments = paging.request_page(
+        request,
         Appointment.objects
         .filter(
             doctor=profile,
             status__in=["Approved", "Rescheduled"],
         )
-        .order_by("date", "time")  # oldest first
+        .select_related("patient"),
+        ("date", "time", "id"),  # oldest first
     )
 
     return render(
@@ -981,6 +1320,7 @@ def doctor_schedule(request):
         {
             "profile": profile,
             "upcoming_appointments": upcoming_appointments,
+            "page": upcoming_appointments,
         },
     )
 
@@ -1006,7 +1346,9 @@ def doctor_profile(request):
 
         # --- DoctorProfile fields (use default filters so it doesn't break if some are empty) ---
         profile.specialization = request.POST.get("specialization", "").strip() or profile.specialization
-        profile.hospital = request.POST.get("hospital", "").strip() or profile.hospital
+        hospital_name = request.POST.get("hospital", "").strip()
+        if hospital_name and hospital_name != profile.hospital.name:
+            profile.hospital = Hospital.for_name(hospital_name)
         profile.city = request.POST.get("city", "").strip() or profile.city
         profile.phone = request.POST.get("phone", "").strip() or getattr(profile, "phone", "")
         profile.registration_no = request.POST.get("registration_no", "").strip() or getattr(profile, "registration_no", "")
@@ -1030,7 +1372,6 @@ def doctor_profile(request):
     return render(request, "booking/doctor_profile.html", context)
 
 from django.http import HttpResponseForbidden
-from django.core.mail import send_mail
 from django.conf import settings
 from .models import Appointment, DoctorProfile, Notification  # adjust import if needed
 from django.utils import timezone
@@ -1059,36 +1400,32 @@ def doctor_mark_completed(request, appt_id):
     appt.status = "Completed"
     appt.save(update_fields=["status"])
 
-    # Create notification for patient
-    Notification.objects.create(
-        user=appt.patient,
+    # Create notification for patient (the email below has its own text)
+    notify_user(
+        appt.patient,
         message=(
             f"Your appointment with Dr. {appt.doctor.user.first_name} "
             f"{appt.doctor.user.last_name} on {appt.date} at {appt.time} "
             f"has been marked as COMPLETED."
         ),
         link="/dashboard/patient/appointments/",
+        send_email=False,
     )
 
-    # Email to patient (same pattern as your other mails)
-    try:
-        if appt.patient.email:
-            send_mail(
-                subject="DABS – Appointment completed",
-                message=(
-                    f"Dear {appt.patient.get_full_name() or appt.patient.username},\n\n"
-                    f"Your appointment with Dr. {appt.doctor.user.first_name} "
-                    f"{appt.doctor.user.last_name} on {appt.date} at {appt.time} "
-                    f"has been marked as COMPLETED in the system.\n\n"
-                    f"You can now log in to DABS to review details or give feedback."
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[appt.patient.email],
-                fail_silently=True,
-            )
-    except Exception:
-        # We don't crash the page if email fails
-        pass
+    # Email to patient (queued in the outbox)
+    if appt.patient.email:
+        outbox.enqueue(
+            "DABS – Appointment completed",
+            (
+                f"Dear {appt.patient.get_full_name() or appt.patient.username},\n\n"
+                f"Your appointment with Dr. {appt.doctor.user.first_name} "
+                f"{appt.doctor.user.last_name} on {appt.date} at {appt.time} "
+                f"has been marked as COMPLETED in the system.\n\n"
+                f"You can now log in to DABS to review details or give feedback."
+            ),
+            [appt.patient.email],
+            from_email=settings.DEFAULT_FROM_EMAIL,
+        )
 
     messages.success(request, "Appointment marked as completed.")
     return redirect("doctor_schedule")
@@ -1111,13 +1448,15 @@ def admin_dashboard(request):
     total_patients = UserModel.objects.filter(is_staff=False).count()
 
     today = timezone.localdate()
-    todays_appointments = Appointment.objects.filter(date=today).count()
+    todays_appointments = stats.total(date_from=today, date_to=today)
 
     context = {
         "total_doctors": total_doctors,
         "pending_doctors": pending_doctors,
         "total_patients": total_patients,
         "todays_appointments": todays_appointments,
+        "availability_stats": availability.stats(),
+        "log_stats": logsink.stats(),
         "section": "dashboard",
     }
     return render(request, "booking/admin_dashboard.html", context)
@@ -1155,7 +1494,7 @@ def admin_pending_doctors(request):
 
     pending = (
         DoctorProfile.objects.filter(status="Pending")
-        .select_related("user")
+        .select_related("user", "hospital")
         .order_by("user__first_name", "user__last_name")
     )
 
@@ -1176,7 +1515,7 @@ def admin_doctor_applications(request):
 
     pending_doctors = (
         DoctorProfile.objects.filter(status="Pending")
-        .select_related("user")
+        .select_related("user", "hospital")
         .order_by("user__first_name", "user__last_name")
     )
     return render(
@@ -1196,6 +1535,7 @@ def admin_doctors(request):
     Admin: Manage doctors.
     - Filter by text / status
     - Actions: Activate / Deactivate / Delete
+    - By name, one keyset page at a time (?after=<token>)
     """
     if not request.user.is_staff:
         return redirect("home")
@@ -1234,7 +1574,7 @@ def admin_doctors(request):
     q = request.GET.get("q", "").strip()
     status = request.GET.get("status", "").strip()
 
-    doctors = DoctorProfile.objects.select_related("user").all()
+    doctors = DoctorProfile.objects.select_related("user", "hospital").all()
 
     if q:
         doctors = doctors.filter(
@@ -1242,20 +1582,21 @@ def admin_doctors(request):
             | Q(user__last_name__icontains=q)
             | Q(user__email__icontains=q)
             | Q(specialization__icontains=q)
-            | Q(hospital__icontains=q)
+            | Q(hospital__name__icontains=q)
             | Q(city__icontains=q)
         )
 
     if status:
         doctors = doctors.filter(status=status)
 
-    doctors = doctors.order_by("user__first_name", "user__last_name")
+    doctors = paging.request_page(request, doctors, ("user__first_name", "user__last_name", "id"))
 
     return render(
         request,
         "booking/admin_doctors.html",
         {
             "doctors": doctors,
+            "page": doctors,
             "q": q,
             "status": status,
             "section": "doctors",
@@ -1272,6 +1613,7 @@ def admin_patients(request):
     """
     Admin: list and manage patients (non-staff users that are not doctors).
     Actions: Activate / Deactivate / Delete
+    By name, one keyset page at a time (?after=<token>).
     """
     if not request.user.is_staff:
         return redirect("home")
@@ -1327,13 +1669,14 @@ def admin_patients(request):
             | Q(email__icontains=q)
         )
 
-    patients = patients.order_by("first_name", "last_name", "username")
+    patients = paging.request_page(request, patients, PATIENT_ORDERING)
 
     return render(
         request,
         "booking/admin_patients.html",
         {
             "patients": patients,
+            "page": patients,
             "q": q,
             "section": "patients",
         },
@@ -1345,252 +1688,362 @@ def admin_patients(request):
 # ADMIN: APPOINTMENTS + CSV
 # ============================
 
-import csv
-
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
-from django.http import HttpResponse
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.utils.dateparse import parse_date
 
-from .models import Appointment
+from .models import Appointment, ExportJob
 
 
 @login_required
 def admin_appointments(request):
     """
     Admin: view all appointments with filters.
-    Shows ALL appointments by default (no date limit).
+    Shows ALL appointments by default (no date limit), newest first, one
+    keyset page at a time (?after=<token>). The page's ids are read first
+    (from appointment_date_idx when unfiltered), then only those rows are
+    loaded with their patient / doctor / hospital.
     """
     if not request.user.is_staff:
         return redirect("home")
 
-    # Correct relations: patient (User), doctor (DoctorProfile -> User)
-    qs = (
-        Appointment.objects
-        .select_related("patient", "doctor", "doctor__user")
-        .order_by("-date", "-time")
+    qs, filters = exports.filter_appointments(request.GET)
+    page = paging.request_page(request, qs, exports.EXPORT_ORDERING, ids_first=True)
+
+    context = {
+        "section": "appointments",
+        "appointments": page,
+        "page": page,
+        "q": filters["q"],
+        "status_filter": filters["status"],
+        "start_date": filters["start_date"],
+        "end_date": filters["end_date"],
+    }
+    return render(request, "booking/admin_appointments.html", context)
+
+
+@login_required
+def admin_appointments_export(request):
+    """
+    Export filtered appointments to CSV, streamed (see booking/exports.py).
+    Uses the same filters as admin_appointments.
+    """
+    if not request.user.is_staff:
+        return redirect("home")
+
+    appts, _ = exports.filter_appointments(request.GET)
+
+    # --- Stream CSV (tuples in chunks, never the whole file in memory) ---
+    response = StreamingHttpResponse(
+        exports.csv_lines(exports.appointment_csv_rows(appts)),
+        content_type="text/csv",
     )
+    response["Content-Disposition"] = 'attachment; filename="dabs_appointments.csv"'
 
-    # --- Filters from GET ---
-    q = request.GET.get("q", "").strip()
-    status = request.GET.get("status", "").strip()
-    start_date_raw = request.GET.get("start_date", "").strip()
-    end_date_raw = request.GET.get("end_date", "").strip()
+    return response
 
-    # Text search across patient / doctor / hospital / department
-    if q:
-        qs = qs.filter(
-            Q(patient__first_name__icontains=q)
-            | Q(patient__last_name__icontains=q)
-            | Q(patient__username__icontains=q)
-            | Q(patient__email__icontains=q)
-            | Q(doctor__user__first_name__icontains=q)
-            | Q(doctor__user__last_name__icontains=q)
-            | Q(doctor__specialization__icontains=q)
-            | Q(hospital__icontains=q)
-            | Q(department__icontains=q)
-        )
+@login_required
+def admin_export_job_create(request):
+    """
+    Queue a background CSV export for the admin_appointments filters
+    (POST). An identical export requested a few minutes ago is reused.
+    """
+    if not request.user.is_staff:
+        return redirect("home")
+    if request.method != "POST":
+        return redirect("admin_appointments")
 
-    # Status filter
-    if status:
-        qs = qs.filter(status=status)
+    job, _ = exportjobs.request_export(request.POST, user=request.user)
+    return redirect("admin_export_job", job_id=job.id)
 
-    # Date range filters
-    start_date = parse_date(start_date_raw) if start_date_raw else None
-    end_date = parse_date(end_date_raw) if end_date_raw else None
 
-    if start_date:
-        qs = qs.filter(date__gte=start_date)
-    if end_date:
-        qs = qs.filter(date__lte=end_date)
+@login_required
+def admin_export_job(request, job_id):
+    """Progress of a background export, with its download link when done."""
+    if not request.user.is_staff:
+        return redirect("home")
 
+    job = get_object_or_404(ExportJob.objects.select_related("requested_by"), id=job_id)
     context = {
         "section": "appointments",
-        "appointments": qs,
-        "q": q,
-        "status_filter": status,
-        "start_date": start_date_raw,
-        "end_date": end_date_raw,
+        "job": job,
+        "filters_text": ", ".join(f"{name}={value}" for name, value in job.filters.items() if value),
+        "running": job.status in ("Pending", "Running"),
     }
-    return render(request, "booking/admin_appointments.html", context)
+    return render(request, "booking/admin_export_job.html", context)
+
+
+EXPORT_DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+
+def _byte_range(header: str, size: int):
+    """
+    (start, end) of a single "bytes=start-end" Range header, end inclusive.
+    None means "send the whole file" (no / malformed / multi-range header);
+    (size, size) means the range starts past the end of the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:  # "-N": the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return size, size
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _file_blocks(path, start: int, length: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            block = fh.read(min(EXPORT_DOWNLOAD_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
 
 
 @login_required
-def admin_appointments_export(request):
+def admin_export_download(request, job_id):
     """
-    Export filtered appointments to CSV.
-    Uses the same filters as admin_appointments.
+    The gzip file of a finished export. Supports single Range requests
+    (and If-Range) so an interrupted download can be resumed.
     """
     if not request.user.is_staff:
         return redirect("home")
 
-    appts = (
-        Appointment.objects
-        .select_related("patient", "doctor", "doctor__user")
-        .order_by("-date", "-time")
+    job = get_object_or_404(ExportJob, id=job_id, status="Done")
+    path = exportjobs.file_path(job)
+    if not path.exists():
+        raise Http404("Export file has expired.")
+
+    size = path.stat().st_size
+    etag = f'"export-{job.id}-{size}"'
+    byte_range = None
+    if "HTTP_RANGE" in request.META:
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if not if_range or if_range == etag:
+            byte_range = _byte_range(request.META["HTTP_RANGE"], size)
+
+    if byte_range == (size, size):
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        _file_blocks(path, start, end - start + 1),
+        content_type="application/gzip",
+        status=206 if byte_range else 200,
     )
+    if byte_range:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = f'attachment; filename="dabs_appointments-{job.id}.csv.gz"'
+    return response
 
-    # Same query params as template:
-    # ?q=&status=&start_date=&end_date=
-    q = request.GET.get("q", "").strip()
-    status = request.GET.get("status", "").strip()
-    start_date_raw = request.GET.get("start_date", "").strip()
-    end_date_raw = request.GET.get("end_date", "").strip()
 
-    if q:
-        appts = appts.filter(
-            Q(patient__first_name__icontains=q)
-            | Q(patient__last_name__icontains=q)
-            | Q(patient__username__icontains=q)
-            | Q(patient__email__icontains=q)
-            | Q(doctor__user__first_name__icontains=q)
-            | Q(doctor__user__last_name__icontains=q)
-            | Q(doctor__specialization__icontains=q)
-            | Q(hospital__icontains=q)
-            | Q(department__icontains=q)
-        )
+@login_required
+def admin_data_export(request, dataset, fmt):
+    """
+    Streamed JSONL / Parquet export of a dataset (appointments, systemlog)
+    for analytics, see booking/dataexports.py. ?since=<watermark> returns
+    only what changed after a previous pull; the X-Export-Watermark header
+    holds the value to pass next time.
+    """
+    if not request.user.is_staff:
+        return redirect("home")
 
-    if status:
-        appts = appts.filter(status=status)
+    spec = dataexports.DATASETS.get(dataset)
+    if spec is None or fmt not in dataexports.available_formats():
+        raise Http404("Unknown dataset or format.")
 
-    start_date = parse_date(start_date_raw) if start_date_raw else None
-    end_date = parse_date(end_date_raw) if end_date_raw else None
+    since = None
+    since_raw = request.GET.get("since", "").strip()
+    if since_raw:
+        try:
+            since = dataexports.parse_watermark(spec, since_raw)
+        except ValueError:
+            return HttpResponse("Invalid 'since' watermark.", status=400, content_type="text/plain")
 
-    if start_date:
-        appts = appts.filter(date__gte=start_date)
-    if end_date:
-        appts = appts.filter(date__lte=end_date)
+    until = dataexports.current_watermark(spec, since)
+    response = StreamingHttpResponse(
+        dataexports.blocks(spec, fmt, since=since, until=until),
+        content_type=dataexports.FORMATS[fmt],
+    )
+    response["X-Export-Watermark"] = dataexports.format_watermark(until)
+    response["Content-Disposition"] = f'attachment; filename="dabs_{dataset}.{fmt}"'
+    return response
 
-    # --- Build CSV ---
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="dabs_appointments.csv"'
 
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "ID",
-            "Appt Code",
-            "Patient",
-            "Patient Email",
-            "Doctor",
-            "Specialization",
-            "Hospital",
-            "Date",
-            "Time",
-            "Status",
-        ]
-    )
+# ============================
+# ADMIN: BULK IMPORT
+# ============================
 
-    for a in appts:
-        # Patient details
-        patient_user = a.patient
-        if patient_user:
-            patient_name = patient_user.get_full_name() or patient_user.username
-            patient_email = patient_user.email
-        else:
-            patient_name = ""
-            patient_email = ""
-
-        # Doctor details
-        doctor_user = a.doctor.user if a.doctor and a.doctor.user else None
-        if doctor_user:
-            base_name = doctor_user.get_full_name() or doctor_user.username
-            doctor_name = f"Dr. {base_name}"
-        else:
-            doctor_name = ""
-
-        writer.writerow(
-            [
-                a.id,
-                f"A-10{a.id}",  # Appointment code
-                patient_name,
-                patient_email,
-                doctor_name,
-                a.doctor.specialization if a.doctor else "",
-                a.hospital,
-                a.date.isoformat() if a.date else "",
-                a.time.strftime("%H:%M") if a.time else "",
-                a.status,
-            ]
-        )
+import io
 
-    return response
 
+@login_required
+def admin_import(request):
+    """
+    Upload a CSV of doctors or historical appointments (see
+    booking/imports.py). The file is parsed as a stream and imported in
+    chunks; invalid rows are listed with their line numbers.
+    Very large files are better imported with the import_csv command.
+    """
+    if not request.user.is_staff:
+        return redirect("home")
+
+    context = {
+        "kinds": imports.KINDS,
+        "doctor_columns": imports.DOCTOR_COLUMNS + imports.DOCTOR_OPTIONAL_COLUMNS,
+        "appointment_columns": imports.APPOINTMENT_COLUMNS + imports.APPOINTMENT_OPTIONAL_COLUMNS,
+        "result": None,
+    }
+
+    if request.method == "POST":
+        kind = request.POST.get("kind", "")
+        upload = request.FILES.get("file")
+        dry_run = request.POST.get("dry_run") == "on"
+        context["kind"] = kind
+        if kind not in imports.KINDS or upload is None:
+            messages.error(request, "Choose what to import and a CSV file.")
+            return redirect("admin_import")
+
+        fh = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        try:
+            result = imports.run(kind, fh, user=request.user, dry_run=dry_run)
+        except (UnicodeDecodeError, ValueError) as exc:
+            messages.error(request, f"Import failed: {exc}")
+            return redirect("admin_import")
+
+        context["result"] = result
+        if result.invalid:
+            messages.warning(request, f"Imported with errors: {result.summary()}.")
+        else:
+            messages.success(request, f"{'Checked' if dry_run else 'Imported'}: {result.summary()}.")
+
+    return render(request, "booking/admin_import.html", context)
 
 
 # ============================
 # ADMIN: REPORTS
 # ============================
 
+from collections import Counter
+
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.db.models import Q, Sum
 from django.utils.dateparse import parse_date
 
+REPORTS_DAYS = 30
+REPORTS_HISTORY_PAGE_SIZE = 50
+
+
 @login_required
 def admin_reports(request):
     """
     Admin Reports:
-      - Filters: doctor, status, start_date, end_date
-      - Summary cards
-      - Status table
-      - Daily breakdown (SQLite-safe, no TruncDate)
-      - Appointment history table (first 100 rows)
+      - Filters: doctor, hospital, status, start_date, end_date
+      - One aggregate query per grain over the daily rollup
+        (AppointmentDailyStats), not over the appointments:
+          status   -> summary cards + status table
+          date     -> daily breakdown (conditional sums, newest 30 days)
+          hospital -> per-hospital table (integer hospital_id)
+      - Appointment history, keyset-paged (?after=<token>)
     """
     if not request.user.is_staff:
         return redirect("home")
 
     # ----- read filters from GET -----
     doctor_id = (request.GET.get("doctor") or "").strip()
+    hospital_id = (request.GET.get("hospital") or "").strip()
     status = (request.GET.get("status") or "").strip()
     start_date_str = (request.GET.get("start_date") or "").strip()
     end_date_str = (request.GET.get("end_date") or "").strip()
+    if doctor_id and not doctor_id.isdigit():
+        messages.warning(request, f"Ignored the invalid doctor '{doctor_id}'.")
+        doctor_id = ""
 
-    # ----- base queryset -----
-    qs = (
-        Appointment.objects
-        .select_related("patient", "patientuser", "doctor", "doctoruser")
-        .order_by("-date", "-time")
-    )
+    # ----- date filters -----
+    start_date = _date_param(request, "start_date")
+    end_date = _date_param(request, "end_date")
+
+    # ----- base querysets: daily counts for the grains, appointments for history -----
+    rollup_filters = {
+        "date_from": start_date,
+        "date_to": end_date,
+        "doctor_id": doctor_id or None,
+        "hospital_id": int(hospital_id) if hospital_id.isdigit() else None,
+        "status": status or None,
+    }
+    counts = stats.counts(**rollup_filters)
 
+    qs = Appointment.objects.order_by()
     if doctor_id:
         qs = qs.filter(doctor_id=doctor_id)
+    if hospital_id.isdigit():
+        qs = qs.filter(hospital_id=int(hospital_id))
     if status:
         qs = qs.filter(status=status)
-
-    # ----- date filters -----
-    start_date = parse_date(start_date_str) if start_date_str else None
-    end_date = parse_date(end_date_str) if end_date_str else None
-
     if start_date:
         qs = qs.filter(date__gte=start_date)
     if end_date:
         qs = qs.filter(date__lte=end_date)
 
-    # ----- summary numbers -----
-    total_appointments = qs.count()
-    pending_count = qs.filter(status="Pending").count()
-    approved_count = qs.filter(status="Approved").count()
-    cancelled_count = qs.filter(status="Cancelled").count()
+    # ----- status grain: summary cards + status breakdown -----
+    status_totals = Counter(dict(counts.values_list("status").annotate(total=Sum("count"))))
+    total_appointments = sum(status_totals.values())
+    status_counts = [
+        {"status": name, "total": total}
+        for name, total in sorted(status_totals.items())
+    ]
 
-    # ----- status breakdown -----
-    status_counts = (
-        qs.values("status")
-        .annotate(total=Count("id"))
-        .order_by()
-    )
+    # ----- hospital grain (names looked up once, not joined) -----
+    hospitals = list(Hospital.objects.all())
+    hospital_names = {h.id: h.name for h in hospitals}
+    hospital_counts = [
+        {"hospital": hospital_names.get(row["hospital_id"], ""), **row}
+        for row in (
+            counts.values("hospital_id")
+            .annotate(total=Sum("count"))
+            .order_by("-total")
+        )
+    ]
 
-    # ----- daily overview (max 30 days in result) -----
-    daily_counts = (
-        qs.filter(date__isnull=False)
-        .values("date")
+    # ----- date grain: daily overview (newest REPORTS_DAYS days in result) -----
+    daily_counts = list(
+        counts.values("date")
         .annotate(
-            total=Count("id"),
-            pending=Count("id", filter=Q(status="Pending")),
-            approved=Count("id", filter=Q(status="Approved")),
-            cancelled=Count("id", filter=Q(status="Cancelled")),
+            total=Sum("count"),
+            pending=Sum("count", filter=Q(status="Pending"), default=0),
+            approved=Sum("count", filter=Q(status="Approved"), default=0),
+            cancelled=Sum("count", filter=Q(status="Cancelled"), default=0),
         )
-        .order_by("-date")[:30]
+        .order_by("-date")[:REPORTS_DAYS]
+    )
+
+    # ----- appointment history: its own paged query -----
+    history = paging.request_page(
+        request,
+        qs.select_related("patient", "doctor", "doctor__user", "hospital"),
+        ("-date", "-time", "-id"),
+        page_size=REPORTS_HISTORY_PAGE_SIZE,
     )
 
     # ----- list of doctors for dropdown -----
@@ -1603,21 +2056,25 @@ def admin_reports(request):
     context = {
         "section": "reports",
         "doctors": doctors,
+        "hospitals": hospitals,
         # used in template to keep selected values
         "doctor_filter": int(doctor_id) if doctor_id else None,
+        "hospital_filter": int(hospital_id) if hospital_id.isdigit() else None,
         "status_filter": status,
         "start_date": start_date_str,
         "end_date": end_date_str,
 
         "total_appointments": total_appointments,
-        "pending_count": pending_count,
-        "approved_count": approved_count,
-        "cancelled_count": cancelled_count,
+        "pending_count": status_totals["Pending"],
+        "approved_count": status_totals["Approved"],
+        "cancelled_count": status_totals["Cancelled"],
         "status_counts": status_counts,
+        "hospital_counts": hospital_counts,
         "daily_counts": daily_counts,
 
-        # Appointment History (first 100 rows, but all filters applied)
-        "appointments": qs[:100],
+        # Appointment history (one page, all filters applied)
+        "appointments": history,
+        "page": history,
     }
     return render(request, "booking/admin_reports.html", context)
 
@@ -1669,6 +2126,15 @@ def admin_settings(request):
             request.POST.get("maintenance_mode") == "on"
         )
 
+        retention = request.POST.get("log_retention_days", "").strip()
+        try:
+            settings_obj.log_retention_days = max(int(retention), 0) if retention else settings_obj.log_retention_days
+        except ValueError:
+            pass
+        settings_obj.archive_old_logs = (
+            request.POST.get("archive_old_logs") == "on"
+        )
+
         settings_obj.updated_by = request.user
         settings_obj.save()
 
@@ -1689,14 +2155,16 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from django.shortcuts import redirect, render
 
-from .models import SystemLog
+from .models import SystemLog, SystemLogRollup
 
 
 @login_required
 def admin_logs(request):
     """
-    Admin: view system logs (user + appointment events).
-    Supports simple filters by event type and username.
+    Admin: view system logs (user + appointment events), newest first.
+    Filters: event type, username / name, date range. Pages are keyset
+    pages on (created_at, id) (?after=<token>), so any page of history
+    costs the same as the first one.
     """
     if not request.user.is_staff:
         return redirect("home")
@@ -1705,24 +2173,47 @@ def admin_logs(request):
 
     event = request.GET.get("event", "").strip()
     user_q = request.GET.get("user", "").strip()
+    date_from = _date_param(request, "from")
+    date_to = _date_param(request, "to")
 
     if event:
         logs = logs.filter(event_type=event)
 
     if user_q:
-        logs = logs.filter(
-            Q(user__username__icontains=user_q)
-            | Q(user__first_name__icontains=user_q)
-            | Q(user__last_name__icontains=user_q)
-        )
-
-    # limit to last 300 to avoid huge tables
-    logs = logs[:300]
+        # match on the (small) user table first, then use the (user, created_at) index
+        matching_users = get_user_model().objects.filter(
+            Q(username__icontains=user_q)
+            | Q(first_name__icontains=user_q)
+            | Q(last_name__icontains=user_q)
+        ).values("id")
+        logs = logs.filter(user__in=matching_users)
+
+    if date_from:
+        logs = logs.filter(created_at__gte=timezone.make_aware(datetime.combine(date_from, datetime.min.time())))
+    if date_to:
+        until = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        # a cursor below "until" is the tighter bound; leaving "until" out
+        # then lets the index seek straight to the cursor
+        cursor = paging.decode_token(request.GET.get("after", ""), 2)
+        cursor_at = parse_datetime(cursor[0]) if cursor else None
+        if cursor_at is None or cursor_at >= until:
+            logs = logs.filter(created_at__lt=until)
+
+    page = paging.request_page(request, logs, ("-created_at", "-id"), page_size=LOGS_PAGE_SIZE)
+
+    # counts of purged days (see booking/retention.py)
+    rollups = SystemLogRollup.objects.all()
+    if event:
+        rollups = rollups.filter(event_type=event)
 
     context = {
         "section": "logs",
-        "logs": logs,
+        "logs": page,
+        "page": page,
+        "rollups": rollups[:60],
         "event": event,
         "user_q": user_q,
+        "date_from": date_from.isoformat() if date_from else "",
+        "date_to": date_to.isoformat() if date_to else "",
     }
     return render(request, "booking/admin_logs.html", context)
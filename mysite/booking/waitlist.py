@@ -0,0 +1,244 @@
+"""
+Waitlist engine.
+
+Patients queue for a doctor and a date window. When an appointment stops
+holding its slot (patient cancel, doctor reject, expired offer) the slot is
+offered to the first waiting patient whose window contains that date:
+
+- the slot is held with an 'Offered' Appointment, so the unique slot
+  constraint keeps everyone else out while the offer is open
+- the offer expires after OFFER_MINUTES; expire_offers() releases it and
+  passes the slot on to the next waiter
+
+A cancellation walks the doctor's Waiting entries oldest first on
+waitlist_fifo_idx, which also holds each entry's window: the window check
+is done on the index and the walk stops at the first OFFER_BATCH entries
+whose window contains the freed date, without sorting the queue.
+Windows are at most MAX_WINDOW_DAYS long.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import slots
+from .notifications import notify_waitlist_offers
+from .models import Appointment, DoctorProfile, Waitlist
+
+
+# How long a waitlisted patient has to accept an offered slot
+OFFER_MINUTES = getattr(settings, "WAITLIST_OFFER_MINUTES", 120)
+
+# Longest date window a patient can wait for
+MAX_WINDOW_DAYS = getattr(settings, "WAITLIST_MAX_WINDOW_DAYS", 60)
+
+# Max waiters looked at per freed slot (skips entries grabbed concurrently)
+OFFER_BATCH = 20
+
+
+class OfferUnavailable(Exception):
+    """The offer is gone (expired, declined or already used)."""
+
+
+class _EntryTaken(Exception):
+    """Another request offered a slot to this waitlist entry first."""
+
+
+def join(patient, doctor: DoctorProfile, date_from: date, date_to: date) -> Waitlist:
+    """Put a patient on a doctor's waitlist (one open entry per doctor)."""
+    entry = Waitlist.objects.filter(
+        patient=patient,
+        doctor=doctor,
+        status__in=["Waiting", "Offered"],
+    ).first()
+    if entry:
+        if entry.status == "Waiting":
+            entry.date_from, entry.date_to = date_from, date_to
+            entry.save(update_fields=["date_from", "date_to"])
+        return entry
+
+    return Waitlist.objects.create(
+        patient=patient,
+        doctor=doctor,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+
+def leave(entry: Waitlist) -> None:
+    """Patient leaves the waitlist (an open offer is released too)."""
+    appt = entry.appointment if entry.status == "Offered" else None
+    entry.status = "Cancelled"
+    entry.save(update_fields=["status"])
+    if appt and appt.status == "Offered":
+        appt.status = "Cancelled"
+        appt.save(update_fields=["status"])
+        notify_waitlist_offers([offer_slot(
+            appt.doctor, appt.date, appt.time,
+            department_id=appt.department_id, hospital_id=appt.hospital_id,
+        )])
+
+
+def offer_slot(doctor: DoctorProfile, day: date, t: time, *,
+               department_id: Optional[int] = None, hospital_id: Optional[int] = None,
+               now: Optional[datetime] = None) -> Optional[Waitlist]:
+    """
+    Offer a free slot to the next eligible waiter.
+    Returns the offered Waitlist entry (patient preloaded), or None if nobody
+    is waiting, the slot is in the past or it was already taken.
+    """
+    now = now or timezone.now()
+    slot_dt = datetime.combine(day, t)
+    if timezone.is_naive(slot_dt):
+        slot_dt = timezone.make_aware(slot_dt)
+    if slot_dt <= now:
+        return None
+
+    candidates = (
+        Waitlist.objects
+        .filter(
+            doctor=doctor,
+            status="Waiting",
+            # checked on waitlist_fifo_idx while walking it in order
+            date_from__lte=day,
+            date_to__gte=day,
+        )
+        .select_related("patient")
+        .order_by("created_at", "id")[:OFFER_BATCH]
+    )
+
+    expires = min(now + timedelta(minutes=OFFER_MINUTES), slot_dt)
+
+    for entry in candidates:
+        try:
+            with transaction.atomic():
+                appt = slots.claim_slot(
+                    patient=entry.patient,
+                    doctor=doctor,
+                    day=day,
+                    t=t,
+                    status="Offered",
+                    department_id=department_id or doctor.department_id,
+                    hospital_id=hospital_id or doctor.hospital_id,
+                )
+                # conditional update: only one cancellation can win this entry
+                won = Waitlist.objects.filter(id=entry.id, status="Waiting").update(
+                    status="Offered",
+                    appointment=appt,
+                    offer_expires_at=expires,
+                )
+                if not won:
+                    raise _EntryTaken()
+        except _EntryTaken:
+            continue
+        except slots.SlotTaken:
+            # someone booked the slot in the meantime
+            return None
+
+        entry.status = "Offered"
+        entry.appointment = appt
+        entry.offer_expires_at = expires
+        return entry
+
+    return None
+
+
+def slot_freed(appt: Appointment, now: Optional[datetime] = None) -> Optional[Waitlist]:
+    """
+    Call after appt stopped holding its slot (cancelled / rejected).
+    Closes the waitlist offer appt belonged to (if any) and offers the slot
+    to the next waiter.
+    """
+    Waitlist.objects.filter(appointment=appt, status="Offered").update(status="Declined")
+    return offer_slot(
+        appt.doctor,
+        appt.date,
+        appt.time,
+        department_id=appt.department_id,
+        hospital_id=appt.hospital_id,
+        now=now,
+    )
+
+
+def accept_offer(appt: Appointment, now: Optional[datetime] = None) -> Waitlist:
+    """
+    Waitlisted patient accepts the offered slot -> normal Pending appointment.
+    Raises OfferUnavailable if the offer is no longer open.
+    """
+    now = now or timezone.now()
+    entry = Waitlist.objects.filter(appointment=appt, status="Offered").first()
+    if entry is None or appt.status != "Offered":
+        raise OfferUnavailable("This offer is no longer available.")
+    if entry.offer_expires_at and entry.offer_expires_at <= now:
+        # pass this slot on right away (and tell the next waiter)
+        entry.appointment = appt
+        notify_waitlist_offers([_expire(entry, now)])
+        raise OfferUnavailable("This offer has expired.")
+
+    with transaction.atomic():
+        # conditional update: a concurrent expire / leave may have closed
+        # the offer since it was read
+        booked = Waitlist.objects.filter(
+            id=entry.id, status="Offered", offer_expires_at__gt=now,
+        ).update(status="Booked")
+        held = (
+            Appointment.objects.select_for_update()
+            .filter(id=appt.id, status="Offered")
+            .first()
+        )
+        if not booked or held is None:
+            raise OfferUnavailable("This offer is no longer available.")
+        # a normal save, so the signals move the daily counts and log it
+        held.status = "Pending"
+        held.save(update_fields=["status"])
+
+    appt.status = held.status
+    entry.status = "Booked"
+    return entry
+
+
+def expire_offers(now: Optional[datetime] = None) -> List[Waitlist]:
+    """
+    Release every offer past its expiry and pass each slot on.
+    Returns the new offers that were made (so callers can notify patients).
+    """
+    now = now or timezone.now()
+    expired = (
+        Waitlist.objects
+        .filter(status="Offered", offer_expires_at__lte=now)
+        .select_related("appointment", "appointment__doctor")
+    )
+
+    new_offers = []
+    for entry in expired:
+        offered = _expire(entry, now)
+        if offered:
+            new_offers.append(offered)
+    return new_offers
+
+
+def _expire(entry: Waitlist, now: datetime) -> Optional[Waitlist]:
+    """
+    Expire one offer and release its held appointment together, then pass
+    the slot on. Returns the new offer, if any.
+    """
+    appt = entry.appointment
+    with transaction.atomic():
+        # conditional update again: a concurrent accept/expire may have won
+        if not Waitlist.objects.filter(id=entry.id, status="Offered").update(status="Expired"):
+            return None
+        if appt is None or appt.status != "Offered":
+            return None
+        appt.status = "Cancelled"
+        appt.save(update_fields=["status"])
+
+    return offer_slot(
+        appt.doctor,
+        appt.date,
+        appt.time,
+        department_id=appt.department_id,
+        hospital_id=appt.hospital_id,
+        now=now,
+    )
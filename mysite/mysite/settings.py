@@ -77,6 +77,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # a file, not shared-cache memory, so threaded tests can write concurrently
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# Shared by every process (web workers, management commands): the
+# directory version, the availability bitmaps and other cached data must
+# be the same everywhere. The table is created by a booking migration.
+# A Redis / Memcached backend can replace it without code changes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'booking_cache',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
     }
 }
 